@@ -22,15 +22,17 @@
 # SOFTWARE.
 
 import asyncio
+import bisect
 import threading
 import itertools
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List, Iterator, Iterable
 
 from .crypto import sha256
 from . import bitcoin, util
 from .bitcoin import COINBASE_MATURITY
-from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup
+from .util import (profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup,
+                   UserFacingException)
 from .transaction import Transaction, TxOutput, TxInput, PartialTxInput, TxOutpoint, PartialTransaction
 from .synchronizer import Synchronizer
 from .verifier import SPV
@@ -62,6 +64,121 @@ class HistoryItem(NamedTuple):
     balance: int
 
 
+class AddrBalance(NamedTuple):
+    """The unspent coins of an address, aggregated for get_balance."""
+    confirmed: int  # sum of the mined, non-coinbase coins
+    coinbase: Sequence[Tuple[int, int]]  # (height, value); maturity depends on the local height
+    unconfirmed: Sequence[Tuple[int, Sequence[Tuple[str, int]]]]  # (value, confirmed is_mine inputs of its tx as (addr, value))
+
+
+class HistoryIndex:
+    """The wallet history, sorted, with its running balance.
+
+    Entries are (sort_key, txid, delta, timestamp), sorted by (sort_key, txid).
+    The running balance and the running max of the timestamps are kept at
+    checkpoints, every CHECKPOINT_INTERVAL entries, so that they can be
+    computed at any position without going through the whole history.
+    Checkpoints after a modified position are dropped, and recomputed when
+    needed.
+    """
+
+    CHECKPOINT_INTERVAL = 1000
+
+    def __init__(self):
+        self._keys = []  # type: List[Tuple[Tuple[int, int], str]]  # (sort_key, txid)
+        self._deltas = []  # type: List[int]
+        self._timestamps = []  # type: List[int]
+        self._key_of_txid = {}  # type: Dict[str, Tuple[Tuple[int, int], str]]
+        # (balance, max timestamp) before entry i * CHECKPOINT_INTERVAL
+        self._checkpoints = [(0, 0)]  # type: List[Tuple[int, int]]
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, Tuple[int, int], int, int]]) -> 'HistoryIndex':
+        """Builds the index from (txid, sort_key, delta, timestamp) entries,
+        with a single sort."""
+        index = cls()
+        entries = sorted((sort_key, txid, delta, timestamp) for txid, sort_key, delta, timestamp in entries)
+        index._keys = [(sort_key, txid) for sort_key, txid, _, _ in entries]
+        index._deltas = [delta for _, _, delta, _ in entries]
+        index._timestamps = [timestamp for _, _, _, timestamp in entries]
+        index._key_of_txid = {key[1]: key for key in index._keys}
+        n = cls.CHECKPOINT_INTERVAL
+        balance, max_timestamp = 0, 0
+        for i, (delta, timestamp) in enumerate(zip(index._deltas, index._timestamps)):
+            if i and i % n == 0:
+                index._checkpoints.append((balance, max_timestamp))
+            balance += delta
+            max_timestamp = max(max_timestamp, timestamp)
+        return index
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._key_of_txid
+
+    def add(self, txid: str, sort_key: Tuple[int, int], delta: int, timestamp: int) -> None:
+        self.remove(txid)
+        key = (sort_key, txid)
+        pos = bisect.bisect_left(self._keys, key)
+        self._keys.insert(pos, key)
+        self._deltas.insert(pos, delta)
+        self._timestamps.insert(pos, timestamp)
+        self._key_of_txid[txid] = key
+        self._drop_checkpoints(pos)
+
+    def remove(self, txid: str) -> None:
+        key = self._key_of_txid.pop(txid, None)
+        if key is None:
+            return
+        pos = bisect.bisect_left(self._keys, key)
+        del self._keys[pos]
+        del self._deltas[pos]
+        del self._timestamps[pos]
+        self._drop_checkpoints(pos)
+
+    def _drop_checkpoints(self, pos: int) -> None:
+        del self._checkpoints[pos // self.CHECKPOINT_INTERVAL + 1:]
+
+    def position_after(self, txid: Optional[str]) -> int:
+        """Returns the position of the entry following txid."""
+        if txid is None:
+            return 0
+        return bisect.bisect_right(self._keys, self.get_key(txid))
+
+    def position_after_key(self, key: Tuple[Tuple[int, int], str]) -> int:
+        """Returns the position following key, even if its entry was removed."""
+        return bisect.bisect_right(self._keys, key)
+
+    def position_of_height(self, sort_height: int) -> int:
+        """Returns the position of the first entry at sort_height or above."""
+        return bisect.bisect_left(self._keys, ((sort_height,),))
+
+    def get_key(self, txid: str) -> Tuple[Tuple[int, int], str]:
+        key = self._key_of_txid.get(txid)
+        if key is None:
+            # e.g. the cursor given by the user
+            raise UserFacingException(f"unknown txid: {txid}")
+        return key
+
+    def get_running_values(self, pos: int) -> Tuple[int, int]:
+        """Returns the balance and the max timestamp before position pos."""
+        n = self.CHECKPOINT_INTERVAL
+        while len(self._checkpoints) <= pos // n:
+            i = len(self._checkpoints) - 1
+            balance, timestamp = self._checkpoints[i]
+            self._checkpoints.append((
+                balance + sum(self._deltas[i * n:(i + 1) * n]),
+                max(timestamp, max(self._timestamps[i * n:(i + 1) * n], default=0))))
+        i = pos // n
+        balance, timestamp = self._checkpoints[i]
+        return balance + sum(self._deltas[i * n:pos]), max(timestamp, max(self._timestamps[i * n:pos], default=0))
+
+    def get_entries(self, start: int, stop: int) -> Sequence[Tuple[str, int]]:
+        """Returns (txid, delta) for the entries in [start, stop)."""
+        return [(txid, delta) for (_, txid), delta in zip(self._keys[start:stop], self._deltas[start:stop])]
+
+
 class AddressSynchronizer(Logger, EventListener):
     """ address database """
 
@@ -90,7 +207,11 @@ class AddressSynchronizer(Logger, EventListener):
         # thread local storage for caching stuff
         self.threadlocal_cache = threading.local()
 
-        self._get_balance_cache = {}
+        self._get_balance_cache = {}  # for queries with excluded_coins
+        self._addr_balances = {}  # type: Dict[str, AddrBalance]  # access with self.lock
+        # history of all our addresses, built when first needed
+        self._history_index = None  # type: Optional[HistoryIndex]
+        self._history_index_dirty = set()  # type: Set[str]  # txids to update in the index
 
         self.load_and_cleanup()
 
@@ -105,6 +226,7 @@ class AddressSynchronizer(Logger, EventListener):
 
     def load_and_cleanup(self):
         self.load_local_history()
+        self.load_utxo_index()
         self.check_history()
         self.load_unverified_transactions()
         self.remove_local_transactions_we_dont_have()
@@ -199,7 +321,19 @@ class AddressSynchronizer(Logger, EventListener):
     @event_listener
     def on_event_blockchain_updated(self, *args):
         self._get_balance_cache = {}  # invalidate cache
+        with self.lock:
+            # future txs may have become local
+            self._history_index_dirty.update(self.future_tx)
         self.db.put('stored_height', self.get_local_height())
+        if self.verifier:
+            self.verifier.wakeup()
+
+    def _wakeup_network_jobs(self) -> None:
+        # the SPV state of the wallet changed
+        if self.synchronizer:
+            self.synchronizer.wakeup()
+        if self.verifier:
+            self.verifier.wakeup()
 
     async def stop(self):
         if self.network:
@@ -215,12 +349,51 @@ class AddressSynchronizer(Logger, EventListener):
                 self.unregister_callbacks()
 
     def add_address(self, address):
-        if address not in self.db.history:
-            self.db.history[address] = []
+        if not self.db.is_addr_in_history(address):
+            self.db.set_addr_history(address, [])
         if self.synchronizer:
             self.synchronizer.add(address)
         self.up_to_date_changed()
 
+    def remove_address(self, address):
+        """Stops watching an address that has no history."""
+        if self.db.get_addr_history(address):
+            raise Exception(f"cannot remove address with history: {address}")
+        txids = list(self.get_address_history(address))
+        self.db.remove_addr_history(address)
+        self.invalidate_history_entries(txids)
+        if self.synchronizer:
+            self.synchronizer.remove(address)
+        self.up_to_date_changed()
+
+    def invalidate_history_entries(self, txids: Iterable[str]) -> None:
+        """To be called when an address is removed: the deltas of its txs
+        in the history index (and in the db) no longer hold.
+        """
+        with self.lock:
+            for txid in txids:
+                self._history_index_dirty.add(txid)
+                self.db.remove_history_delta(txid)
+
+    def _invalidate_tx_caches(self, tx_hash: str) -> None:
+        """To be called when tx_hash is added, removed, or its mined status changes.
+        Drops the balance aggregates of the addresses that tx_hash touches.
+        The unconfirmed coins created by its children depend on whether
+        tx_hash is mined, so the addresses of those are dropped too.
+        tx_hash and its children are also marked for update in the history index.
+        """
+        with self.lock:
+            addrs = set(self.db.get_txi_addresses(tx_hash)) | set(self.db.get_txo_addresses(tx_hash))
+            self._history_index_dirty.add(tx_hash)
+            self.db.remove_history_delta(tx_hash)
+            for n in self.db.get_spent_outpoints(tx_hash):
+                child_hash = self.db.get_spent_outpoint(tx_hash, n)
+                addrs.update(self.db.get_txo_addresses(child_hash))
+                self._history_index_dirty.add(child_hash)
+                self.db.remove_history_delta(child_hash)
+            for addr in addrs:
+                self._addr_balances.pop(addr, None)
+
     def get_conflicting_transactions(self, tx: Transaction, *, include_self: bool = False) -> Set[str]:
         """Returns a set of transaction hashes from the wallet history that are
         directly conflicting with tx, i.e. they have common outpoints being
@@ -328,6 +501,7 @@ class AddressSynchronizer(Logger, EventListener):
                         pass
                     else:
                         self.db.add_txi_addr(tx_hash, addr, ser, v)
+                        self._remove_utxo(ser)
                         self._get_balance_cache.clear()  # invalidate cache
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
@@ -352,8 +526,11 @@ class AddressSynchronizer(Logger, EventListener):
                     if next_tx is not None:
                         self.db.add_txi_addr(next_tx, addr, ser, v)
                         self._add_tx_to_local_history(next_tx)
+                    else:
+                        self._add_utxo(ser, addr, v, is_coinbase)
             # add to local history
             self._add_tx_to_local_history(tx_hash)
+            self._invalidate_tx_caches(tx_hash)
             # save
             self.db.add_transaction(tx_hash, tx)
             self.db.add_num_inputs_to_tx(tx_hash, len(tx.inputs()))
@@ -394,11 +571,20 @@ class AddressSynchronizer(Logger, EventListener):
 
         with self.lock, self.transaction_lock:
             self.logger.info(f"removing tx from history {tx_hash}")
+            self._invalidate_tx_caches(tx_hash)
             tx = self.db.remove_transaction(tx_hash)
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
             for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
                 self._get_balance_cache.clear()  # invalidate cache
+            # the coins spent by tx are unspent again (unless their tx is being removed too)
+            for addr in self.db.get_txi_addresses(tx_hash):
+                for ser, v in self.db.get_txi_addr(tx_hash, addr):
+                    prevout_hash, prevout_n = ser.split(':')
+                    txo = self.db.get_txo_addr(prevout_hash, addr).get(int(prevout_n))
+                    if txo is not None:
+                        self._add_utxo(ser, addr, *txo)
+            self._remove_utxos_of_tx(tx_hash)
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
@@ -437,6 +623,7 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx.pop(tx_hash, None)
                     self.unconfirmed_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._invalidate_tx_caches(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
@@ -465,6 +652,86 @@ class AddressSynchronizer(Logger, EventListener):
         for txid in itertools.chain(self.db.list_txi(), self.db.list_txo()):
             self._add_tx_to_local_history(txid)
 
+    def _clear_utxo_index(self):
+        # The UTXO index: our unspent txos, i.e. the txos in db.txo that are
+        # not spent by any txi in db.txi. It is what get_addr_io would compute,
+        # but without going through the whole history of the addresses.
+        # Note that the heights are not indexed: the mined status of a tx changes
+        # in many ways (mempool, SPV, reorgs, future txs...), it is looked up
+        # with get_tx_height when the coins are requested.
+        self._utxos = {}  # type: Dict[str, Tuple[str, int, bool]]  # prevout_str -> (addr, value, is_cb)
+        self._utxos_by_address = defaultdict(dict)  # type: Dict[str, Dict[str, None]]  # addr -> prevout_strs
+        self._utxos_by_txid = defaultdict(dict)  # type: Dict[str, Dict[str, None]]  # txid -> prevout_strs
+
+    @profiler
+    def load_utxo_index(self):
+        with self.transaction_lock:
+            self._clear_utxo_index()
+            for txid in self.db.list_txo():
+                for addr in self.db.get_txo_addresses(txid):
+                    for n, (v, is_cb) in self.db.get_txo_addr(txid, addr).items():
+                        self._add_utxo(f'{txid}:{n}', addr, v, is_cb)
+            for txid in self.db.list_txi():
+                for addr in self.db.get_txi_addresses(txid):
+                    for ser, v in self.db.get_txi_addr(txid, addr):
+                        self._remove_utxo(ser)
+
+    def _add_utxo(self, ser: str, addr: str, value: int, is_coinbase: bool) -> None:
+        self._utxos[ser] = (addr, value, is_coinbase)
+        self._utxos_by_address[addr][ser] = None
+        self._utxos_by_txid[ser.split(':')[0]][ser] = None
+
+    def _remove_utxo(self, ser: str) -> None:
+        utxo = self._utxos.pop(ser, None)
+        if utxo is None:
+            return
+        addr = utxo[0]
+        txid = ser.split(':')[0]
+        self._utxos_by_address[addr].pop(ser, None)
+        if not self._utxos_by_address[addr]:
+            del self._utxos_by_address[addr]
+        self._utxos_by_txid[txid].pop(ser, None)
+        if not self._utxos_by_txid[txid]:
+            del self._utxos_by_txid[txid]
+
+    def _remove_utxos_of_tx(self, txid: str) -> None:
+        for ser in list(self._utxos_by_txid.get(txid, ())):
+            self._remove_utxo(ser)
+
+    def _get_indexed_utxos(self, domain) -> Dict[TxOutpoint, PartialTxInput]:
+        out = {}
+        tx_mined_infos = {}  # type: Dict[str, TxMinedInfo]
+        with self.lock, self.transaction_lock:
+            for addr in domain:
+                for ser in self._utxos_by_address.get(addr, ()):
+                    _, value, is_cb = self._utxos[ser]
+                    prevout = TxOutpoint.from_str(ser)
+                    txid = prevout.txid.hex()
+                    tx_mined_info = tx_mined_infos.get(txid)
+                    if tx_mined_info is None:
+                        tx_mined_info = tx_mined_infos[txid] = self.get_tx_height(txid)
+                    utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
+                    utxo._trusted_address = addr
+                    utxo._trusted_value_sats = value
+                    utxo.block_height = tx_mined_info.height
+                    utxo.block_txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+                    utxo.spent_txid = None
+                    utxo.spent_height = None
+                    out[prevout] = utxo
+        return out
+
+    def _check_utxo_index(self, domain) -> None:
+        """Compares the UTXO index with the coins computed from the history."""
+        with self.lock, self.transaction_lock:
+            for addr in domain:
+                expected = {prevout.to_str(): (addr, txo.value_sats(), txo.is_coinbase_output())
+                            for prevout, txo in self.get_addr_outputs(addr).items()
+                            if txo.spent_height is None}
+                indexed = {ser: self._utxos[ser] for ser in self._utxos_by_address.get(addr, ())}
+                if indexed != expected:
+                    self.logger.error(f'UTXO index out of sync for {addr}: {indexed=}, {expected=}')
+                    raise Exception("UTXO index sanity-check failed")
+
     @profiler
     def check_history(self):
         hist_addrs_mine = list(filter(lambda k: self.is_mine(k), self.db.get_history()))
@@ -491,7 +758,11 @@ class AddressSynchronizer(Logger, EventListener):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
+                self._clear_utxo_index()
                 self._get_balance_cache.clear()  # invalidate cache
+                self._addr_balances.clear()
+                self._history_index = None
+                self._history_index_dirty.clear()
 
     def _get_tx_sort_key(self, tx_hash: str) -> Tuple[int, int]:
         """Returns a key to be used for sorting txs."""
@@ -529,11 +800,166 @@ class AddressSynchronizer(Logger, EventListener):
                 self.threadlocal_cache.local_height = orig_val
         return f
 
+    def _get_history_entry(
+            self,
+            txid: str,
+            delta: Optional[int] = None,
+    ) -> Optional[Tuple[Tuple[int, int], int, int]]:
+        """Returns (sort_key, delta, timestamp) of txid on all our addresses,
+        or None if it does not touch them.
+        If delta is given, it is not recomputed."""
+        if delta is None:
+            # txi/txo keep the addresses that were removed from the wallet
+            addrs = {addr for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid))
+                     if self.is_mine(addr)}
+            if not addrs:
+                return None
+            delta = sum(self.get_tx_delta(txid, addr) for addr in addrs)
+        timestamp = self.get_tx_height(txid).timestamp or TX_TIMESTAMP_INF
+        return self._get_tx_sort_key(txid), delta, timestamp
+
+    @profiler
+    def _build_history_index(self, *, use_saved_deltas: bool = True) -> HistoryIndex:
+        # The deltas are saved in the db, as they are the expensive part:
+        # they are dropped from it when a tx is invalidated. The sort keys
+        # and timestamps depend on the mined status of the txs, they are
+        # looked up again.
+        saved_deltas = self.db.get_history_deltas() if use_saved_deltas else {}
+        num_reused = 0
+        entries = []
+        for txid in set(self.db.list_txi()) | set(self.db.list_txo()):
+            delta = saved_deltas.pop(txid, None)
+            entry = self._get_history_entry(txid, delta)
+            if entry is None:
+                continue
+            if delta is None:
+                self.db.set_history_delta(txid, entry[1])
+            else:
+                num_reused += 1
+            entries.append((txid, *entry))
+        for txid in saved_deltas:
+            self.db.remove_history_delta(txid)
+        if num_reused:
+            # the saved deltas might have been written by another version of the wallet
+            balance = sum(entry[2] for entry in entries)
+            c, u, x = self.get_balance(self.db.get_history())
+            if balance != c + u + x:
+                self.logger.warning('saved history deltas do not match the balance. recomputing them')
+                return self._build_history_index(use_saved_deltas=False)
+        return HistoryIndex.from_entries(entries)
+
+    @with_lock
+    @with_transaction_lock
+    @with_local_height_cached
+    def _get_history_index(self) -> HistoryIndex:
+        if self._history_index is None:
+            self._history_index_dirty.clear()
+            self._history_index = self._build_history_index()
+        for txid in self._history_index_dirty:
+            entry = self._get_history_entry(txid)
+            if entry is not None:
+                self._history_index.add(txid, *entry)
+                self.db.set_history_delta(txid, entry[1])
+            else:
+                self._history_index.remove(txid)
+                self.db.remove_history_delta(txid)
+        self._history_index_dirty.clear()
+        return self._history_index
+
+    def _make_history_items(self, entries: Sequence[Tuple[str, int]], balance: int) -> Sequence[HistoryItem]:
+        items = []
+        for txid, delta in entries:
+            balance += delta
+            items.append(HistoryItem(
+                txid=txid,
+                tx_mined_status=self.get_tx_height(txid),
+                delta=delta,
+                fee=self.get_tx_fee(txid),
+                balance=balance))
+        return items
+
+    @with_lock
+    @with_transaction_lock
+    @with_local_height_cached
+    def get_history_page(self, *, after: Optional[str] = None, limit: int) -> Tuple[Sequence[HistoryItem], int]:
+        """Returns up to limit items of the history of all our addresses,
+        following the item with txid 'after' (or from the start), and the max
+        timestamp of the items before them.
+        The txid of the last item can be used as the cursor for the next page.
+        """
+        history_index = self._get_history_index()
+        start = history_index.position_after(after)
+        entries = history_index.get_entries(start, start + limit)
+        balance, max_timestamp = history_index.get_running_values(start)
+        return self._make_history_items(entries, balance), max_timestamp
+
+    @with_lock
+    @with_transaction_lock
+    @with_local_height_cached
+    def _get_history_page_after_key(
+            self,
+            cursor: Optional[Tuple[Tuple[int, int], str]],
+            limit: int,
+            from_height: Optional[int],
+            to_height: Optional[int],
+    ) -> Tuple[Sequence[HistoryItem], int, Optional[Tuple[Tuple[int, int], str]]]:
+        history_index = self._get_history_index()
+        start = history_index.position_after_key(cursor) if cursor is not None else 0
+        stop = len(history_index)
+        if from_height is not None:
+            start = max(start, history_index.position_of_height(from_height))
+        if to_height is not None:
+            stop = history_index.position_of_height(to_height)
+        entries = history_index.get_entries(start, min(start + limit, stop))
+        if not entries:
+            return [], 0, cursor
+        balance, max_timestamp = history_index.get_running_values(start)
+        return self._make_history_items(entries, balance), max_timestamp, history_index.get_key(entries[-1][0])
+
+    def iter_history_pages(
+            self,
+            *,
+            after: Optional[str] = None,
+            limit: Optional[int] = None,
+            from_height: Optional[int] = None,
+            to_height: Optional[int] = None,
+            page_size: int = 1000,
+    ) -> Iterator[Tuple[Sequence[HistoryItem], int]]:
+        """Yields the history of all our addresses, following the item with
+        txid 'after', as pages like get_history_page.
+        If from_height is given, txs mined below it are skipped. If to_height
+        is given, only txs mined below it are yielded. At most limit items
+        are yielded.
+        The locks are only held while a page is read, not while the caller
+        consumes it: a concurrent change of the history may be missed, but
+        iteration goes on after the last yielded item.
+        """
+        with self.lock, self.transaction_lock:
+            cursor = self._get_history_index().get_key(after) if after is not None else None
+        while limit is None or limit > 0:
+            n = page_size if limit is None else min(page_size, limit)
+            items, max_timestamp, cursor = self._get_history_page_after_key(cursor, n, from_height, to_height)
+            if not items:
+                return
+            yield items, max_timestamp
+            if limit is not None:
+                limit -= len(items)
+
     @with_lock
     @with_transaction_lock
     @with_local_height_cached
     def get_history(self, domain) -> Sequence[HistoryItem]:
         domain = set(domain)
+        if domain == set(self.db.get_history()):
+            # all our addresses: use the history index
+            history_index = self._get_history_index()
+            h2 = self._make_history_items(history_index.get_entries(0, len(history_index)), 0)
+            balance = h2[-1].balance if h2 else 0
+            c, u, x = self.get_balance(domain)
+            if balance != c + u + x:
+                self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
+                raise Exception("wallet.get_history() failed balance sanity-check")
+            return h2
         # 1. Get the history of each address in the domain, maintain the
         #    delta of a tx as the sum of its deltas on domain addresses
         tx_deltas = defaultdict(int)  # type: Dict[str, int]
@@ -613,26 +1039,35 @@ class AddressSynchronizer(Logger, EventListener):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
                     self.unconfirmed_tx[tx_hash] = tx_height
+                    self._invalidate_tx_caches(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
+                old_height = self.get_tx_height(tx_hash).height
                 if tx_height > 0:
                     self.unverified_tx[tx_hash] = tx_height
                 else:
                     self.unconfirmed_tx[tx_hash] = tx_height
+                if self.get_tx_height(tx_hash).height != old_height:
+                    self._invalidate_tx_caches(tx_hash)
+        self._wakeup_network_jobs()
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._invalidate_tx_caches(tx_hash)
+        self._wakeup_network_jobs()
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+            self._invalidate_tx_caches(tx_hash)
+        self._wakeup_network_jobs()
         util.trigger_callback('adb_added_verified_tx', self, tx_hash)
 
     def get_unverified_txs(self) -> Dict[str, int]:
@@ -661,6 +1096,7 @@ class AddressSynchronizer(Logger, EventListener):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self._invalidate_tx_caches(tx_hash)
                         txs.add(tx_hash)
 
         for tx_hash in txs:
@@ -683,6 +1119,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             old_height = self.future_tx.get(txid) or None
             self.future_tx[txid] = wanted_height
+            self._invalidate_tx_caches(txid)
         if old_height != wanted_height:
             util.trigger_callback('adb_set_future_tx', self, txid)
 
@@ -842,11 +1279,9 @@ class AddressSynchronizer(Logger, EventListener):
         return out
 
     def get_addr_utxo(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
-        out = self.get_addr_outputs(address)
-        for k, v in list(out.items()):
-            if v.spent_height is not None:
-                out.pop(k)
-        return out
+        if self.config.WALLET_DEBUG_UTXO_INDEX:
+            self._check_utxo_index([address])
+        return self._get_indexed_utxos([address])
 
     # return the total amount ever received by an address
     def get_addr_received(self, address):
@@ -870,21 +1305,93 @@ class AddressSynchronizer(Logger, EventListener):
             excluded_coins = set()
         assert isinstance(excluded_coins, set), f"excluded_coins should be set, not {type(excluded_coins)}"
 
+        if not excluded_coins:
+            result = self._get_balance_from_aggregates(domain)
+            if self.config.WALLET_DEBUG_UTXO_INDEX:
+                expected = self._get_balance_from_coins(domain, set())
+                if result != expected:
+                    self.logger.error(f'balance aggregates out of sync: {result=}, {expected=}')
+                    raise Exception("balance aggregates sanity-check failed")
+            return result
+
         cache_key = sha256(','.join(sorted(domain)) + ';'
                            + ','.join(sorted(excluded_coins)))
         cached_value = self._get_balance_cache.get(cache_key)
         if cached_value:
             return cached_value
+        result = self._get_balance_from_coins(domain, excluded_coins)
+        # cache result.
+        # Cache needs to be invalidated if a transaction is added to/
+        # removed from history; or on new blocks (maturity...)
+        self._get_balance_cache[cache_key] = result
+        return result
 
-        coins = {}
+    def _get_balance_from_aggregates(self, domain: Set[str]) -> Tuple[int, int, int]:
+        c = u = x = 0
+        mempool_height = self.get_local_height() + 1  # height of next block
         for address in domain:
-            coins.update(self.get_addr_outputs(address))
+            addr_balance = self._get_addr_balance(address)
+            c += addr_balance.confirmed
+            for tx_height, v in addr_balance.coinbase:
+                if tx_height + COINBASE_MATURITY > mempool_height:
+                    x += v
+                elif tx_height > 0:
+                    c += v
+                else:
+                    u += v
+            for v, confirmed_inputs in addr_balance.unconfirmed:
+                # see _get_balance_from_coins
+                confirmed_spent_amount = sum(value for addr, value in confirmed_inputs if addr in domain)
+                if confirmed_spent_amount >= v:
+                    c += v
+                else:
+                    c += confirmed_spent_amount
+                    u += v - confirmed_spent_amount
+        return c, u, x
+
+    def _get_addr_balance(self, address: str) -> AddrBalance:
+        with self.lock, self.transaction_lock:
+            addr_balance = self._addr_balances.get(address)
+            if addr_balance is not None:
+                return addr_balance
+            confirmed = 0
+            coinbase = []
+            unconfirmed = []
+            for utxo in self._get_indexed_utxos([address]).values():
+                v = utxo.value_sats()
+                if utxo.is_coinbase_output():
+                    coinbase.append((utxo.block_height, v))
+                elif utxo.block_height > 0:
+                    confirmed += v
+                else:
+                    unconfirmed.append((v, self._get_confirmed_inputs(utxo.prevout.txid.hex())))
+            addr_balance = self._addr_balances[address] = AddrBalance(
+                confirmed=confirmed, coinbase=coinbase, unconfirmed=unconfirmed)
+            return addr_balance
+
+    def _get_confirmed_inputs(self, txid: str) -> Sequence[Tuple[str, int]]:
+        """Returns the is_mine coins spent by txid that are mined, as (addr, value)."""
+        tx = self.db.get_transaction(txid)
+        assert tx is not None  # txid comes from get_addr_io
+        confirmed_inputs = []
+        for txin in tx.inputs():
+            if txin.is_coinbase_input():
+                continue
+            prevout_hash = txin.prevout.txid.hex()
+            for addr in self.db.get_txo_addresses(prevout_hash):
+                txo = self.db.get_txo_addr(prevout_hash, addr).get(txin.prevout.out_idx)
+                if txo is not None and self.get_tx_height(prevout_hash).height > 0:
+                    confirmed_inputs.append((addr, txo[0]))
+        return confirmed_inputs
+
+    def _get_balance_from_coins(self, domain: Set[str], excluded_coins: Set[str]) -> Tuple[int, int, int]:
+        if self.config.WALLET_DEBUG_UTXO_INDEX:
+            self._check_utxo_index(domain)
+        coins = self._get_indexed_utxos(domain)
 
         c = u = x = 0
         mempool_height = self.get_local_height() + 1  # height of next block
         for utxo in coins.values():  # type: PartialTxInput
-            if utxo.spent_height is not None:
-                continue
             if utxo.prevout.to_str() in excluded_coins:
                 continue
             v = utxo.value_sats()
@@ -896,16 +1403,10 @@ class AddressSynchronizer(Logger, EventListener):
                 c += v
             else:
                 txid = utxo.prevout.txid.hex()
-                tx = self.db.get_transaction(txid)
-                assert tx is not None # txid comes from get_addr_io
                 # we look at the outputs that are spent by this transaction
                 # if those outputs are ours and confirmed, we count this coin as confirmed
-                confirmed_spent_amount = 0
-                for txin in tx.inputs():
-                    if txin.prevout in coins:
-                        coin = coins[txin.prevout]
-                        if coin.block_height > 0:
-                            confirmed_spent_amount += coin.value_sats()
+                confirmed_spent_amount = sum(value for addr, value in self._get_confirmed_inputs(txid)
+                                             if addr in domain)
                 # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
                 # (fixme: tx may have multiple change outputs)
                 if confirmed_spent_amount >= v:
@@ -913,12 +1414,7 @@ class AddressSynchronizer(Logger, EventListener):
                 else:
                     c += confirmed_spent_amount
                     u += v - confirmed_spent_amount
-        result = c, u, x
-        # cache result.
-        # Cache needs to be invalidated if a transaction is added to/
-        # removed from history; or on new blocks (maturity...)
-        self._get_balance_cache[cache_key] = result
-        return result
+        return c, u, x
 
     @with_local_height_cached
     def get_utxos(
@@ -944,23 +1440,27 @@ class AddressSynchronizer(Logger, EventListener):
         if excluded_addresses:
             domain = set(domain) - set(excluded_addresses)
         mempool_height = block_height + 1  # height of next block
-        for addr in domain:
-            txos = self.get_addr_outputs(addr)
-            for txo in txos.values():
-                if txo.spent_height is not None:
-                    if not confirmed_spending_only:
-                        continue
-                    if confirmed_spending_only and 0 < txo.spent_height <= block_height:
-                        continue
-                if confirmed_funding_only and not (0 < txo.block_height <= block_height):
-                    continue
-                if nonlocal_only and txo.block_height in (TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE):
+        if confirmed_spending_only:
+            # coins spent in the mempool (or after block_height) are not in the UTXO index
+            txos = itertools.chain.from_iterable(self.get_addr_outputs(addr).values() for addr in domain)
+        else:
+            if self.config.WALLET_DEBUG_UTXO_INDEX:
+                self._check_utxo_index(domain)
+            txos = self._get_indexed_utxos(domain).values()
+        for txo in txos:
+            if txo.spent_height is not None:
+                if not confirmed_spending_only:
                     continue
-                if (mature_only and txo.is_coinbase_output()
-                        and txo.block_height + COINBASE_MATURITY > mempool_height):
+                if confirmed_spending_only and 0 < txo.spent_height <= block_height:
                     continue
-                coins.append(txo)
+            if confirmed_funding_only and not (0 < txo.block_height <= block_height):
+                continue
+            if nonlocal_only and txo.block_height in (TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE):
+                continue
+            if (mature_only and txo.is_coinbase_output()
+                    and txo.block_height + COINBASE_MATURITY > mempool_height):
                 continue
+            coins.append(txo)
         return coins
 
     def is_used(self, address: str) -> bool:
@@ -21,15 +21,19 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import os
+import mmap
+import struct
+import hashlib
+import operator
 import threading
 import time
 from typing import Optional, Dict, Mapping, Sequence, TYPE_CHECKING
 
 from . import util
 from .bitcoin import hash_encode
-from .crypto import sha256d
+from .crypto import sha256d, sha256
 from . import constants
-from .util import bfh, with_lock
+from .util import bfh, with_lock, LRUCache
 from .logging import get_logger, Logger
 
 if TYPE_CHECKING:
@@ -38,6 +42,7 @@ if TYPE_CHECKING:
 _logger = get_logger(__name__)
 
 HEADER_SIZE = 80  # bytes
+HEADER_CACHE_SIZE = 2 * 2016  # number of deserialized headers (and hashes) cached per chain
 
 # see https://github.com/bitcoin/bitcoin/blob/feedb9c84e72e4fff489810a2bbeec09bcda5763/src/chainparams.cpp#L76
 MAX_TARGET = 0x00000000ffffffffffffffffffffffffffffffffffffffffffffffffffffffff  # compact: 0x1d00ffff
@@ -89,6 +94,8 @@ def hash_raw_header(header: bytes) -> str:
 
 pow_hash_header = hash_header
 
+_reversed_bytes = operator.itemgetter(slice(None, None, -1))
+
 
 # key: blockhash hex at forkpoint
 # the chain at some key is the best chain that includes the given hash
@@ -97,6 +104,7 @@ blockchains_lock = threading.RLock()  # lock order: take this last; so after Blo
 
 
 def read_blockchains(config: 'SimpleConfig'):
+    load_chainwork_cache(config)
     best_chain = Blockchain(config=config,
                             forkpoint=0,
                             parent=None,
@@ -108,6 +116,7 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain.close_headers_file()
             os.unlink(best_chain.path())
             best_chain.update_size()
     # forks
@@ -117,8 +126,10 @@ def read_blockchains(config: 'SimpleConfig'):
     l = filter(lambda x: x.startswith('fork2_') and '.' not in x, os.listdir(fdir))
     l = sorted(l, key=lambda x: int(x.split('_')[1]))  # sort by forkpoint
 
-    def delete_chain(filename, reason):
+    def delete_chain(filename, reason, chain: 'Blockchain' = None):
         _logger.info(f"[blockchain] deleting chain {filename}: {reason}")
+        if chain is not None:
+            chain.close_headers_file()
         os.unlink(os.path.join(fdir, filename))
 
     def instantiate_chain(filename):
@@ -145,10 +156,10 @@ def read_blockchains(config: 'SimpleConfig'):
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
-            delete_chain(filename, "incorrect first hash for chain")
+            delete_chain(filename, "incorrect first hash for chain", b)
             return
         if not b.parent.can_connect(h, check_height=False):
-            delete_chain(filename, "cannot connect chain to parent")
+            delete_chain(filename, "cannot connect chain to parent", b)
             return
         chain_id = b.get_id()
         assert first_hash == chain_id, (first_hash, chain_id)
@@ -166,6 +177,103 @@ _CHAINWORK_CACHE = {
     "0000000000000000000000000000000000000000000000000000000000000000": 0,  # virtual block at height -1
 }  # type: Dict[str, int]
 
+# The entries of _CHAINWORK_CACHE above the checkpoints are persisted in
+# a file in the headers dir, so that they survive restarts.
+# File format:
+#   magic (5 bytes) || record*
+#   record: block hash (32 bytes) || chain work (32 bytes, BE) || checksum (4 bytes)
+# Records are only appended, without fsync; an invalid record and all
+# records after it are dropped when loading.
+CHAINWORK_CACHE_MAGIC = b'ELCW\x01'
+_CHAINWORK_RECORD_SIZE = 32 + 32 + 4
+_chainwork_cache_file = None
+_chainwork_cache_lock = threading.Lock()
+
+
+def _work_of_target(target: int) -> int:
+    """work done by single header with given target"""
+    return ((2 ** 256 - target - 1) // (target + 1)) + 1
+
+
+def _serialize_chainwork_record(block_hash: str, chainwork: int) -> bytes:
+    record = bfh(block_hash) + chainwork.to_bytes(32, byteorder='big')
+    return record + sha256(record)[:4]
+
+
+def _get_checkpoints_chainwork() -> Dict[str, int]:
+    """Returns the chain work at each checkpoint, computed from the checkpoints."""
+    result = {}
+    running_total = 0
+    target = MAX_TARGET  # the first chunk uses the target of chunk -1
+    for block_hash, next_target in constants.net.CHECKPOINTS:
+        running_total += 2016 * _work_of_target(target)
+        result[block_hash] = running_total
+        target = next_target
+    return result
+
+
+def load_chainwork_cache(config: 'SimpleConfig') -> None:
+    """Loads the persisted chain work cache, and opens its file to
+    append new entries. Entries that contradict the checkpoints are
+    considered corrupt, and the file is discarded.
+    """
+    global _chainwork_cache_file
+    checkpoints_chainwork = _get_checkpoints_chainwork()
+    with _chainwork_cache_lock:
+        if _chainwork_cache_file is not None:
+            _chainwork_cache_file.close()
+            _chainwork_cache_file = None
+        _CHAINWORK_CACHE.clear()
+        _CHAINWORK_CACHE['00' * 32] = 0
+        _CHAINWORK_CACHE.update(checkpoints_chainwork)
+        if constants.net.TESTNET:
+            return
+        path = os.path.join(util.get_headers_dir(config), 'chainwork_cache')
+        entries = {}
+        valid_size = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data[:len(CHAINWORK_CACHE_MAGIC)] == CHAINWORK_CACHE_MAGIC:
+                valid_size = pos = len(CHAINWORK_CACHE_MAGIC)
+                while pos + _CHAINWORK_RECORD_SIZE <= len(data):
+                    record = data[pos:pos + _CHAINWORK_RECORD_SIZE]
+                    if sha256(record[:64])[:4] != record[64:]:
+                        _logger.info(f"chainwork cache: dropping invalid record at {pos}")
+                        break
+                    block_hash = record[:32].hex()
+                    chainwork = int.from_bytes(record[32:64], byteorder='big')
+                    if checkpoints_chainwork.get(block_hash, chainwork) != chainwork:
+                        _logger.info("chainwork cache: inconsistent with checkpoints. discarding it")
+                        entries, valid_size = {}, 0
+                        break
+                    entries[block_hash] = chainwork
+                    pos += _CHAINWORK_RECORD_SIZE
+                    valid_size = pos
+        _CHAINWORK_CACHE.update(entries)
+        try:
+            f = open(path, 'r+b' if valid_size else 'wb')
+            if valid_size:
+                f.truncate(valid_size)
+                f.seek(valid_size)
+            else:
+                f.write(CHAINWORK_CACHE_MAGIC)
+                f.flush()
+        except OSError as e:
+            _logger.info(f"chainwork cache: cannot open file: {e!r}")
+            return
+        _chainwork_cache_file = f
+
+
+def _add_to_chainwork_cache(block_hash: str, chainwork: int) -> None:
+    with _chainwork_cache_lock:
+        if block_hash in _CHAINWORK_CACHE:
+            return
+        _CHAINWORK_CACHE[block_hash] = chainwork
+        if _chainwork_cache_file is not None:
+            _chainwork_cache_file.write(_serialize_chainwork_record(block_hash, chainwork))
+            _chainwork_cache_file.flush()
+
 
 def init_headers_file_for_best_chain():
     b = get_best_chain()
@@ -200,6 +308,11 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        # read-only map of the headers file, and caches keyed by height.
+        # they only contain headers stored in our own file (>= forkpoint)
+        self._mmap = None  # type: Optional[mmap.mmap]
+        self._header_cache = LRUCache(maxsize=HEADER_CACHE_SIZE)  # type: LRUCache[int, dict]
+        self._hash_cache = LRUCache(maxsize=HEADER_CACHE_SIZE)  # type: LRUCache[int, str]
         self.update_size()
 
     @property
@@ -296,6 +409,38 @@ class Blockchain(Logger):
     def update_size(self) -> None:
         p = self.path()
         self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        self._remap_headers_file()
+
+    @with_lock
+    def _remap_headers_file(self) -> None:
+        self.close_headers_file()
+        if self._size == 0:
+            return
+        try:
+            with open(self.path(), 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, OverflowError) as e:
+            # e.g. not enough address space on 32-bit systems; read_header falls back to file reads
+            self.logger.info(f"cannot mmap headers file: {e!r}")
+
+    @with_lock
+    def close_headers_file(self) -> None:
+        """Unmaps the headers file. Must be called before the file is
+        truncated, replaced or deleted (required on Windows).
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @with_lock
+    def _invalidate_cache(self, from_height: int = None) -> None:
+        if from_height is None:
+            self._header_cache.clear()
+            self._hash_cache.clear()
+            return
+        for cache in (self._header_cache, self._hash_cache):
+            for height in [h for h in cache if h >= from_height]:
+                del cache[height]
 
     @classmethod
     def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
@@ -305,16 +450,74 @@ class Blockchain(Logger):
         if prev_hash != header.get('prev_block_hash'):
             raise InvalidHeader("prev hash mismatch: %s vs %s" % (prev_hash, header.get('prev_block_hash')))
         if constants.net.TESTNET:
-            return
-        bits = cls.target_to_bits(target)
-        if bits != header.get('bits'):
-            raise InvalidHeader("bits mismatch: %s vs %s" % (bits, header.get('bits')))
+            # the difficulty rules of testnet are not implemented (see get_target),
+            # but the header must still meet the target of its own bits
+            target = cls.bits_to_target(header.get('bits'))
+        else:
+            bits = cls.target_to_bits(target)
+            if bits != header.get('bits'):
+                raise InvalidHeader("bits mismatch: %s vs %s" % (bits, header.get('bits')))
         _pow_hash = pow_hash_header(header)
         pow_hash_as_num = int.from_bytes(bfh(_pow_hash), byteorder='big')
         if pow_hash_as_num > target:
             raise InvalidHeader(f"insufficient proof of work: {pow_hash_as_num} vs target {target}")
 
     def verify_chunk(self, index: int, data: bytes) -> None:
+        if self._verify_chunk_raw(index, data):
+            return
+        # find the first invalid header, and raise with a meaningful error
+        self._verify_chunk_by_header(index, data)
+        raise InvalidHeader(f"invalid chunk {index}")
+
+    def _verify_chunk_raw(self, index: int, data: bytes) -> bool:
+        """Returns whether all headers in the chunk are valid.
+        Works on the raw bytes, without deserializing headers: the headers
+        are hashed in one pass, then each check is done once for the whole
+        chunk. Same checks as _verify_chunk_by_header.
+        """
+        num = len(data) // HEADER_SIZE
+        if num == 0:
+            return True
+        start_height = index * 2016
+        buf = memoryview(data)[:num * HEADER_SIZE]
+        # hashing is the only per-header step
+        hashes = [hashlib.sha256(hashlib.sha256(buf[i:i + HEADER_SIZE]).digest()).digest()
+                  for i in range(0, len(buf), HEADER_SIZE)]
+        # prev_block_hash and bits of each header
+        prev_hashes, bits_list = zip(*struct.iter_unpack('<4x32s36xI4x', buf))
+        # linkage: the prev hashes are the hashes of the previous headers
+        prev_hash = bytes.fromhex(self.get_hash(start_height - 1))[::-1]
+        if b''.join(prev_hashes) != prev_hash + b''.join(hashes[:-1]):
+            return False
+        # proof of work. hashes are little-endian: reversed, they compare as numbers
+        if constants.net.TESTNET:
+            # each header must meet the target of its own bits (see verify_header)
+            try:
+                targets = {bits: self.bits_to_target(bits).to_bytes(32, byteorder='big')
+                           for bits in set(bits_list)}
+            except InvalidHeader:
+                return False
+            if any(map(operator.gt, map(_reversed_bytes, hashes), map(targets.__getitem__, bits_list))):
+                return False
+        else:
+            target = self.get_target(index-1)
+            if bits_list.count(self.target_to_bits(target)) != num:
+                return False
+            if max(map(_reversed_bytes, hashes)) > target.to_bytes(32, byteorder='big'):
+                return False
+        # compare with the hashes we already know: stored headers, and the checkpoint at the end of the chunk
+        known_heights = set(range(start_height, min(start_height + num, self.height() + 1)))
+        known_heights.add(start_height + num - 1)
+        for height in known_heights:
+            try:
+                expected_header_hash = self.get_hash(height)
+            except MissingHeader:
+                continue
+            if expected_header_hash != hash_encode(hashes[height - start_height]):
+                return False
+        return True
+
+    def _verify_chunk_by_header(self, index: int, data: bytes) -> None:
         num = len(data) // HEADER_SIZE
         start_height = index * 2016
         prev_hash = self.get_hash(start_height - 1)
@@ -363,6 +566,12 @@ class Blockchain(Logger):
         truncate = not chunk_within_checkpoint_region
         self.write(chunk, delta_bytes, truncate)
         self.swap_with_parent()
+        if not chunk_within_checkpoint_region:
+            # extend the chain work cache while the headers are at hand
+            try:
+                self.get_chainwork()
+            except MissingHeader:
+                pass
 
     def swap_with_parent(self) -> None:
         with self.lock, blockchains_lock:
@@ -411,6 +620,8 @@ class Blockchain(Logger):
             parent_data = f.read(parent_branch_size*HEADER_SIZE)
         self.write(parent_data, 0)
         parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
+        self.close_headers_file()
+        parent.close_headers_file()
         # swap parameters
         self.parent, parent.parent = parent.parent, self  # type: Optional[Blockchain], Optional[Blockchain]
         self.forkpoint, parent.forkpoint = parent.forkpoint, self.forkpoint
@@ -420,6 +631,9 @@ class Blockchain(Logger):
         os.replace(child_old_name, parent.path())
         self.update_size()
         parent.update_size()
+        # heights are cached relative to the file they are stored in
+        self._invalidate_cache()
+        parent._invalidate_cache()
         # update pointers
         blockchains.pop(child_old_id, None)
         blockchains.pop(parent_old_id, None)
@@ -442,6 +656,8 @@ class Blockchain(Logger):
     def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
         filename = self.path()
         self.assert_headers_file_available(filename)
+        self.close_headers_file()
+        self._invalidate_cache(from_height=self.forkpoint + offset // HEADER_SIZE)
         with open(filename, 'rb+') as f:
             if truncate and offset != self._size * HEADER_SIZE:
                 f.seek(offset)
@@ -462,6 +678,48 @@ class Blockchain(Logger):
         self.write(data, delta*HEADER_SIZE)
         self.swap_with_parent()
 
+    @with_lock
+    def connect_headers(self, headers: Sequence[dict]) -> int:
+        """Verifies consecutive headers extending the tip of this chain,
+        and appends them to the headers file with a single write and fsync.
+        Stops at the first header that does not connect. Only verified
+        headers are ever written.
+        Returns the number of headers saved.
+        """
+        data = bytearray()
+        prev_hash = None
+        num_saved = 0
+        for header in headers:
+            height = header.get('block_height')
+            if data and height % 2016 == 0:
+                # the target of the new period depends on the headers
+                # of the previous one, so those must be written first
+                self._append_raw_headers(bytes(data))
+                data = bytearray()
+            if not data:
+                if not self.can_connect(header):
+                    break
+            else:
+                if height != self.height() + len(data) // HEADER_SIZE + 1:
+                    break
+                try:
+                    target = self.get_target(height // 2016 - 1)
+                    self.verify_header(header, prev_hash, target)
+                except (InvalidHeader, MissingHeader):
+                    break
+            raw_header = serialize_header(header)
+            data += raw_header
+            prev_hash = hash_raw_header(raw_header)
+            num_saved += 1
+        if data:
+            self._append_raw_headers(bytes(data))
+        return num_saved
+
+    def _append_raw_headers(self, data: bytes) -> None:
+        assert len(data) % HEADER_SIZE == 0, len(data)
+        self.write(data, self.size() * HEADER_SIZE)
+        self.swap_with_parent()
+
     @with_lock
     def read_header(self, height: int) -> Optional[dict]:
         if height < 0:
@@ -470,7 +728,20 @@ class Blockchain(Logger):
             return self.parent.read_header(height)
         if height > self.height():
             return
+        header = self._header_cache.get(height)
+        if header is None:
+            h = self._read_raw_header(height)
+            if h == bytes([0])*HEADER_SIZE:
+                return None
+            header = deserialize_header(h, height)
+            self._header_cache[height] = header
+        # callers might modify the dict
+        return dict(header)
+
+    def _read_raw_header(self, height: int) -> bytes:
         delta = height - self.forkpoint
+        if self._mmap is not None and (delta + 1) * HEADER_SIZE <= len(self._mmap):
+            return self._mmap[delta * HEADER_SIZE:(delta + 1) * HEADER_SIZE]
         name = self.path()
         self.assert_headers_file_available(name)
         with open(name, 'rb') as f:
@@ -478,9 +749,7 @@ class Blockchain(Logger):
             h = f.read(HEADER_SIZE)
             if len(h) < HEADER_SIZE:
                 raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
-        if h == bytes([0])*HEADER_SIZE:
-            return None
-        return deserialize_header(h, height)
+        return h
 
     def header_at_tip(self) -> Optional[dict]:
         """Return latest header."""
@@ -515,11 +784,18 @@ class Blockchain(Logger):
             index = height // 2016
             h, t = self.checkpoints[index]
             return h
+        elif height < self.forkpoint and self.parent is not None:
+            return self.parent.get_hash(height)
         else:
-            header = self.read_header(height)
-            if header is None:
-                raise MissingHeader(height)
-            return hash_header(header)
+            with self.lock:
+                header_hash = self._hash_cache.get(height)
+                if header_hash is None:
+                    header = self.read_header(height)
+                    if header is None:
+                        raise MissingHeader(height)
+                    header_hash = hash_header(header)
+                    self._hash_cache[height] = header_hash
+                return header_hash
 
     def get_target(self, index: int) -> int:
         # compute target from chunk x, used in chunk x+1
@@ -588,8 +864,7 @@ class Blockchain(Logger):
         """work done by single header at given height"""
         chunk_idx = height // 2016 - 1
         target = self.get_target(chunk_idx)
-        work = ((2 ** 256 - target - 1) // (target + 1)) + 1
-        return work
+        return _work_of_target(target)
 
     @with_lock
     def get_chainwork(self, height=None) -> int:
@@ -612,7 +887,7 @@ class Blockchain(Logger):
             work_in_single_header = self.chainwork_of_header_at_height(cached_height)
             work_in_chunk = 2016 * work_in_single_header
             running_total += work_in_chunk
-            _CHAINWORK_CACHE[self.get_hash(cached_height)] = running_total
+            _add_to_chainwork_cache(self.get_hash(cached_height), running_total)
         cached_height += 2016
         work_in_single_header = self.chainwork_of_header_at_height(cached_height)
         work_in_last_partial_chunk = (height % 2016 + 1) * work_in_single_header
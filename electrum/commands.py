@@ -46,7 +46,7 @@ from . import util
 from . import keystore
 from .util import (bfh, format_satoshis, json_decode, json_normalize,
                    is_hash256_str, is_hex_str, to_bytes, parse_max_spend, to_decimal,
-                   UserFacingException, InvalidPassword)
+                   UserFacingException, InvalidPassword, WalletFileException, standardize_path)
 from . import bitcoin
 from .bitcoin import is_address,  hash_160, COIN
 from .bip32 import BIP32Node
@@ -72,6 +72,8 @@ from . import GuiImportError
 from . import crypto
 from . import constants
 from . import descriptor
+from . import wallet_db_sqlite
+from .storage import WalletStorage
 
 if TYPE_CHECKING:
     from .network import Network
@@ -232,9 +234,33 @@ class Commands:
             'version': ELECTRUM_VERSION,
             'default_wallet': self.config.get_wallet_path(),
             'fee_per_kb': self.config.fee_per_kb(),
+            'server_requests': self.network.get_request_concurrency_stats(),
         }
+        if self.daemon:
+            # number of times the network jobs of each wallet were woken up
+            response['wallet_wakeups'] = {
+                path: {
+                    'synchronizer': w.adb.synchronizer.num_wakeups(),
+                    'verifier': w.adb.verifier.num_wakeups(),
+                }
+                for path, w in self.daemon.get_wallets().items()
+                if w.adb.synchronizer and w.adb.verifier
+            }
         return response
 
+    @command('n')
+    async def getnetworkstats(self):
+        """Statistics of the requests sent to the servers, per method:
+        number of requests, errors and timeouts, latencies (in seconds),
+        and approximate size of the responses (in bytes).
+        Totals since startup, and for each connected server.
+        Also the number of txs and merkle proofs fetched from each
+        connected server, and the throughput (in items per second), and
+        the number of requests of the connected servers that were served
+        by an identical request in flight or by the cache (hits), and
+        sent (misses)."""
+        return self.network.get_network_stats()
+
     @command('n')
     async def stop(self):
         """Stop daemon"""
@@ -268,6 +294,38 @@ class Commands:
         """Close wallet"""
         return await self.daemon._stop_wallet(wallet_path)
 
+    def _get_closed_wallet_storage(self, wallet_path: Optional[str]) -> WalletStorage:
+        wallet_path = standardize_path(wallet_path or self.config.get_wallet_path())
+        if self.daemon and self.daemon.get_wallet(wallet_path):
+            raise UserFacingException('The wallet is loaded. Close it first.')
+        storage = WalletStorage(wallet_path)
+        if not storage.file_exists():
+            raise UserFacingException(f'Wallet not found: {wallet_path}')
+        return storage
+
+    @command('')
+    async def convert_wallet_to_sqlite(self, wallet_path=None):
+        """Move the transaction history of a wallet to an sqlite file next to it.
+        The wallet must not be loaded. Wallets with storage encryption cannot be converted.
+        """
+        storage = self._get_closed_wallet_storage(wallet_path)
+        try:
+            wallet_db_sqlite.convert_wallet_to_sqlite(storage)
+        except WalletFileException as e:
+            raise UserFacingException(str(e)) from e
+        return True
+
+    @command('')
+    async def convert_wallet_to_json(self, wallet_path=None):
+        """Move the transaction history of a wallet back from sqlite to the wallet file.
+        The wallet must not be loaded.
+        """
+        storage = self._get_closed_wallet_storage(wallet_path)
+        if not wallet_db_sqlite.SqliteWalletDB.exists_for(storage.path):
+            raise UserFacingException('The history of this wallet is not in sqlite.')
+        wallet_db_sqlite.convert_wallet_to_json(storage)
+        return True
+
     @command('')
     async def create(self, passphrase=None, password=None, encrypt_file=True, seed_type=None, wallet_path=None):
         """Create a new wallet.
@@ -316,7 +374,7 @@ class Commands:
             else:
                 encrypt_file = wallet.storage.is_encrypted()
         wallet.update_password(password, new_password, encrypt_storage=encrypt_file)
-        wallet.save_db()
+        wallet.flush_db()
         return {'password':wallet.has_password()}
 
     @command('w')
@@ -798,12 +856,18 @@ class Commands:
 
     @command('w')
     async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
+                              from_height=None, to_height=None, after=None, limit=None, stream=False):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        Use 'limit' to get one page of the history, and 'after' with the txid of the
+        last transaction of a page to get the next one.
+        With 'stream', the transactions are returned one at a time, as newline-delimited
+        JSON, and the summary is omitted."""
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
             'to_height': to_height,
+            'after': after,
+            'limit': limit,
         }
         if year:
             import time
@@ -815,6 +879,8 @@ class Commands:
             from .exchange_rate import FxThread
             kwargs['fx'] = self.daemon.fx if self.daemon else FxThread(config=self.config)
 
+        if stream:
+            return (json_normalize(item) for item in wallet.iter_detailed_history(**kwargs))
         return json_normalize(wallet.get_detailed_history(**kwargs))
 
     @command('wp')
@@ -848,9 +914,12 @@ class Commands:
         return new_tx.serialize()
 
     @command('wl')
-    async def lightning_history(self, show_fiat=False, wallet: Abstract_Wallet = None):
-        """ lightning history """
+    async def lightning_history(self, show_fiat=False, wallet: Abstract_Wallet = None, stream=False):
+        """ lightning history. With 'stream', the items are returned one at a time,
+        as newline-delimited JSON."""
         lightning_history = wallet.lnworker.get_history() if wallet.lnworker else []
+        if stream:
+            return (json_normalize(item) for item in lightning_history)
         return json_normalize(lightning_history)
 
     @command('w')
@@ -1049,7 +1118,8 @@ class Commands:
         tx = Transaction(tx)
         if not wallet.adb.add_transaction(tx):
             return False
-        wallet.save_db()
+        # the tx is to be broadcast: it must be on disk first
+        wallet.flush_db()
         return tx.txid()
 
     @command('w')
@@ -1483,6 +1553,9 @@ command_options = {
     'year':        (None, "Show history for a given year"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'after':       (None, "Only show transactions following the one with this txid"),
+    'limit':       (None, "Maximum number of transactions to show"),
+    'stream':      (None, "Output one item per line, as it is produced (newline-delimited JSON)"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
@@ -1504,6 +1577,7 @@ arg_types = {
     'year': int,
     'from_height': int,
     'to_height': int,
+    'limit': int,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
     'jsontx': json_loads,
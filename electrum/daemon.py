@@ -25,12 +25,14 @@
 import asyncio
 import ast
 import errno
+import inspect
 import os
+import queue
 import time
 import traceback
 import sys
 import threading
-from typing import Dict, Optional, Tuple, Iterable, Callable, Union, Sequence, Mapping, TYPE_CHECKING
+from typing import Dict, Optional, Tuple, Iterable, Iterator, Callable, Union, Sequence, Mapping, TYPE_CHECKING
 from base64 import b64decode, b64encode
 from collections import defaultdict
 import json
@@ -49,7 +51,9 @@ from .util import log_exceptions, ignore_exceptions, randrange, OldTaskGroup, Us
 from .util import EventListener, event_listener, traceback_format_exception
 from .wallet import Wallet, Abstract_Wallet
 from .storage import WalletStorage
-from .wallet_db import WalletDB, WalletRequiresSplit, WalletRequiresUpgrade, WalletUnfinished
+from .wallet_db import WalletRequiresSplit, WalletRequiresUpgrade, WalletUnfinished
+from .wallet_db_sqlite import SqliteWalletDB, get_sqlite_path, open_wallet_db
+from .raw_tx_store import RawTxStore, get_raw_tx_store_path
 from .commands import known_commands, Commands
 from .simple_config import SimpleConfig
 from .exchange_rate import FxThread
@@ -108,38 +112,52 @@ def get_file_descriptor(config: SimpleConfig):
 
 
 
-def request(config: SimpleConfig, endpoint, args=(), timeout: Union[float, int] = 60):
+def _read_lockfile(config: SimpleConfig) -> Tuple[str, Optional[str], str, Optional[float]]:
+    """Returns the socket type, socket path, url and creation time of the
+    JSON-RPC server of the daemon."""
     lockfile = get_lockfile(config)
+    path = None
+    try:
+        with open(lockfile) as f:
+            socktype, address, create_time = ast.literal_eval(f.read())
+            if socktype == 'unix':
+                path = address
+                (host, port) = "127.0.0.1", 0
+                # We still need a host and port for e.g. HTTP Host header
+            elif socktype == 'tcp':
+                (host, port) = address
+            else:
+                raise Exception(f"corrupt lockfile; socktype={socktype!r}")
+    except Exception:
+        raise DaemonNotRunning()
+    server_url = 'http://%s:%d' % (host, port)
+    return socktype, path, server_url, create_time
+
+
+def _get_client_auth(config: SimpleConfig) -> aiohttp.BasicAuth:
+    rpc_user, rpc_password = get_rpc_credentials(config)
+    return aiohttp.BasicAuth(login=rpc_user, password=rpc_password)
+
+
+def _make_client_session(socktype: str, path: Optional[str], auth: aiohttp.BasicAuth) -> aiohttp.ClientSession:
+    if socktype == 'unix':
+        connector = aiohttp.UnixConnector(path=path)
+    elif socktype == 'tcp':
+        connector = None # This will transform into TCP.
+    else:
+        raise Exception(f"impossible socktype ({socktype!r})")
+    return aiohttp.ClientSession(auth=auth, connector=connector)
+
+
+def request(config: SimpleConfig, endpoint, args=(), timeout: Union[float, int] = 60):
     while True:
-        create_time = None
-        path = None
-        try:
-            with open(lockfile) as f:
-                socktype, address, create_time = ast.literal_eval(f.read())
-                if socktype == 'unix':
-                    path = address
-                    (host, port) = "127.0.0.1", 0
-                    # We still need a host and port for e.g. HTTP Host header
-                elif socktype == 'tcp':
-                    (host, port) = address
-                else:
-                    raise Exception(f"corrupt lockfile; socktype={socktype!r}")
-        except Exception:
-            raise DaemonNotRunning()
-        rpc_user, rpc_password = get_rpc_credentials(config)
-        server_url = 'http://%s:%d' % (host, port)
-        auth = aiohttp.BasicAuth(login=rpc_user, password=rpc_password)
+        socktype, path, server_url, create_time = _read_lockfile(config)
+        auth = _get_client_auth(config)
         loop = util.get_asyncio_loop()
         async def request_coroutine(
             *, socktype=socktype, path=path, auth=auth, server_url=server_url, endpoint=endpoint,
         ):
-            if socktype == 'unix':
-                connector = aiohttp.UnixConnector(path=path)
-            elif socktype == 'tcp':
-                connector = None # This will transform into TCP.
-            else:
-                raise Exception(f"impossible socktype ({socktype!r})")
-            async with aiohttp.ClientSession(auth=auth, connector=connector) as session:
+            async with _make_client_session(socktype, path, auth) as session:
                 c = util.JsonRPCClient(session, server_url)
                 return await c.request(endpoint, *args)
         try:
@@ -153,6 +171,46 @@ def request(config: SimpleConfig, endpoint, args=(), timeout: Union[float, int]
         time.sleep(1.0)
 
 
+def request_stream(config: SimpleConfig, endpoint, args=(), timeout: Union[float, int] = 60) -> Iterator:
+    """Like request, for methods that stream their result.
+    Yields the items of the result as they arrive. timeout applies to each item.
+    """
+    while True:
+        socktype, path, server_url, create_time = _read_lockfile(config)
+        auth = _get_client_auth(config)
+        loop = util.get_asyncio_loop()
+        items = queue.Queue()
+        end = object()
+        async def request_coroutine(
+            *, socktype=socktype, path=path, auth=auth, server_url=server_url, endpoint=endpoint, items=items,
+        ):
+            async with _make_client_session(socktype, path, auth) as session:
+                c = util.JsonRPCClient(session, server_url)
+                async for item in c.request_stream(endpoint, *args):
+                    items.put(item)
+        fut = asyncio.run_coroutine_threadsafe(request_coroutine(), loop)
+        fut.add_done_callback(lambda fut, items=items, end=end: items.put(end))
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError() from None
+                if item is end:
+                    break
+                yield item
+            fut.result()
+            return
+        except aiohttp.client_exceptions.ClientConnectorError as e:
+            _logger.info(f"failed to connect to JSON-RPC server {e}")
+            if not create_time or create_time < time.time() - 1.0:
+                raise DaemonNotRunning()
+        finally:
+            fut.cancel()
+        # Sleep a bit and try again; it might have just been started
+        time.sleep(1.0)
+
+
 def wait_until_daemon_becomes_ready(*, config: SimpleConfig, timeout=5) -> bool:
     t0 = time.monotonic()
     while True:
@@ -232,11 +290,10 @@ class AuthenticatedServer(Logger):
             except AuthenticationCredentialsInvalid:
                 return web.Response(text='Forbidden', status=403)
         try:
-            request = await request.text()
-            request = json.loads(request)
-            method = request['method']
-            _id = request['id']
-            params = request.get('params', [])  # type: Union[Sequence, Mapping]
+            body = json.loads(await request.text())
+            method = body['method']
+            _id = body['id']
+            params = body.get('params', [])  # type: Union[Sequence, Mapping]
             if method not in self._methods:
                 raise Exception(f"attempting to use unregistered method: {method}")
             f = self._methods[method]
@@ -249,25 +306,55 @@ class AuthenticatedServer(Logger):
         }
         try:
             if isinstance(params, dict):
-                response['result'] = await f(**params)
+                result = await f(**params)
             else:
-                response['result'] = await f(*params)
-        except UserFacingException as e:
-            response['error'] = {
+                result = await f(*params)
+        except BaseException as e:
+            response['error'] = self.get_error(e)
+            return web.json_response(response)
+        if inspect.isgenerator(result):
+            return await self.stream_result(request, _id, result)
+        response['result'] = result
+        return web.json_response(response)
+
+    def get_error(self, e: BaseException) -> dict:
+        if isinstance(e, UserFacingException):
+            return {
                 'code': JsonRPCError.Codes.USERFACING,
                 'message': str(e),
             }
-        except BaseException as e:
-            self.logger.exception("internal error while executing RPC")
-            response['error'] = {
-                'code': JsonRPCError.Codes.INTERNAL,
-                'message': "internal error while executing RPC",
-                'data': {
-                    "exception": repr(e),
-                    "traceback": "".join(traceback_format_exception(e)),
-                },
+        self.logger.exception("internal error while executing RPC")
+        return {
+            'code': JsonRPCError.Codes.INTERNAL,
+            'message': "internal error while executing RPC",
+            'data': {
+                "exception": repr(e),
+                "traceback": "".join(traceback_format_exception(e)),
+            },
+        }
+
+    async def stream_result(self, request, _id, result: Iterator) -> web.StreamResponse:
+        """Sends the items of result as newline-delimited JSON, one response
+        object per item. If result raises, the last object has an 'error'.
+        """
+        resp = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await resp.prepare(request)
+        while True:
+            response = {
+                'id': _id,
+                'jsonrpc': '2.0',
             }
-        return web.json_response(response)
+            try:
+                response['result'] = next(result)
+            except StopIteration:
+                break
+            except BaseException as e:
+                response['error'] = self.get_error(e)
+            await resp.write(json.dumps(response).encode('utf8') + b'\n')
+            if 'error' in response:
+                break
+        await resp.write_eof()
+        return resp
 
 
 class CommandsServer(AuthenticatedServer):
@@ -517,7 +604,7 @@ class Daemon(Logger):
                 raise InvalidPassword('No password given')
             storage.decrypt(password)
         # read data, pass it to db
-        db = WalletDB(storage.read(), storage=storage, upgrade=upgrade)
+        db = open_wallet_db(storage, upgrade=upgrade)
         if db.get_action():
             raise WalletUnfinished(db)
         wallet = Wallet(db, config=config)
@@ -542,6 +629,10 @@ class Daemon(Logger):
         self.stop_wallet(path)
         if os.path.exists(path):
             os.unlink(path)
+            if SqliteWalletDB.exists_for(path):
+                os.unlink(get_sqlite_path(path))
+            if RawTxStore.exists_for(path):
+                os.unlink(get_raw_tx_store_path(path))
             return True
         return False
 
@@ -1,6 +1,10 @@
+import array
 import asyncio
+import bisect
 from datetime import datetime
 import inspect
+import math
+import struct
 import sys
 import os
 import json
@@ -8,7 +12,7 @@ import time
 import csv
 import decimal
 from decimal import Decimal
-from typing import Sequence, Optional, Mapping, Dict, Union, Any, Tuple
+from typing import Sequence, Optional, Mapping, Dict, Union, Any, List, Iterable
 
 from aiorpcx.curio import timeout_after, TaskTimeout, ignore_after
 import aiohttp
@@ -41,11 +45,103 @@ SPOT_RATE_CLOSE_TO_STALE = 450      # try harder to fetch an update if price is
 SPOT_RATE_EXPIRY = 600              # spot price becomes stale after 10 minutes -> we no longer show/use it
 
 
+class HistoricalRates:
+    """Daily exchange rates of a currency, sorted by day.
+
+    Days are date ordinals (see datetime.date.toordinal), rates are floats
+    (NaN if unknown). They are kept in two arrays, which are also the format
+    of the cache file.
+    """
+
+    MAGIC = b'ELFXRATE'
+    VERSION = 1
+    HEADER = struct.Struct('<8sII')  # magic, version, number of days
+
+    def __init__(self, days: Sequence[int] = (), rates: Sequence[float] = (), *, timestamp: float = 0):
+        assert len(days) == len(rates)
+        self.days = array.array('i', days)
+        self.rates = array.array('d', rates)
+        self.timestamp = timestamp  # of the last update
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_dict(cls, history: Mapping[str, Union[str, float]]) -> 'HistoricalRates':
+        """Converts a {'YYYY-MM-DD': rate} dict, as returned by request_history."""
+        items = {}
+        for date_str, rate in history.items():
+            try:
+                day = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+            except (TypeError, ValueError):
+                continue
+            try:
+                rate = float(Decimal(str(rate)))
+            except Exception:  # guard against garbage coming from exchange
+                rate = math.nan
+            items[day] = rate if math.isfinite(rate) else math.nan
+        days = sorted(items)
+        return cls(days, [items[day] for day in days])
+
+    def merge(self, other: 'HistoricalRates') -> 'HistoricalRates':
+        """Returns the union of both series. Rates of other take precedence."""
+        items = dict(zip(self.days, self.rates))
+        items.update(zip(other.days, other.rates))
+        days = sorted(items)
+        return HistoricalRates(days, [items[day] for day in days], timestamp=max(self.timestamp, other.timestamp))
+
+    def rate_for_day(self, day: int) -> Decimal:
+        i = bisect.bisect_left(self.days, day)
+        if i == len(self.days) or self.days[i] != day:
+            return Decimal('NaN')
+        return Decimal(repr(self.rates[i]))
+
+    def rates_for_days(self, days: Iterable[int]) -> List[Decimal]:
+        cache = {}
+        out = []
+        for day in days:
+            rate = cache.get(day)
+            if rate is None:
+                rate = cache[day] = self.rate_for_day(day)
+            out.append(rate)
+        return out
+
+    @classmethod
+    def read(cls, filename: str) -> Optional['HistoricalRates']:
+        try:
+            with open(filename, 'rb') as f:
+                magic, version, n = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                if magic != cls.MAGIC or version != cls.VERSION:
+                    return None
+                h = cls()
+                h.days.fromfile(f, n)
+                h.rates.fromfile(f, n)
+        except Exception:
+            return None
+        if sys.byteorder != 'little':
+            h.days.byteswap()
+            h.rates.byteswap()
+        h.timestamp = os.stat(filename).st_mtime
+        return h
+
+    def write(self, filename: str) -> None:
+        days, rates = self.days, self.rates
+        if sys.byteorder != 'little':
+            days, rates = array.array('i', days), array.array('d', rates)
+            days.byteswap()
+            rates.byteswap()
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(days)))
+            days.tofile(f)
+            rates.tofile(f)
+        os.replace(filename + '.tmp', filename)
+
+
 class ExchangeBase(Logger):
 
     def __init__(self, on_quotes, on_history):
         Logger.__init__(self)
-        self._history = {}  # type: Dict[str, Dict[str, str]]
+        self._history = {}  # type: Dict[str, HistoricalRates]
         self._quotes = {}  # type: Dict[str, Optional[Decimal]]
         self._quotes_timestamp = 0  # type: Union[int, float]
         self.on_quotes = on_quotes
@@ -100,42 +196,40 @@ class ExchangeBase(Logger):
     @staticmethod
     def _read_historical_rates_from_file(
         *, exchange_name: str, ccy: str, cache_dir: str,
-    ) -> Tuple[Optional[dict], Optional[float]]:
+    ) -> Optional[HistoricalRates]:
         filename = os.path.join(cache_dir, f"{exchange_name}_{ccy}")
-        if not os.path.exists(filename):
-            return None, None
-        timestamp = os.stat(filename).st_mtime
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                h = json.loads(f.read())
-        except Exception:
-            return None, None
-        if not h:  # e.g. empty dict
-            return None, None
-        # cast rates to str
-        h = {date_str: str(rate) for (date_str, rate) in h.items()}
-        return h, timestamp
-
-    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[dict]:
-        h, timestamp = self._read_historical_rates_from_file(
+        h = HistoricalRates.read(filename + '.rates')
+        if h is None and os.path.exists(filename):
+            # json cache of older versions
+            timestamp = os.stat(filename).st_mtime
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    h = HistoricalRates.from_dict(json.loads(f.read()))
+            except Exception:
+                return None
+            h.timestamp = timestamp
+        if not h:  # e.g. no rates
+            return None
+        return h
+
+    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[HistoricalRates]:
+        h = self._read_historical_rates_from_file(
             exchange_name=self.name(),
             ccy=ccy,
             cache_dir=cache_dir,
         )
         if not h:
             return None
-        h['timestamp'] = timestamp
         self._history[ccy] = h
         self.on_history()
         return h
 
     @staticmethod
     def _write_historical_rates_to_file(
-        *, exchange_name: str, ccy: str, cache_dir: str, history: Dict[str, str],
+        *, exchange_name: str, ccy: str, cache_dir: str, history: HistoricalRates,
     ) -> None:
         filename = os.path.join(cache_dir, f"{exchange_name}_{ccy}")
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(json.dumps(history))
+        history.write(filename + '.rates')
 
     @log_exceptions
     async def get_historical_rates_safe(self, ccy: str, cache_dir: str) -> None:
@@ -149,19 +243,17 @@ class ExchangeBase(Logger):
         except Exception as e:
             self.logger.exception(f"failed fx history: {repr(e)}")
             return
-        # cast rates to str
-        h_new = {date_str: str(rate) for (date_str, rate) in h_new.items()}
+        h_new = HistoricalRates.from_dict(h_new)
         # merge old history and new history. resolve duplicate dates using new data.
-        h_old, _timestamp = self._read_historical_rates_from_file(
+        h_old = self._read_historical_rates_from_file(
             exchange_name=self.name(), ccy=ccy, cache_dir=cache_dir,
         )
-        h_old = h_old or {}
-        h = {**h_old, **h_new}
+        h = h_old.merge(h_new) if h_old else h_new
         # write merged data to disk cache
         self._write_historical_rates_to_file(
             exchange_name=self.name(), ccy=ccy, cache_dir=cache_dir, history=h,
         )
-        h['timestamp'] = time.time()
+        h.timestamp = time.time()
         self._history[ccy] = h
         self.on_history()
 
@@ -171,20 +263,24 @@ class ExchangeBase(Logger):
         h = self._history.get(ccy)
         if h is None:
             h = self.read_historical_rates(ccy, cache_dir)
-        if h is None or h['timestamp'] < time.time() - 24*3600:
+        if h is None or h.timestamp < time.time() - 24*3600:
             util.get_asyncio_loop().create_task(self.get_historical_rates_safe(ccy, cache_dir))
 
     def history_ccys(self) -> Sequence[str]:
         return []
 
     def historical_rate(self, ccy: str, d_t: datetime) -> Decimal:
-        date_str = d_t.strftime('%Y-%m-%d')
-        rate = self._history.get(ccy, {}).get(date_str) or 'NaN'
-        try:
-            return Decimal(rate)
-        except Exception:  # guard against garbage coming from exchange
-            #self.logger.debug(f"found corrupted historical_rate: {rate=!r}. for {ccy=} at {date_str}")
+        h = self._history.get(ccy)
+        if h is None:
             return Decimal('NaN')
+        return h.rate_for_day(d_t.toordinal())
+
+    def historical_rates(self, ccy: str, days: Sequence[int]) -> List[Decimal]:
+        """Batch version of historical_rate. days are date ordinals."""
+        h = self._history.get(ccy)
+        if h is None:
+            return [Decimal('NaN')] * len(days)
+        return h.rates_for_days(days)
 
     async def request_history(self, ccy: str) -> Dict[str, Union[str, float]]:
         raise NotImplementedError()  # implemented by subclasses
@@ -829,5 +925,17 @@ class FxThread(ThreadJob, EventListener, NetworkRetryManager[str]):
         date = timestamp_to_datetime(timestamp)
         return self.history_rate(date)
 
+    def rates_for_timestamps(self, timestamps: Sequence[Optional[int]]) -> List[Decimal]:
+        """Batch version of timestamp_rate."""
+        from .util import timestamp_to_datetime
+        dates = [timestamp_to_datetime(timestamp) for timestamp in timestamps]
+        known = [i for i, d_t in enumerate(dates) if d_t is not None]
+        rates = [Decimal('NaN')] * len(dates)
+        for i, rate in zip(known, self.exchange.historical_rates(self.ccy, [dates[i].toordinal() for i in known])):
+            if rate.is_nan() and (datetime.today().date() - dates[i].date()).days <= 2:
+                rate = self.history_rate(dates[i])  # spot quote
+            rates[i] = rate
+        return rates
+
 
 assert globals().get(SimpleConfig.FX_EXCHANGE.get_default_value()), f"default exchange {SimpleConfig.FX_EXCHANGE.get_default_value()} does not exist"
@@ -624,7 +624,8 @@ class QEWallet(AuthMixin, QObject, QtEventListener):
                 self.saveTxError.emit(tx.txid(), 'conflict',
                             _("Transaction could not be saved.") + "\n" + _("It conflicts with current history."))
                 return
-            self.wallet.save_db()
+            # the tx might get broadcast: it must be on disk first
+            self.wallet.flush_db()
             self.saveTxSuccess.emit(tx.txid())
             self.historyModel.initModel(True)
             return True
@@ -2653,7 +2653,8 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger, QtEventListener):
             win.show_error(e)
             return False
         else:
-            self.wallet.save_db()
+            # the tx might get broadcast: it must be on disk first
+            self.wallet.flush_db()
             # need to update at least: history_list, utxo_list, address_list
             self.need_update.set()
             msg = (_("Transaction added to wallet history.") + '\n\n' +
@@ -226,6 +226,36 @@ class NodesListWidget(QTreeWidget):
         super().update()
 
 
+class RequestStatsWidget(QTreeWidget):
+    """Per-method stats of the requests sent to the servers, since startup."""
+
+    def __init__(self, *, network: Network):
+        QTreeWidget.__init__(self)
+        self.setHeaderLabels([_('Method'), _('Requests'), _('Errors'), _('Timeouts'),
+                              _('Avg. latency'), _('90% latency'), _('Received')])
+        self.network = network
+
+    def update(self):
+        self.clear()
+        for method, stats in self.network.get_network_stats()['total'].items():
+            item = QTreeWidgetItem([
+                method,
+                str(stats['count']),
+                str(stats['errors']),
+                str(stats['timeouts']),
+                '%d ms' % (1000 * stats['avg_latency']),
+                '%d ms' % (1000 * stats['latency_p90']),
+                '%d kB' % (stats['response_bytes'] // 1000),
+            ])
+            self.addTopLevelItem(item)
+        h = self.header()
+        h.setStretchLastSection(False)
+        h.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for i in range(1, self.columnCount()):
+            h.setSectionResizeMode(i, QHeaderView.ResizeMode.ResizeToContents)
+        super().update()
+
+
 class NetworkChoiceLayout(object):
     # TODO consolidate to ProxyWidget+ServerWidget
     # TODO TorDetector is unnecessary, Network tests socks5 peer and detects Tor
@@ -238,8 +268,10 @@ class NetworkChoiceLayout(object):
         self.tabs = tabs = QTabWidget()
         self._proxy_tab = proxy_tab = QWidget()
         blockchain_tab = QWidget()
+        self._stats_tab = stats_tab = QWidget()
         tabs.addTab(blockchain_tab, _('Overview'))
         tabs.addTab(proxy_tab, _('Proxy'))
+        tabs.addTab(stats_tab, _('Statistics'))
         tabs.currentChanged.connect(self._on_tab_changed)
 
         fixed_width_hostname = 24 * char_width_in_lineedit()
@@ -345,6 +377,11 @@ class NetworkChoiceLayout(object):
         self.nodes_list_widget.setServer.connect(do_set_server)
         grid.addWidget(self.nodes_list_widget, 6, 0, 1, 5)
 
+        # Statistics tab
+        vbox = QVBoxLayout(stats_tab)
+        self.request_stats_widget = RequestStatsWidget(network=self.network)
+        vbox.addWidget(self.request_stats_widget)
+
         vbox = QVBoxLayout()
         vbox.addWidget(tabs)
         self.layout_ = vbox
@@ -399,6 +436,8 @@ class NetworkChoiceLayout(object):
             msg = ''
         self.split_label.setText(msg)
         self.nodes_list_widget.update()
+        if self.tabs.currentWidget() is self._stats_tab:
+            self.request_stats_widget.update()
         self.enable_set_server()
 
     def fill_in_proxy_settings(self):
@@ -462,6 +501,8 @@ class NetworkChoiceLayout(object):
     def _on_tab_changed(self):
         if self.tabs.currentWidget() is self._proxy_tab:
             self.td.trigger_rescan()
+        elif self.tabs.currentWidget() is self._stats_tab:
+            self.request_stats_widget.update()
 
     def suggest_proxy(self, found_proxy):
         if found_proxy is None:
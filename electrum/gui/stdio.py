@@ -8,7 +8,7 @@ from electrum.gui import BaseElectrumGui
 from electrum import util
 from electrum import WalletStorage, Wallet
 from electrum.wallet import Abstract_Wallet
-from electrum.wallet_db import WalletDB
+from electrum.wallet_db_sqlite import open_wallet_db
 from electrum.util import format_satoshis, EventListener, event_listener
 from electrum.bitcoin import is_address, COIN
 from electrum.transaction import PartialTxOutput
@@ -33,7 +33,7 @@ class ElectrumGui(BaseElectrumGui, EventListener):
             password = getpass.getpass('Password:', stream=None)
             storage.decrypt(password)
 
-        db = WalletDB(storage.read(), storage=storage, manual_upgrades=False)
+        db = open_wallet_db(storage, upgrade=True)
 
         self.done = 0
         self.last_balance = ""
@@ -24,11 +24,13 @@
 # SOFTWARE.
 import os
 import re
+import bisect
 import ssl
 import sys
 import traceback
 import asyncio
 import socket
+import time
 from typing import Tuple, Union, List, TYPE_CHECKING, Optional, Set, NamedTuple, Any, Sequence, Dict
 from collections import defaultdict
 from ipaddress import IPv4Network, IPv6Network, ip_address, IPv6Address, IPv4Address
@@ -46,7 +48,7 @@ import certifi
 
 from .util import (ignore_exceptions, log_exceptions, bfh, MySocksProxy,
                    is_integer, is_non_negative_integer, is_hash256_str, is_hex_str,
-                   is_int_or_float, is_non_negative_int_or_float, OldTaskGroup)
+                   is_int_or_float, is_non_negative_int_or_float, OldTaskGroup, LRUCache)
 from . import util
 from . import x509
 from . import pem
@@ -129,8 +131,118 @@ def assert_list_or_tuple(val: Any) -> None:
         raise RequestCorrupted(f'{val!r} should be a list or tuple')
 
 
+class _MethodStats:
+    __slots__ = ('count', 'errors', 'timeouts', 'total_latency', 'max_latency', 'response_size', 'histogram')
+
+    def __init__(self, num_buckets: int):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.response_size = 0
+        self.histogram = [0] * num_buckets
+
+
+class RequestStats:
+    """Per-method counters of the requests sent to servers.
+
+    Recording a request only updates a few counters; averages and
+    percentiles are computed when the stats are read.
+    """
+    # upper bounds of the latency histogram buckets, in seconds
+    LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+
+    def __init__(self):
+        self._methods = {}  # type: Dict[str, _MethodStats]
+
+    def record(self, method: str, *, latency: float, response_size: int = 0,
+               error: bool = False, timeout: bool = False) -> None:
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = _MethodStats(len(self.LATENCY_BUCKETS))
+        stats.count += 1
+        stats.errors += error
+        stats.timeouts += timeout
+        stats.total_latency += latency
+        stats.max_latency = max(stats.max_latency, latency)
+        stats.response_size += response_size
+        stats.histogram[bisect.bisect_left(self.LATENCY_BUCKETS, latency)] += 1
+
+    def to_dict(self) -> Dict[str, dict]:
+        ret = {}
+        for method, stats in sorted(self._methods.items()):
+            ret[method] = {
+                'count': stats.count,
+                'errors': stats.errors,
+                'timeouts': stats.timeouts,
+                'avg_latency': stats.total_latency / stats.count,
+                'max_latency': stats.max_latency,
+                'latency_p90': min(self._percentile(stats.histogram, 90), stats.max_latency),
+                'latency_histogram': {f'<={bound}': n for bound, n in zip(self.LATENCY_BUCKETS, stats.histogram)},
+                'response_bytes': stats.response_size,
+            }
+        return ret
+
+    @classmethod
+    def _percentile(cls, histogram: Sequence[int], p: int) -> float:
+        """Upper bound of the bucket of the given percentile."""
+        threshold = sum(histogram) * p / 100
+        total = 0
+        for bound, n in zip(cls.LATENCY_BUCKETS, histogram):
+            total += n
+            if total >= threshold:
+                return bound
+        return cls.LATENCY_BUCKETS[-1]
+
+    @classmethod
+    def estimate_response_size(cls, result: Any) -> int:
+        """Approximate size of the result as JSON (the size on the wire is not
+        known per request). Responses are mostly hex strings, or lists of
+        items of the same shape: lists are estimated from their first item,
+        so that this does not walk large responses.
+        """
+        if isinstance(result, str):
+            return len(result) + 2
+        if isinstance(result, dict):
+            return 2 + sum(len(k) + 4 + cls.estimate_response_size(v) for k, v in result.items())
+        if isinstance(result, (list, tuple)):
+            if not result:
+                return 2
+            return 2 + len(result) * (cls.estimate_response_size(result[0]) + 2)
+        return 8  # numbers, booleans, null
+
+
 class NotificationSession(RPCSession):
 
+    # read-only methods: identical requests in flight at the same time share
+    # a single request to the server
+    COALESCED_METHODS = {
+        'blockchain.block.header',
+        'blockchain.block.headers',
+        'blockchain.estimatefee',
+        'blockchain.relayfee',
+        'blockchain.scripthash.get_history',
+        'blockchain.scripthash.get_mempool',
+        'blockchain.scripthash.listunspent',
+        'blockchain.transaction.get',
+        'blockchain.transaction.get_merkle',
+        'blockchain.transaction.id_from_pos',
+        'mempool.get_fee_histogram',
+        'server.banner',
+        'server.donation_address',
+        'server.features',
+        'server.peers.subscribe',
+    }
+    # responses of these methods only depend on their params, so they are
+    # reused for a short while. They are dropped when a new block is
+    # notified, in case of a reorg.
+    RESPONSE_CACHE_METHODS = {
+        'blockchain.transaction.get_merkle',
+        'blockchain.transaction.get',
+    }
+    RESPONSE_CACHE_TTL = 10  # seconds
+
     def __init__(self, *args, interface: 'Interface', **kwargs):
         super(NotificationSession, self).__init__(*args, **kwargs)
         self.subscriptions = defaultdict(list)
@@ -138,6 +250,13 @@ class NotificationSession(RPCSession):
         self._msg_counter = itertools.count(start=1)
         self.interface = interface
         self.cost_hard_limit = 0  # disable aiorpcx resource limits
+        # identical requests in flight at the same time share a single task (or batch item)
+        self._inflight_requests = {}  # type: Dict[str, asyncio.Future]
+        self._response_cache = LRUCache(maxsize=1000)  # type: LRUCache[str, Tuple[float, Any]]  # key -> (expiry, result)
+        self.num_requests_reused = 0  # coalesced with an in-flight request, or cached
+        self.num_requests_sent = 0
+        # adapted to the latency of the server
+        self.request_limiter = util.AdaptiveConcurrencyLimiter()
 
     async def handle_request(self, request):
         self.maybe_log(f"--> {request}")
@@ -146,6 +265,8 @@ class NotificationSession(RPCSession):
                 params, result = request.args[:-1], request.args[-1]
                 key = self.get_hashable_key_for_rpc_call(request.method, params)
                 if key in self.subscriptions:
+                    if request.method == 'blockchain.headers.subscribe':
+                        self._response_cache.clear()
                     self.cache[key] = result
                     for queue in self.subscriptions[key]:
                         await queue.put(request.args)
@@ -160,27 +281,170 @@ class NotificationSession(RPCSession):
     async def send_request(self, *args, timeout=None, **kwargs):
         # note: semaphores/timeouts/backpressure etc are handled by
         # aiorpcx. the timeout arg here in most cases should not be set
+        method = args[0]
+        params = args[1] if len(args) > 1 else kwargs.get('args', ())
+        key = self.get_hashable_key_for_rpc_call(method, params)
+        if method in self.RESPONSE_CACHE_METHODS:
+            item = self._response_cache.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self.num_requests_reused += 1
+                return item[1]
+        task = self._inflight_requests.get(key) if method in self.COALESCED_METHODS else None
+        if task is None:
+            self.num_requests_sent += 1
+            task = asyncio.create_task(self._send_request(*args, **kwargs))
+            if method in self.COALESCED_METHODS:
+                self._inflight_requests[key] = task
+            task.add_done_callback(functools.partial(self._on_request_done, key, method))
+        else:
+            self.num_requests_reused += 1
+        try:
+            # the task is shared, so it must not be cancelled by any one caller
+            return await util.wait_for2(asyncio.shield(task), timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            self.maybe_log(f"--> request timed out: {args}")
+            raise RequestTimedOut(f'request timed out: {args}') from e
+
+    def _on_request_done(self, key: str, method: str, task: asyncio.Future) -> None:
+        if self._inflight_requests.get(key) is task:
+            del self._inflight_requests[key]
+        if task.cancelled() or task.exception() is not None:  # note: this also marks the exception as retrieved
+            return
+        if method in self.RESPONSE_CACHE_METHODS:
+            self._response_cache[key] = (time.monotonic() + self.RESPONSE_CACHE_TTL, task.result())
+
+    async def _send_request(self, *args, **kwargs):
         msg_id = next(self._msg_counter)
         self.maybe_log(f"<-- {args} {kwargs} (id: {msg_id})")
+        method = args[0]
+        start = None
         try:
             # note: RPCSession.send_request raises TaskTimeout in case of a timeout.
             # TaskTimeout is a subclass of CancelledError, which is *suppressed* in TaskGroups
-            response = await util.wait_for2(
-                super().send_request(*args, **kwargs),
-                timeout)
+            async with self.request_limiter.request():
+                start = time.monotonic()
+                response = await super().send_request(*args, **kwargs)
         except (TaskTimeout, asyncio.TimeoutError) as e:
             self.maybe_log(f"--> request timed out: {args} (id: {msg_id})")
+            if start is not None:
+                self._record_request(method, time.monotonic() - start, timeout=True)
             raise RequestTimedOut(f'request timed out: {args} (id: {msg_id})') from e
         except CodeMessageError as e:
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
+            self._record_request(method, time.monotonic() - start, error=True)
             raise
         except BaseException as e:  # cancellations, etc. are useful for debugging
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
             raise
         else:
             self.maybe_log(f"--> {response} (id: {msg_id})")
+            self._record_request(method, time.monotonic() - start, response=response)
             return response
 
+    def _record_request(self, method: str, latency: float, *, response: Any = None,
+                        error: bool = False, timeout: bool = False) -> None:
+        if not self.interface:
+            return
+        response_size = RequestStats.estimate_response_size(response) if response is not None else 0
+        for stats in (self.interface.request_stats, self.interface.network.request_stats):
+            stats.record(method, latency=latency, response_size=response_size, error=error, timeout=timeout)
+
+    async def send_request_batch(self, requests: Sequence[Tuple[str, Sequence]], *, timeout=None) -> List[Any]:
+        """Sends (method, params) requests as a single JSON-RPC batch.
+        Returns the results in the same order. Requests that failed have
+        the error (e.g. RPCError) in place of their result.
+        Like send_request, cached responses are reused, and requests that
+        are already in flight (alone or in another batch) are not sent again.
+        """
+        if not requests:
+            return []
+        results = [None] * len(requests)  # type: List[Any]
+        shared = {}  # type: Dict[int, asyncio.Future]  # index -> identical request in flight
+        to_send = []  # type: List[Tuple[int, asyncio.Future, str, Sequence]]
+        for i, (method, params) in enumerate(requests):
+            key = self.get_hashable_key_for_rpc_call(method, params)
+            if method in self.RESPONSE_CACHE_METHODS:
+                item = self._response_cache.get(key)
+                if item is not None and item[0] > time.monotonic():
+                    self.num_requests_reused += 1
+                    results[i] = item[1]
+                    continue
+            fut = self._inflight_requests.get(key) if method in self.COALESCED_METHODS else None
+            if fut is not None:
+                self.num_requests_reused += 1
+                shared[i] = fut
+                continue
+            # published like the task of send_request, so that others can share it
+            fut = asyncio.get_running_loop().create_future()
+            if method in self.COALESCED_METHODS:
+                self._inflight_requests[key] = fut
+            fut.add_done_callback(functools.partial(self._on_request_done, key, method))
+            to_send.append((i, fut, method, params))
+        self.num_requests_sent += len(to_send)
+        try:
+            sent_results = await self._send_request_batch(
+                [(method, params) for _, _, method, params in to_send], timeout=timeout) if to_send else []
+        except BaseException as e:
+            for _, fut, _, _ in to_send:
+                if isinstance(e, asyncio.CancelledError):
+                    fut.cancel()
+                else:
+                    fut.set_exception(e)
+            raise
+        for (i, fut, _, _), result in zip(to_send, sent_results):
+            results[i] = result
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+        for i, fut in shared.items():
+            try:
+                results[i] = await util.wait_for2(asyncio.shield(fut), timeout)
+            except (TaskTimeout, asyncio.TimeoutError) as e:
+                raise RequestTimedOut(f'request timed out: {requests[i]}') from e
+            except Exception as e:
+                results[i] = e
+        return results
+
+    async def _send_request_batch(self, requests: Sequence[Tuple[str, Sequence]], *, timeout=None) -> List[Any]:
+        if not requests:
+            return []
+        msg_id = next(self._msg_counter)
+        self.maybe_log(f"<-- batch {requests} (id: {msg_id})")
+
+        start = None
+
+        async def send_batch():
+            nonlocal start
+            async with self.request_limiter.request(num_items=len(requests)), self.send_batch() as batch:
+                start = time.monotonic()
+                for method, params in requests:
+                    batch.add_request(method, params)
+            return list(batch.results)
+
+        try:
+            results = await util.wait_for2(send_batch(), timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            self.maybe_log(f"--> batch timed out (id: {msg_id})")
+            if start is not None:
+                latency = (time.monotonic() - start) / len(requests)
+                for method, params in requests:
+                    self._record_request(method, latency, timeout=True)
+            raise RequestTimedOut(f'batch request timed out: {len(requests)} requests (id: {msg_id})') from e
+        except BaseException as e:  # cancellations, etc. are useful for debugging
+            self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
+            raise
+        else:
+            self.maybe_log(f"--> {results} (id: {msg_id})")
+            # the batch is answered at once: share its latency between the requests
+            latency = (time.monotonic() - start) / len(requests)
+            for (method, params), result in zip(requests, results):
+                if isinstance(result, Exception):
+                    self._record_request(method, latency, error=True)
+                else:
+                    self._record_request(method, latency, response=result)
+            return results
+
     def set_default_timeout(self, timeout):
         assert hasattr(self, "sent_request_timeout")  # in base class
         self.sent_request_timeout = timeout
@@ -199,6 +463,31 @@ class NotificationSession(RPCSession):
             self.cache[key] = result
         await queue.put(params + [result])
 
+    async def subscribe_batch(self, method: str, params_list: Sequence[List], queue: asyncio.Queue) -> List[Optional[Exception]]:
+        """Like subscribe(), for several params at once. The ones not
+        in the cache are requested in a single batch.
+        Returns, for each params, None or the error of its request.
+        """
+        keys = [self.get_hashable_key_for_rpc_call(method, params) for params in params_list]
+        for key in keys:
+            self.subscriptions[key].append(queue)
+        to_request = [(params, key) for params, key in zip(params_list, keys) if key not in self.cache]
+        errors = {}
+        results = await self.send_request_batch([(method, params) for params, key in to_request])
+        for (params, key), result in zip(to_request, results):
+            if isinstance(result, Exception):
+                errors[key] = result
+            else:
+                self.cache[key] = result
+        ret = []
+        for params, key in zip(params_list, keys):
+            if key in errors:
+                ret.append(errors[key])
+                continue
+            await queue.put(params + [self.cache[key]])
+            ret.append(None)
+        return ret
+
     def unsubscribe(self, queue):
         """Unsubscribe a callback to free object references to enable GC."""
         # note: we can't unsubscribe from the server, so we keep receiving
@@ -384,6 +673,7 @@ class Interface(Logger):
         self.cert_path = _get_cert_path_for_host(config=network.config, host=self.host)
         self.blockchain = None  # type: Optional[Blockchain]
         self._requested_chunks = set()  # type: Set[int]
+        self._num_chunk_requests = 0
         self.network = network
         self.session = None  # type: Optional[NotificationSession]
         self._ipaddr_bucket = None
@@ -406,6 +696,11 @@ class Interface(Logger):
 
         self.fee_estimates_eta = {}  # type: Dict[int, int]
 
+        self.request_stats = RequestStats()
+        # verifiable data (txs, merkle proofs) fetched for the network jobs, for diagnostics
+        self.num_items_fetched = 0
+        self.fetch_time = 0.0  # in seconds
+
         # Dump network messages (only for this interface).  Set at runtime from the console.
         self.debug = False
 
@@ -647,6 +942,16 @@ class Interface(Logger):
         if tip is not None:
             size = min(size, tip - index * 2016 + 1)
             size = max(size, 0)
+        hexdata = await self._fetch_chunk(index, size)
+        conn = self.blockchain.connect_chunk(index, hexdata)
+        if not conn:
+            return conn, 0
+        return conn, size
+
+    async def _fetch_chunk(self, index: int, size: int) -> str:
+        """Requests the first `size` headers of chunk `index`.
+        Returns them as hex, without verifying them.
+        """
         try:
             self._requested_chunks.add(index)
             res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
@@ -665,10 +970,83 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        return res['hex']
+
+    async def _request_chunks(self, height: int, tip: int) -> Tuple[bool, int]:
+        """Like request_chunk, for all the chunks from height up to tip.
+        Several chunks are requested at a time (see NETWORK_MAX_OUTSTANDING_CHUNKS),
+        from this server, and with NETWORK_PARALLEL_FETCH, from the other servers
+        on the same chain too. They are connected in order, as they arrive.
+        Returns whether the first chunk could connect, and the height
+        after the last connected header.
+        """
+        first_index, last_index = height // 2016, tip // 2016
+        max_outstanding = max(1, self.network.config.NETWORK_MAX_OUTSTANDING_CHUNKS)
+        self.logger.info(f"requesting chunks from height {height} to {tip}")
+        tasks = {}  # type: Dict[int, Tuple[asyncio.Task, Interface]]
+        next_index = first_index
+        try:
+            for index in range(first_index, last_index + 1):
+                while next_index <= min(last_index, index + max_outstanding - 1):
+                    interface = self._get_chunk_interface() if next_index > first_index else self
+                    size = min(2016, tip - next_index * 2016 + 1)
+                    tasks[next_index] = asyncio.create_task(interface._fetch_chunk(next_index, size)), interface
+                    next_index += 1
+                task, interface = tasks.pop(index)
+                size = min(2016, tip - index * 2016 + 1)
+                hexdata = await self._await_chunk(task, interface)
+                conn = hexdata is not None and self.blockchain.connect_chunk(index, hexdata)
+                if not conn and interface is not self:
+                    # other servers might be on another chain, or lie: ask ours
+                    conn = self.blockchain.connect_chunk(index, await self._fetch_chunk(index, size))
+                if not conn:
+                    return index > first_index, index * 2016
+                util.trigger_callback('blockchain_updated')
+                util.trigger_callback('network_updated')
+            return True, tip + 1
+        finally:
+            for task, interface in tasks.values():
+                if task.done() and not task.cancelled():
+                    task.exception()  # mark as retrieved
+                task.cancel()
+
+    def _get_chunk_interface(self) -> 'Interface':
+        if not self.network.config.NETWORK_PARALLEL_FETCH:
+            return self
+        interfaces = [self] + [
+            iface for iface in self.network.interfaces.values()
+            if iface is not self
+            and iface.is_connected_and_ready()
+            and iface.session is not None
+            and iface.blockchain == self.blockchain]
+        self._num_chunk_requests += 1
+        return interfaces[self._num_chunk_requests % len(interfaces)]
+
+    async def _await_chunk(self, task: asyncio.Task, interface: 'Interface') -> Optional[str]:
+        """Waits for a chunk requested by _request_chunks. Failures on
+        the other servers are ignored (None is returned).
+        """
+        if interface is self:
+            return await task
+        try:
+            # if the other interface gets disconnected, its pending requests get cancelled
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+        except Exception as e:
+            interface.logger.info(f"failed to get chunk: {e!r}")
+        return None
+
+    def record_fetch(self, num_items: int, duration: float) -> None:
+        self.num_items_fetched += num_items
+        self.fetch_time += duration
+
+    def get_fetch_throughput(self) -> float:
+        """Items fetched per second of request time."""
+        if not self.fetch_time:
+            return 0.0
+        return self.num_items_fetched / self.fetch_time
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -802,22 +1180,50 @@ class Interface(Logger):
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
             if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
+                could_connect, new_height = await self._request_chunks(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
                         raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
                     last, height = await self.step(height)
                     continue
-                util.trigger_callback('blockchain_updated')
-                util.trigger_callback('network_updated')
-                height = (height // 2016 * 2016) + num_headers
+                height = new_height
                 assert height <= next_height+1, (height, self.tip)
                 last = 'catchup'
             else:
-                last, height = await self.step(height)
+                last, height = await self._catchup_headers(height, next_height)
             assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
         return last, height
 
+    async def _catchup_headers(self, height: int, next_height: int) -> Tuple[str, int]:
+        """Fetches the headers up to next_height. Headers that extend
+        self.blockchain are saved in a single batch, instead of fsyncing
+        the headers file for each of them. The first header that does
+        not simply extend the chain is handed to step().
+        """
+        headers = []
+        header = None
+        while not headers or height <= next_height:
+            header = await self.get_block_header(height, 'catchup')
+            if 'mock' in header:
+                break
+            if headers:
+                if header.get('prev_block_hash') != blockchain.hash_header(headers[-1]):
+                    break
+            elif not self.blockchain.can_connect(header):
+                break
+            headers.append(header)
+            height += 1
+            header = None
+        if headers:
+            num_saved = self.blockchain.connect_headers(headers)
+            self.logger.info(f"could connect {num_saved} headers up to {headers[0]['block_height'] + num_saved - 1}")
+            if num_saved < len(headers):
+                header = headers[num_saved]
+                height = header['block_height']
+        if header is None:
+            return 'catchup', height
+        return await self.step(height, header)
+
     async def step(self, height, header=None):
         assert 0 <= height <= self.tip, (height, self.tip)
         if header is None:
@@ -979,6 +1385,31 @@ class Interface(Logger):
         # do request
         res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
         # check response
+        self._check_merkle_response(res)
+        return res
+
+    async def get_merkles_for_transactions(self, txs: Sequence[Tuple[str, int]]) -> List[Union[dict, Exception]]:
+        """Batched get_merkle_for_transaction, for (tx_hash, tx_height) pairs.
+        Failed items have the error in place of the result.
+        """
+        for tx_hash, tx_height in txs:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+            if not is_non_negative_integer(tx_height):
+                raise Exception(f"{repr(tx_height)} is not a block height")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get_merkle', [tx_hash, tx_height]) for tx_hash, tx_height in txs])
+        for i, res in enumerate(results):
+            if isinstance(res, Exception):
+                continue
+            try:
+                self._check_merkle_response(res)
+            except RequestCorrupted as e:
+                results[i] = e
+        return results
+
+    @classmethod
+    def _check_merkle_response(cls, res) -> None:
         block_height = assert_dict_contains_field(res, field_name='block_height')
         merkle = assert_dict_contains_field(res, field_name='merkle')
         pos = assert_dict_contains_field(res, field_name='pos')
@@ -988,13 +1419,32 @@ class Interface(Logger):
         assert_list_or_tuple(merkle)
         for item in merkle:
             assert_hash256_str(item)
-        return res
 
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
-        # validate response
+        self._check_transaction_response(tx_hash, raw)
+        return raw
+
+    async def get_transactions(self, tx_hashes: Sequence[str], *, timeout=None) -> List[Union[str, Exception]]:
+        """Batched get_transaction. Failed items have the error in place of the raw tx."""
+        for tx_hash in tx_hashes:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get', [tx_hash]) for tx_hash in tx_hashes], timeout=timeout)
+        for i, (tx_hash, raw) in enumerate(zip(tx_hashes, results)):
+            if isinstance(raw, Exception):
+                continue
+            try:
+                self._check_transaction_response(tx_hash, raw)
+            except RequestCorrupted as e:
+                results[i] = e
+        return results
+
+    @classmethod
+    def _check_transaction_response(cls, tx_hash: str, raw) -> None:
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
         tx = Transaction(raw)
@@ -1004,7 +1454,6 @@ class Interface(Logger):
             raise RequestCorrupted(f"cannot deserialize received transaction (txid {tx_hash})") from e
         if tx.txid() != tx_hash:
             raise RequestCorrupted(f"received tx does not match expected txid {tx_hash} (got {tx.txid()})")
-        return raw
 
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
@@ -117,6 +117,11 @@ class StoredObject:
 
 
 _RaiseKeyError = object() # singleton for no-default behavior
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+# keys of the pending patches tree, see JsonDB.add_patch
+_PATCH = object()
+_LIST_PATCHES = object()
 
 class StoredDict(dict):
 
@@ -124,9 +129,108 @@ class StoredDict(dict):
         self.db = db
         self.lock = self.db.lock if self.db else threading.RLock()
         self.path = path
-        # recursively convert dicts to StoredDict
-        for k, v in list(data.items()):
-            self.__setitem__(k, v, patch=False)
+        # keys of items that are kept as loaded, until they are accessed
+        self._raw_keys = set()
+        if not self.db:
+            # recursively convert dicts to StoredDict
+            for k, v in list(data.items()):
+                self.__setitem__(k, v, patch=False)
+            return
+        # items that need a conversion are converted on first access
+        has_constructor = bool(path) and path[-1] in registered_dicts
+        for k, v in data.items():
+            dict.__setitem__(self, k, v)
+            if has_constructor or k in registered_names or not isinstance(v, _JSON_SCALARS):
+                self._raw_keys.add(k)
+
+    def _convert_raw_item(self, key):
+        with self.lock:
+            if key not in self._raw_keys:
+                return
+            v = dict.__getitem__(self, key)
+            if self.path and self.path[-1] in registered_dicts:
+                v = self.db._convert_dict_item(self.path[-1], v)
+            dict.__setitem__(self, key, self._convert(key, v))
+            self._raw_keys.remove(key)
+
+    def _convert_raw_items(self):
+        with self.lock:
+            for key in list(self._raw_keys):
+                self._convert_raw_item(key)
+
+    def __getitem__(self, key):
+        if key in self._raw_keys:
+            self._convert_raw_item(key)
+        return dict.__getitem__(self, key)
+
+    def __iter__(self):
+        # overriding __iter__ prevents dict(), dict.update() and ** from
+        # copying the underlying items without calling __getitem__
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key in self._raw_keys:
+            self._convert_raw_item(key)
+        return dict.get(self, key, default)
+
+    def items(self):
+        if self._raw_keys:
+            self._convert_raw_items()
+        return dict.items(self)
+
+    def values(self):
+        if self._raw_keys:
+            self._convert_raw_items()
+        return dict.values(self)
+
+    def setdefault(self, key, default=None):
+        if key in self._raw_keys:
+            self._convert_raw_item(key)
+        return dict.setdefault(self, key, default)
+
+    def copy(self):
+        return dict(self)
+
+    def __eq__(self, other):
+        # items must not compare as they were loaded
+        self._convert_raw_items()
+        if isinstance(other, StoredDict):
+            other._convert_raw_items()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    @locked
+    def update(self, *args, **kwargs):
+        # dict.update would not call __setitem__: no conversion, and no patch
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    @locked
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(dict.keys(self)))
+        return key, self.pop(key)
+
+    @locked
+    def clear(self):
+        dict.clear(self)
+        self._raw_keys.clear()
+
+    def to_json_tree(self):
+        """Returns the items as nested dicts, for serialization.
+        Items that have not been accessed are returned as they were loaded.
+        """
+        return {
+            k: v.to_json_tree() if isinstance(v, StoredDict) else v
+            for k, v in dict.items(self)}
 
     @locked
     def __setitem__(self, key, v, patch=True):
@@ -135,6 +239,15 @@ class StoredDict(dict):
         if not is_new and patch:
             if self.db and json.dumps(v, cls=self.db.encoder) == json.dumps(self[key], cls=self.db.encoder):
                 return
+        self._raw_keys.discard(key)
+        v = self._convert(key, v)
+        # set item
+        dict.__setitem__(self, key, v)
+        if self.db and patch:
+            op = 'add' if is_new else 'replace'
+            self.db.add_patch({'op': op, 'path': key_path(self.path, key), 'value': v})
+
+    def _convert(self, key, v):
         # recursively set db and path
         if isinstance(v, StoredDict):
             #assert v.db is None
@@ -145,9 +258,11 @@ class StoredDict(dict):
         # recursively convert dict to StoredDict.
         # _convert_dict is called breadth-first
         elif isinstance(v, dict):
+            to_stored_dict = not self.db or self.db._should_convert_to_stored_dict(key)
             if self.db:
-                v = self.db._convert_dict(self.path, key, v)
-            if not self.db or self.db._should_convert_to_stored_dict(key):
+                # the items of a StoredDict are converted when accessed
+                v = self.db._convert_dict(self.path, key, v, convert_items=not to_stored_dict)
+            if to_stored_dict:
                 v = StoredDict(v, self.db, self.path + [key])
         # convert_value is called depth-first
         if isinstance(v, dict) or isinstance(v, str) or isinstance(v, int):
@@ -162,15 +277,12 @@ class StoredDict(dict):
         # reject sets. they do not work well with jsonpatch
         if isinstance(v, set):
             raise Exception(f"Do not store sets inside jsondb. path={self.path!r}")
-        # set item
-        dict.__setitem__(self, key, v)
-        if self.db and patch:
-            op = 'add' if is_new else 'replace'
-            self.db.add_patch({'op': op, 'path': key_path(self.path, key), 'value': v})
+        return v
 
     @locked
     def __delitem__(self, key):
         dict.__delitem__(self, key)
+        self._raw_keys.discard(key)
         if self.db:
             self.db.add_patch({'op': 'remove', 'path': key_path(self.path, key)})
 
@@ -181,6 +293,7 @@ class StoredDict(dict):
                 raise KeyError(key)
             else:
                 return v
+        self._convert_raw_item(key)
         r = dict.pop(self, key)
         if self.db:
             self.db.add_patch({'op': 'remove', 'path': key_path(self.path, key)})
@@ -200,14 +313,22 @@ class StoredList(list):
         n = len(self)
         list.append(self, item)
         if self.db:
-            self.db.add_patch({'op': 'add', 'path': key_path(self.path, '%d'%n), 'value':item})
+            self.db.add_patch({'op': 'add', 'path': key_path(self.path, '%d'%n), 'value':item}, coalesce=False)
 
     @locked
     def remove(self, item):
         n = self.index(item)
         list.remove(self, item)
         if self.db:
-            self.db.add_patch({'op': 'remove', 'path': key_path(self.path, '%d'%n)})
+            self.db.add_patch({'op': 'remove', 'path': key_path(self.path, '%d'%n)}, coalesce=False)
+
+    @locked
+    def pop(self, index=-1):
+        n = index if index >= 0 else len(self) + index
+        item = list.pop(self, index)
+        if self.db:
+            self.db.add_patch({'op': 'remove', 'path': key_path(self.path, '%d'%n)}, coalesce=False)
+        return item
 
 
 
@@ -225,8 +346,13 @@ class JsonDB(Logger):
         self.lock = threading.RLock()
         self.storage = storage
         self.encoder = encoder
-        self.pending_changes = []
+        self.pending_changes = []  # dropped patches are set to None
+        self._pending_tree = {}
+        self.num_patches_written = 0
+        self.num_patches_dropped = 0
         self._modified = False
+        self._write_timer = None  # type: Optional[threading.Timer]
+        self._write_later_error = None  # type: Optional[Exception]  # raised by the next write_later
         # load data
         data = self.load_data(s)
         if upgrader:
@@ -303,9 +429,59 @@ class JsonDB(Logger):
         return self._modified
 
     @locked
-    def add_patch(self, patch):
-        self.pending_changes.append(json.dumps(patch, cls=self.encoder))
+    def add_patch(self, patch, *, coalesce: bool = True):
+        """Adds a patch to pending_changes.
+        Patches are coalesced by path: a patch supersedes pending patches on
+        the same path and below it. The last add/replace wins, and an add
+        followed by a remove cancels out. List patches (coalesce=False) are
+        never coalesced with each other, because they shift indices.
+        """
         self.set_modified(True)
+        op = patch['op']
+        keys = patch['path'].split('/')[1:]
+        parent = self._pending_tree
+        for k in keys[:-1]:
+            parent = parent.setdefault(k, {})
+        if not coalesce:
+            parent.setdefault(_LIST_PATCHES, []).append(len(self.pending_changes))
+            self.pending_changes.append(json.dumps(patch, cls=self.encoder))
+            return
+        node = parent.pop(keys[-1], None)
+        if node is not None:
+            prev = node.pop(_PATCH, None)
+            self._drop_pending_patches(node)
+            if prev is not None:
+                prev_index, prev_op = prev
+                self._drop_pending_patch(prev_index)
+                if prev_op == 'add' and op == 'remove':
+                    self.num_patches_dropped += 1
+                    return
+                if prev_op == 'add' and op == 'replace':
+                    op = 'add'
+                elif prev_op == 'remove' and op == 'add':
+                    op = 'replace'
+                if op != patch['op']:
+                    patch = dict(patch, op=op)
+        parent[keys[-1]] = {_PATCH: (len(self.pending_changes), op)}
+        self.pending_changes.append(json.dumps(patch, cls=self.encoder))
+
+    def _drop_pending_patch(self, i: int) -> None:
+        self.pending_changes[i] = None
+        self.num_patches_dropped += 1
+
+    def _drop_pending_patches(self, node: dict) -> None:
+        for k, v in node.items():
+            if k is _PATCH:
+                self._drop_pending_patch(v[0])
+            elif k is _LIST_PATCHES:
+                for i in v:
+                    self._drop_pending_patch(i)
+            else:
+                self._drop_pending_patches(v)
+
+    def _clear_pending_changes(self):
+        self.pending_changes = []
+        self._pending_tree = {}
 
     @locked
     def get(self, key, default=None):
@@ -351,7 +527,7 @@ class JsonDB(Logger):
         'human_readable': makes the json indented and sorted, but this is ~2x slower
         """
         return json.dumps(
-            self.data,
+            self.data.to_json_tree(),
             indent=4 if human_readable else None,
             sort_keys=bool(human_readable),
             cls=self.encoder,
@@ -360,15 +536,18 @@ class JsonDB(Logger):
     def _should_convert_to_stored_dict(self, key) -> bool:
         return True
 
-    def _convert_dict(self, path, key, v):
-        if key in registered_dicts:
-            constructor, _type = registered_dicts[key]
-            if _type == dict:
-                v = dict((k, constructor(**x)) for k, x in v.items())
-            elif _type == tuple:
-                v = dict((k, constructor(*x)) for k, x in v.items())
-            else:
-                v = dict((k, constructor(x)) for k, x in v.items())
+    def _convert_dict_item(self, key, x):
+        constructor, _type = registered_dicts[key]
+        if _type == dict:
+            return constructor(**x)
+        elif _type == tuple:
+            return constructor(*x)
+        else:
+            return constructor(x)
+
+    def _convert_dict(self, path, key, v, *, convert_items=True):
+        if convert_items and key in registered_dicts:
+            v = dict((k, self._convert_dict_item(key, x)) for k, x in v.items())
         if key in registered_dict_keys:
             convert_key = registered_dict_keys[key]
         elif path and path[-1] in registered_parent_keys:
@@ -391,23 +570,66 @@ class JsonDB(Logger):
     @locked
     def write(self):
         if (not self.storage.file_exists()
-                or self.storage.is_encrypted()
                 or self.storage.needs_consolidation()):
             self.write_and_force_consolidation()
         else:
             self._append_pending_changes()
 
+    def write_later(self, delay: float) -> None:
+        """Schedules a write on a background thread, after 'delay' seconds.
+        All changes made until then are saved in a single append or consolidation.
+        If the previous scheduled write failed, its exception is raised instead.
+        The pending changes are kept, and written by the next write.
+        """
+        with self.lock:
+            if self._write_later_error is not None:
+                e, self._write_later_error = self._write_later_error, None
+                raise e
+            if self._write_timer is not None:
+                return
+            self._write_timer = threading.Timer(delay, self._write_from_timer)
+            self._write_timer.name = 'jsondb-writer'
+            self._write_timer.start()
+
+    def _write_from_timer(self):
+        with self.lock:
+            # flush() might have cancelled us and scheduled another timer meanwhile
+            if self._write_timer is threading.current_thread():
+                self._write_timer = None
+            try:
+                self.write()
+            except Exception as e:
+                self.logger.exception('write-behind failed')
+                self._write_later_error = e
+
+    @locked
+    def flush(self):
+        """Writes pending changes now, and cancels any scheduled write.
+        The changes of a failed scheduled write are written too: if this
+        fails again, the exception is raised.
+        """
+        if self._write_timer is not None:
+            self._write_timer.cancel()
+            self._write_timer = None
+        self.write()
+        self._write_later_error = None
+
     @locked
     def _append_pending_changes(self):
         if threading.current_thread().daemon:
             raise Exception('daemon thread cannot write db')
-        if not self.pending_changes:
+        pending_changes = [x for x in self.pending_changes if x is not None]
+        if not pending_changes:
             self.logger.info('no pending changes')
+            self._clear_pending_changes()
             return
-        self.logger.info(f'appending {len(self.pending_changes)} pending changes')
-        s = ''.join([',\n' + x for x in self.pending_changes])
+        self.logger.info(
+            f'appending {len(pending_changes)} pending changes '
+            f'({len(self.pending_changes) - len(pending_changes)} coalesced)')
+        s = ''.join([',\n' + x for x in pending_changes])
         self.storage.append(s)
-        self.pending_changes = []
+        self.num_patches_written += len(pending_changes)
+        self._clear_pending_changes()
 
     @locked
     @profiler
@@ -418,5 +640,5 @@ class JsonDB(Logger):
             return
         json_str = self.dump(human_readable=not self.storage.is_encrypted())
         self.storage.write(json_str)
-        self.pending_changes = []
+        self._clear_pending_changes()
         self.set_modified(False)
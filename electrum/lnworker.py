@@ -1158,7 +1158,8 @@ class LNWallet(LNWorker):
         assert type(chan) is Channel
         if chan.config[REMOTE].next_per_commitment_point == chan.config[REMOTE].current_per_commitment_point:
             raise Exception("Tried to save channel with next_point == current_point, this should not happen")
-        self.wallet.save_db()
+        # channel state must be on disk before we act on it
+        self.wallet.flush_db()
         util.trigger_callback('channel', self.wallet, chan)
 
     def channel_by_txo(self, txo: str) -> Optional[AbstractChannel]:
@@ -1262,6 +1263,7 @@ class LNWallet(LNWorker):
             raise OnionRoutingFailure(code=OnionFailureCode.TEMPORARY_NODE_FAILURE, data=b'')
         # We have been paid and can broadcast
         # todo: if broadcasting raise an exception, we should try to rebroadcast
+        self.wallet.flush_db()
         await self.network.broadcast_transaction(funding_tx)
         htlc_key = serialize_htlc_key(next_chan.get_scid_or_local_alias(), htlc.htlc_id)
         return htlc_key
@@ -2202,7 +2204,7 @@ class LNWallet(LNWorker):
             raise Exception("tried to save incorrect preimage for payment_hash")
         self.preimages[payment_hash.hex()] = preimage.hex()
         if write_to_disk:
-            self.wallet.save_db()
+            self.wallet.flush_db()
 
     def get_preimage(self, payment_hash: bytes) -> Optional[bytes]:
         assert isinstance(payment_hash, bytes), f"expected bytes, but got {type(payment_hash)}"
@@ -2831,6 +2833,7 @@ class LNWallet(LNWorker):
         # note: as we are async, it can take a few event loop iterations between the caller
         #       "calling us" and us getting to run, and we only set the channel state now:
         tx = self._force_close_channel(chan_id)
+        self.wallet.flush_db()
         await self.network.broadcast_transaction(tx)
         return tx.txid()
 
@@ -54,10 +54,11 @@ from . import blockchain
 from . import bitcoin
 from . import dns_hacks
 from .transaction import Transaction
+from .tx_cache import TxCache
 from .blockchain import Blockchain, HEADER_SIZE
 from .interface import (Interface, PREFERRED_NETWORK_PROTOCOL,
                         RequestTimedOut, NetworkTimeout, BUCKET_NAME_OF_ONION_SERVERS,
-                        NetworkException, RequestCorrupted, ServerAddr)
+                        NetworkException, RequestCorrupted, ServerAddr, RequestStats)
 from .version import PROTOCOL_VERSION
 from .i18n import _
 from .logging import get_logger, Logger
@@ -338,6 +339,15 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.server_peers = {}  # returned by interface (servers that the main interface knows about)
         self._recent_servers = self._read_recent_servers()  # note: needs self.recent_servers_lock
 
+        # raw txs, shared by all wallets
+        tx_cache_path = os.path.join(self.config.path, 'tx_cache') if self.config.NETWORK_TX_CACHE_PERSIST else None
+        self.tx_cache = TxCache(
+            max_size=self.config.NETWORK_TX_CACHE_SIZE,
+            path=tx_cache_path,
+            max_disk_size=self.config.NETWORK_TX_CACHE_DISK_SIZE)
+        # requests sent to all servers since startup (each Interface also has its own)
+        self.request_stats = RequestStats()
+
         self.banner = ''
         self.donation_address = ''
         self.relay_fee = None  # type: Optional[int]
@@ -531,6 +541,67 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         with self.interfaces_lock:
             return list(self.interfaces)
 
+    def get_request_reuse_stats(self) -> Dict[str, int]:
+        """Returns the number of requests that were served by coalescing
+        or caching (hits), and the number sent to the servers (misses),
+        for the connected interfaces.
+        """
+        hits, misses = 0, 0
+        with self.interfaces_lock:
+            interfaces = list(self.interfaces.values())
+        for interface in interfaces:
+            if interface.session:
+                hits += interface.session.num_requests_reused
+                misses += interface.session.num_requests_sent
+        return {'hits': hits, 'misses': misses}
+
+    def get_request_concurrency_stats(self) -> Optional[dict]:
+        """Returns the adaptive request window of the main server,
+        and the recent request latencies (in seconds) at some percentiles.
+        """
+        interface = self.interface
+        if interface is None or interface.session is None:
+            return None
+        limiter = interface.session.request_limiter
+        percentiles = limiter.get_latency_percentiles((50, 90, 99))
+        return {
+            'window': limiter.window(),
+            'in_flight': limiter.num_in_flight(),
+            'timeouts': limiter.num_timeouts,
+            'latency_p50': percentiles[50],
+            'latency_p90': percentiles[90],
+            'latency_p99': percentiles[99],
+        }
+
+    def get_network_stats(self) -> dict:
+        """Returns per-method request stats (counts, latencies, response
+        sizes, errors and timeouts), for all servers since startup, and for
+        each connected server, the fetch stats of each connected server, and
+        the number of requests reused instead of sent.
+        """
+        with self.interfaces_lock:
+            interfaces = list(self.interfaces.values())
+        return {
+            'total': self.request_stats.to_dict(),
+            'servers': {str(interface.server): interface.request_stats.to_dict() for interface in interfaces},
+            'fetches': self.get_fetch_stats(),
+            'request_reuse': self.get_request_reuse_stats(),
+        }
+
+    def get_fetch_stats(self) -> Dict[str, dict]:
+        """Returns, for each connected server, the number of verifiable
+        items (txs, merkle proofs) fetched for wallets, and the throughput
+        in items per second. See NETWORK_PARALLEL_FETCH.
+        """
+        with self.interfaces_lock:
+            interfaces = list(self.interfaces.values())
+        return {
+            str(interface.server): {
+                'items': interface.num_items_fetched,
+                'items_per_second': interface.get_fetch_throughput(),
+            }
+            for interface in interfaces}
+
     def get_status(self):
         n = len(self.get_interfaces())
         return _("Connected to {0} nodes.").format(n) if n > 1 else _("Connected to {0} node.").format(n) if n == 1 else _("Not connected")
@@ -1211,9 +1282,17 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             raise RequestTimedOut()
         return await self.interface.request_chunk(height, tip=tip, can_return_early=can_return_early)
 
+    async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
+        raw_tx = self.tx_cache.get_raw_tx(tx_hash)
+        if raw_tx is not None:
+            return raw_tx
+        raw_tx = await self._get_transaction_from_server(tx_hash, timeout=timeout)
+        self.tx_cache.add(Transaction(raw_tx), confirmed=False)
+        return raw_tx
+
     @best_effort_reliable
     @catch_server_exceptions
-    async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
+    async def _get_transaction_from_server(self, tx_hash: str, *, timeout=None) -> str:
         if self.interface is None:  # handled by best_effort_reliable
             raise RequestTimedOut()
         return await self.interface.get_transaction(tx_hash=tx_hash, timeout=timeout)
@@ -1376,7 +1455,9 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.interfaces = {}
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
-        if not full_shutdown:
+        if full_shutdown:
+            self.tx_cache.close()
+        else:
             util.trigger_callback('network_updated')
 
     async def _ensure_there_is_a_main_interface(self):
@@ -0,0 +1,173 @@
+# Copyright (C) 2024 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+# Append-only store of raw transactions, kept in a file next to the wallet
+# file (wallet_path + '.txs'). This keeps the bulk of the wallet history
+# out of the json wallet file.
+#
+# File format:
+#   magic (4 bytes) || version (1 byte) || record*
+#   record: txid (32 bytes) || len(raw_tx) (uint32, LE) || raw_tx
+#
+# The file is memory-mapped for reading. An in-memory index maps txids
+# to offsets; it is built when the file is opened, by walking record
+# headers (without parsing transactions).
+
+import os
+import mmap
+import struct
+import threading
+from typing import Optional, Iterable, Sequence, List
+
+from .logging import Logger
+from .transaction import Transaction
+from .util import LRUCache, os_chmod
+
+
+MAGIC = b'ELTX'
+VERSION = 1
+HEADER_LEN = len(MAGIC) + 1
+RECORD_HEADER_LEN = 32 + 4
+
+
+def get_raw_tx_store_path(wallet_path: str) -> str:
+    return wallet_path + '.txs'
+
+
+class RawTxStore(Logger):
+
+    def __init__(self, path: str, *, cache_size: int = 1000):
+        Logger.__init__(self)
+        self.path = path
+        self.lock = threading.RLock()
+        self._index = {}  # type: Dict[bytes, Tuple[int, int]]  # txid -> (offset, length)
+        self._mmap = None  # type: Optional[mmap.mmap]
+        self._mapped_size = 0
+        self._tx_cache = LRUCache(maxsize=cache_size)  # type: LRUCache[str, Transaction]
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                os_chmod(path, 0o600)
+                f.write(MAGIC + bytes([VERSION]))
+        self._file = open(path, 'rb+')
+        self._load_index()
+
+    @classmethod
+    def exists_for(cls, wallet_path: str) -> bool:
+        return os.path.exists(get_raw_tx_store_path(wallet_path))
+
+    def _remap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._mapped_size = os.fstat(self._file.fileno()).st_size
+        if self._mapped_size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load_index(self) -> None:
+        self._remap()
+        if self._mmap is None or self._mmap[:HEADER_LEN] != MAGIC + bytes([VERSION]):
+            raise Exception(f"unexpected header in raw tx store: {self.path}")
+        pos = HEADER_LEN
+        size = self._mapped_size
+        while pos + RECORD_HEADER_LEN <= size:
+            txid = self._mmap[pos:pos+32]
+            length, = struct.unpack_from('<I', self._mmap, pos + 32)
+            if pos + RECORD_HEADER_LEN + length > size:
+                break
+            self._index[txid] = (pos + RECORD_HEADER_LEN, length)
+            pos += RECORD_HEADER_LEN + length
+        if pos != size:
+            # the last append was interrupted
+            self.logger.info(f"truncating incomplete record at {pos}")
+            self._file.truncate(pos)
+            self._remap()
+
+    def __contains__(self, txid: str) -> bool:
+        return bytes.fromhex(txid) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def txids(self) -> List[str]:
+        """Returns the txids in the store, in the order they were added."""
+        with self.lock:
+            return [txid_bytes.hex() for txid_bytes in self._index]
+
+    def add(self, txid: str, raw_tx: bytes) -> None:
+        """Appends a tx. Data is only guaranteed to be on disk after flush()."""
+        txid_bytes = bytes.fromhex(txid)
+        assert len(txid_bytes) == 32
+        with self.lock:
+            if txid_bytes in self._index:
+                return
+            pos = self._file.seek(0, os.SEEK_END)
+            self._file.write(txid_bytes + struct.pack('<I', len(raw_tx)) + raw_tx)
+            self._index[txid_bytes] = (pos + RECORD_HEADER_LEN, len(raw_tx))
+
+    def get_transaction(self, txid: str) -> Optional[Transaction]:
+        txid_bytes = bytes.fromhex(txid)
+        with self.lock:
+            tx = self._tx_cache.get(txid)
+            if tx is not None:
+                return tx
+            if txid_bytes not in self._index:
+                return None
+            offset, length = self._index[txid_bytes]
+            if offset + length > self._mapped_size:
+                self._file.flush()
+                self._remap()
+            with memoryview(self._mmap) as buf:
+                with buf[offset:offset+length] as raw_tx:
+                    # the tx is deserialized lazily
+                    tx = Transaction(raw_tx)
+            self._tx_cache[txid] = tx
+            return tx
+
+    def flush(self) -> None:
+        with self.lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def compact_if_needed(self, txids: Sequence[str]) -> None:
+        """Compacts the file if more than half of it is used by txs not in txids."""
+        with self.lock:
+            self._file.flush()
+            used = sum(self._index[x][1] + RECORD_HEADER_LEN
+                       for x in map(bytes.fromhex, txids) if x in self._index)
+            garbage = os.fstat(self._file.fileno()).st_size - HEADER_LEN - used
+            if garbage > used:
+                self.compact(txids)
+
+    def compact(self, txids: Iterable[str]) -> None:
+        """Rewrites the file, keeping only txids."""
+        with self.lock:
+            self._file.flush()
+            self._remap()
+            temp_path = self.path + '.tmp'
+            index = {}
+            with open(temp_path, 'wb') as f:
+                os_chmod(temp_path, 0o600)
+                f.write(MAGIC + bytes([VERSION]))
+                for txid_bytes in map(bytes.fromhex, txids):
+                    if txid_bytes not in self._index:
+                        continue
+                    offset, length = self._index[txid_bytes]
+                    index[txid_bytes] = (f.tell() + RECORD_HEADER_LEN, length)
+                    f.write(txid_bytes + struct.pack('<I', length))
+                    f.write(self._mmap[offset:offset+length])
+                f.flush()
+                os.fsync(f.fileno())
+            self.close()
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, 'rb+')
+            self._index = index
+            self._remap()
+            self.logger.info(f"compacted raw tx store. {len(index)} txs")
+
+    def close(self) -> None:
+        with self.lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# Benchmark: header catch-up with several outstanding chunk requests.
+#
+# The mock server (see mock_server.py) serves a chain of synthetic regtest
+# headers, and injects latency before each response (as over Tor). The
+# headers are then synced with Interface.sync_until, for several values of
+# NETWORK_MAX_OUTSTANDING_CHUNKS:
+#   bench_header_sync.py [num_chunks] [latency_ms]
+
+import asyncio
+import sys
+import tempfile
+import time
+
+import aiorpcx
+
+from electrum import constants, blockchain, util
+from electrum.interface import Interface, NotificationSession, RequestStats, ServerAddr
+from electrum.simple_config import SimpleConfig
+from electrum.util import OldTaskGroup, make_dir
+
+from mock_server import MockChain, MockElectrumServer
+
+
+class BenchNetwork:
+
+    def __init__(self, config: SimpleConfig):
+        self.config = config
+        self.asyncio_loop = asyncio.get_running_loop()
+        self.taskgroup = OldTaskGroup()
+        self.request_stats = RequestStats()
+        self.interfaces = {}
+        self.debug = False
+
+
+class BenchInterface(Interface):
+
+    async def run(self):
+        return
+
+
+async def time_sync(port: int, tip: int, max_outstanding: int) -> float:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = SimpleConfig({'electrum_path': tmpdir, 'regtest': True})
+        config.NETWORK_MAX_OUTSTANDING_CHUNKS = max_outstanding
+        make_dir(config.path)
+        blockchain.blockchains = {}
+        blockchain.read_blockchains(config)
+        blockchain.init_headers_file_for_best_chain()
+        interface = BenchInterface(network=BenchNetwork(config),
+                                   server=ServerAddr('localhost', port, protocol='t'), proxy=None)
+        interface.blockchain = blockchain.get_best_chain()
+        session_factory = lambda *args, **kwargs: NotificationSession(*args, interface=interface, **kwargs)
+        async with aiorpcx.connect_rs('localhost', port, session_factory=session_factory) as session:
+            interface.session = session
+            t0 = time.perf_counter()
+            await interface.sync_until(0, next_height=tip)
+            t1 = time.perf_counter()
+        assert interface.blockchain.height() == tip
+        return t1 - t0
+
+
+async def main():
+    util.AS_LIB_USER_I_WANT_TO_MANAGE_MY_OWN_ASYNCIO_LOOP = True
+    constants.BitcoinRegtest.set_as_network()
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = int(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.2
+    tip = num_chunks * 2016 - 1
+    server = MockElectrumServer(MockChain(num_blocks=tip), latency=latency)
+    port = server.start()
+    print(f"{num_chunks} chunks, {1000 * latency:.0f} ms latency")
+    try:
+        baseline = None
+        for max_outstanding in (1, 2, 4, 8):
+            dt = await time_sync(port, tip, max_outstanding)
+            baseline = baseline or dt
+            print(f"{max_outstanding} outstanding: {dt:8.3f} s  ({num_chunks / dt:6.1f} chunks/s, {baseline / dt:4.1f}x)")
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    asyncio.run(main())
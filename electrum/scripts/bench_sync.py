@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# Benchmark: wallet sync against a local mock server (see mock_server.py).
+#
+# For each wallet size, a watching-only wallet of imported addresses is
+# synced from scratch: headers, address histories, transactions and
+# merkle proofs. Reported, as JSON:
+#  - the time it took until the wallet was up to date,
+#  - the number of requests per method, as sent by the client,
+#  - the CPU time of the client (the network thread), of the mock server,
+#    and of the main client components (Synchronizer, SPV,
+#    AddressSynchronizer, header verification).
+# Each size runs in a subprocess of its own (the Network is a singleton).
+#
+# usage: bench_sync.py [--latency=ms] [num_txs ...]   (default: 1000 10000 100000)
+
+import asyncio
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from electrum import constants, util, blockchain, synchronizer, verifier
+from electrum.address_synchronizer import AddressSynchronizer
+from electrum.network import Network
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import Synchronizer
+from electrum.wallet import restore_wallet_from_text
+
+from mock_server import MockChain, MockElectrumServer
+
+
+TXS_PER_ADDRESS = 10
+TIMEOUT = 3600  # seconds
+
+
+class ComponentTimer:
+    """Accumulates the CPU time spent in some (synchronous) functions, per
+    component. The time spent in a timed function called from another one
+    is only counted for the inner one.
+    """
+
+    def __init__(self):
+        self.cpu_times = defaultdict(float)
+        self._stack = []
+
+    def wrap(self, owner, name: str, component: str) -> None:
+        func = getattr(owner, name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.thread_time()
+            self._stack.append(0.0)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                inner = self._stack.pop()
+                elapsed = time.thread_time() - start
+                self.cpu_times[component] += elapsed - inner
+                if self._stack:
+                    self._stack[-1] += elapsed
+        setattr(owner, name, wrapper)
+
+
+def run(num_txs: int, latency: float) -> dict:
+    util.AS_LIB_USER_I_WANT_TO_MANAGE_MY_OWN_ASYNCIO_LOOP = False
+    constants.BitcoinRegtest.set_as_network()
+    num_addresses = max(1, num_txs // TXS_PER_ADDRESS)
+    t0 = time.perf_counter()
+    chain = MockChain(num_txs=num_txs, num_addresses=num_addresses)
+    server = MockElectrumServer(chain, latency=latency)
+    port = server.start()
+    setup_time = time.perf_counter() - t0
+
+    timer = ComponentTimer()
+    timer.wrap(synchronizer, 'history_status', 'synchronizer')
+    timer.wrap(Synchronizer, '_receive_tx', 'synchronizer')
+    timer.wrap(verifier, 'verify_tx_is_in_block', 'spv')
+    timer.wrap(AddressSynchronizer, 'receive_history_callback', 'address_synchronizer')
+    timer.wrap(AddressSynchronizer, 'receive_tx_callback', 'address_synchronizer')
+    timer.wrap(AddressSynchronizer, 'add_verified_tx', 'address_synchronizer')
+    timer.wrap(blockchain.Blockchain, 'connect_chunk', 'headers')
+    timer.wrap(blockchain.Blockchain, 'connect_headers', 'headers')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = SimpleConfig({
+            'electrum_path': tmpdir,
+            'regtest': True,
+            'server': f'localhost:{port}:t',
+            'oneserver': True,
+            'auto_connect': False,
+        })
+        loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+        d = restore_wallet_from_text(' '.join(chain.addresses), path=None, config=config)
+        wallet = d['wallet']
+
+        async def get_thread_time():
+            return time.thread_time()
+
+        def network_thread_time():
+            return asyncio.run_coroutine_threadsafe(get_thread_time(), loop).result()
+
+        network = Network(config)
+        cpu0 = network_thread_time()
+        t0 = time.perf_counter()
+        network.start()
+        wallet.start_network(network)
+        while not (wallet.is_up_to_date()
+                   and len(wallet.adb.db.list_verified_tx()) == num_txs):
+            if time.perf_counter() - t0 > TIMEOUT:
+                raise Exception(f'timeout: wallet not synced after {TIMEOUT} seconds')
+            time.sleep(0.01)
+        sync_time = time.perf_counter() - t0
+        client_cpu_time = network_thread_time() - cpu0
+        requests = {method: stats['count'] for method, stats in network.get_network_stats()['total'].items()}
+
+        asyncio.run_coroutine_threadsafe(wallet.stop(), loop).result()
+        asyncio.run_coroutine_threadsafe(network.stop(), loop).result()
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=10)
+    server.stop()
+    return {
+        'num_txs': num_txs,
+        'num_addresses': num_addresses,
+        'num_headers': chain.height + 1,
+        'latency': latency,
+        'setup_time': setup_time,
+        'sync_time': sync_time,
+        'requests': requests,
+        'num_requests': sum(requests.values()),
+        'server_requests': dict(server.request_counts),
+        'cpu_time': {
+            'client': client_cpu_time,
+            'server': server.cpu_time,
+            'components': dict(timer.cpu_times),
+        },
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    latency = 0.0
+    if args and args[0].startswith('--latency='):
+        latency = int(args.pop(0).split('=', 1)[1]) / 1000
+    if args and args[0] == '--run':
+        print(json.dumps(run(int(args[1]), latency)))
+        return
+    sizes = [int(x) for x in args] or [1000, 10000, 100000]
+    results = []
+    for num_txs in sizes:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), f'--latency={int(latency * 1000)}', '--run', str(num_txs)],
+            check=True, stdout=subprocess.PIPE, text=True)
+        results.append(json.loads(out.stdout.splitlines()[-1]))
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Benchmark: verification of 2016-header chunks, per header vs on raw bytes.
+#
+# With an electrum data dir that has a synced mainnet headers file,
+# the chunks in that file (after the checkpoints) are verified:
+#   bench_verify_chunk.py ~/.electrum
+#   bench_verify_chunk.py --testnet ~/.electrum
+# Otherwise, a chain of synthetic headers is built on top of the last
+# mainnet checkpoint. These are mined, at a low target that is used
+# instead of the one computed by get_target, so that all the mainnet
+# checks (bits and proof of work) are done:
+#   bench_verify_chunk.py [num_chunks]
+
+import os
+import sys
+import tempfile
+import time
+
+from electrum import constants, blockchain
+from electrum.blockchain import HEADER_SIZE, Blockchain, serialize_header, hash_header
+from electrum.simple_config import SimpleConfig
+from electrum.util import make_dir
+
+
+SYNTHETIC_BITS = 0x207fffff
+
+
+def time_verify(chain: blockchain.Blockchain, index: int, data: bytes):
+    t0 = time.perf_counter()
+    chain._verify_chunk_by_header(index, data)
+    t1 = time.perf_counter()
+    assert chain._verify_chunk_raw(index, data)
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def synthetic_chunk(prev_hash: str, index: int) -> bytes:
+    target = Blockchain.bits_to_target(SYNTHETIC_BITS)
+    headers = []
+    for i in range(2016):
+        header = {
+            'version': 0x20000000,
+            'prev_block_hash': prev_hash,
+            'merkle_root': os.urandom(32).hex(),
+            'timestamp': 1_700_000_000 + 600 * (index * 2016 + i),
+            'bits': SYNTHETIC_BITS,
+            'nonce': 0,
+        }
+        while int(hash_header(header), 16) > target:
+            header['nonce'] += 1
+        headers.append(serialize_header(header))
+        prev_hash = hash_header(header)
+    return b''.join(headers)
+
+
+def main():
+    args = sys.argv[1:]
+    testnet = '--testnet' in args
+    args = [x for x in args if x != '--testnet']
+    if testnet:
+        constants.BitcoinTestnet.set_as_network()
+    arg = args[0] if args else None
+    results = []
+    if arg is not None and os.path.isdir(arg):
+        config = SimpleConfig({'electrum_path': arg, 'testnet': testnet})
+        blockchain.read_blockchains(config)
+        chain = blockchain.get_best_chain()
+        with open(chain.path(), 'rb') as f:
+            for index in range(len(constants.net.CHECKPOINTS), (chain.height() + 1) // 2016):
+                f.seek(index * 2016 * HEADER_SIZE)
+                results.append(time_verify(chain, index, f.read(2016 * HEADER_SIZE)))
+    else:
+        num_chunks = int(arg) if arg is not None else 20
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = SimpleConfig({'electrum_path': tmpdir, 'testnet': testnet})
+            make_dir(config.path)
+            blockchain.read_blockchains(config)
+            blockchain.init_headers_file_for_best_chain()
+            chain = blockchain.get_best_chain()
+            chain.get_target = lambda index: Blockchain.bits_to_target(SYNTHETIC_BITS)
+            start = len(constants.net.CHECKPOINTS)
+            print(f"mining {num_chunks} chunks...")
+            for index in range(start, start + num_chunks):
+                data = synthetic_chunk(chain.get_hash(index * 2016 - 1), index)
+                results.append(time_verify(chain, index, data))
+                chain.save_chunk(index, data)
+    if not results:
+        print("no chunks to verify")
+        return
+    per_header = sum(x[0] for x in results)
+    raw = sum(x[1] for x in results)
+    print(f"{constants.net.NET_NAME}: {len(results)} chunks")
+    print(f"per header: {per_header:8.3f} s  ({1000 * per_header / len(results):.2f} ms/chunk)")
+    print(f"raw bytes:  {raw:8.3f} s  ({1000 * raw / len(results):.2f} ms/chunk)")
+    print(f"speedup:    {per_header / raw:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+#
+# Benchmark: time it takes to open a large wallet file and compute its balance.
+#
+# A synthetic wallet is created in a temporary directory, with many
+# transactions and closed lightning channels. It is then re-opened the
+# way the daemon opens wallets, and the time of each step is printed.
+#
+# usage: bench_wallet_open.py [num_txs] [num_channels]
+
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import time
+
+from electrum.simple_config import SimpleConfig
+from electrum.storage import WalletStorage
+from electrum.wallet import restore_wallet_from_text, Wallet
+from electrum.wallet_db import WalletDB
+from electrum.util import create_and_start_event_loop
+
+
+SEED = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+RAW_TX = "02000000000101a97a9ae7fb1a9220fdd170a974987ac24631dcff89b60fa4907c78c3639994db0000000000fdffffff0210270000000000001976a914ea7804a2c266063572cc009a63dc25dcc0e9d9b588ac20491e0000000000160014b8e4fdc91593b67de2bf214694ef47e38dc2ee8e02473044022005326882904906cfa9c1de75333ace1019596f2ab25d21118220d037dfc0e48b02207d0b3f075cfe5e1e0247ff3cdd7155dc05e7459daf1bfa0ea02e9112b9151ec90121026cc6a74c2b0e38661d341ffae48fe7dde5196ca4afe95d28b496673fa4cf646700000000"
+
+
+def fake_hash(*args) -> str:
+    return hashlib.sha256(repr(args).encode()).hexdigest()
+
+
+def closed_channel(i: int, num_htlcs: int = 100) -> dict:
+    def side():
+        return {
+            'adds': {
+                str(n): [1000 * n, fake_hash(i, n), 800_000 + n, n, 1_700_000_000 + n]
+                for n in range(num_htlcs)},
+            'locked_in': {str(n): {'1': n + 1, '-1': n + 1} for n in range(num_htlcs)},
+            'settles': {str(n): {'1': n + 2, '-1': n + 2} for n in range(num_htlcs)},
+            'fails': {},
+            'fee_updates': {'0': {'rate': 2500, 'ctn_local': 0, 'ctn_remote': 0}},
+            'revack_pending': False,
+            'next_htlc_id': num_htlcs,
+            'ctn': num_htlcs + 2,
+        }
+    config = {
+        'payment_basepoint': {'pubkey': '02' + fake_hash(i, 'p')},
+        'multisig_key': {'pubkey': '02' + fake_hash(i, 'm')},
+        'htlc_basepoint': {'pubkey': '02' + fake_hash(i, 'h')},
+        'delayed_basepoint': {'pubkey': '02' + fake_hash(i, 'd')},
+        'revocation_basepoint': {'pubkey': '02' + fake_hash(i, 'r')},
+        'to_self_delay': 144,
+        'dust_limit_sat': 546,
+        'max_htlc_value_in_flight_msat': 10**10,
+        'max_accepted_htlcs': 30,
+        'initial_msat': 10**9,
+        'reserve_sat': 10000,
+        'htlc_minimum_msat': 1,
+        'upfront_shutdown_script': '',
+        'announcement_node_sig': '',
+        'announcement_bitcoin_sig': '',
+    }
+    log = {'1': side(), '-1': side()}
+    log['1'].update({'unacked_updates': {}, 'was_revoke_last': False})
+    return {
+        'channel_id': fake_hash(i, 'c'),
+        'short_channel_id': fake_hash(i, 's')[:16],
+        'funding_outpoint': {'txid': fake_hash(i, 'f'), 'output_index': 0},
+        'local_config': dict(
+            config, channel_seed=fake_hash(i, 'seed'), funding_locked_received=True,
+            current_commitment_signature=None, current_htlc_signatures='',
+            per_commitment_secret_seed=fake_hash(i, 'pcs')),
+        'remote_config': dict(
+            config, next_per_commitment_point='02' + fake_hash(i, 'n'),
+            current_per_commitment_point='02' + fake_hash(i, 'cur')),
+        'constraints': {'flags': 0, 'capacity': 2 * 10**6, 'is_initiator': True, 'funding_txn_minimum_depth': 3},
+        'node_id': '02' + fake_hash(i, 'node'),
+        'onion_keys': {},
+        'data_loss_protect_remote_pcp': {str(n): fake_hash(i, 'dlp', n) for n in range(num_htlcs)},
+        'state': 'REDEEMED',
+        'log': log,
+        'unfulfilled_htlcs': {},
+        'revocation_store': {
+            'index': 2**48 - num_htlcs,
+            'buckets': {str(n): [fake_hash(i, 'b', n), 2**48 - n] for n in range(49)},
+        },
+        'channel_type': 4096,
+    }
+
+
+def create_wallet(path: str, config: SimpleConfig, num_txs: int, num_channels: int) -> None:
+    d = restore_wallet_from_text(SEED, path=path, config=config, gap_limit=20)
+    addresses = d['wallet'].get_receiving_addresses()
+    with open(path, 'r') as f:
+        data = json.load(f)
+    transactions, txo, addr_history, verified_tx = {}, {}, {}, {}
+    for i in range(num_txs):
+        txid = fake_hash(i)
+        addr = addresses[i % len(addresses)]
+        transactions[txid] = RAW_TX
+        txo[txid] = {addr: {'0': [1000 + i, False]}}
+        addr_history.setdefault(addr, []).append([txid, 100 + i])
+        verified_tx[txid] = [100 + i, 1_500_000_000 + i, 1, fake_hash(i, 'header')]
+    data.update({
+        'transactions': transactions,
+        'txo': txo,
+        'txi': {},
+        'spent_outpoints': {},
+        'addr_history': addr_history,
+        'verified_tx3': verified_tx,
+        'channels': {x['channel_id']: x for x in map(closed_channel, range(num_channels))},
+    })
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = SimpleConfig({'electrum_path': tmpdir})
+            path = os.path.join(tmpdir, 'wallet')
+            create_wallet(path, config, num_txs, num_channels)
+            print(f"wallet file: {os.path.getsize(path) / 1e6:.1f} MB, {num_txs} txs, {num_channels} channels")
+
+            t0 = time.perf_counter()
+            storage = WalletStorage(path)
+            s = storage.read()
+            t1 = time.perf_counter()
+            db = WalletDB(s, storage=storage)
+            t2 = time.perf_counter()
+            wallet = Wallet(db, config=config)
+            t3 = time.perf_counter()
+            balance = wallet.get_balance()
+            t4 = time.perf_counter()
+            print(f"read file:     {t1 - t0:8.3f} s")
+            print(f"load db:       {t2 - t1:8.3f} s")
+            print(f"init wallet:   {t3 - t2:8.3f} s")
+            print(f"get_balance:   {t4 - t3:8.3f} s  {balance}")
+            print(f"first balance: {t4 - t0:8.3f} s")
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+#
+# A local stand-in for an Electrum server, used by the benchmarks.
+#
+# MockChain generates a synthetic regtest chain: headers, and wallet
+# transactions paying to (and spending from) a set of addresses, with
+# their histories and merkle proofs. MockElectrumServer serves it over
+# the Electrum protocol, with aiorpcx (like interface.py), from a thread
+# of its own, optionally adding latency before each response.
+#
+# Standalone, it serves a chain until interrupted:
+#   mock_server.py [num_txs] [num_addresses] [latency_ms]
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional, Sequence
+
+import aiorpcx
+from aiorpcx import RPCSession, RPCError, JSONRPC
+
+from electrum import constants, version
+from electrum.bitcoin import hash_to_segwit_addr, script_to_scripthash, hash_encode, hash_decode
+from electrum.blockchain import HEADER_SIZE, serialize_header, hash_header
+from electrum.crypto import sha256d
+from electrum.synchronizer import history_status
+
+
+REGTEST_GENESIS_HEADER = {
+    'version': 1,
+    'prev_block_hash': '00' * 32,
+    'merkle_root': '4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b',
+    'timestamp': 1296688602,
+    'bits': 0x207fffff,
+    'nonce': 2,
+}
+
+
+def _var_int(i: int) -> bytes:
+    assert i < 0xfd
+    return bytes([i])
+
+
+def _serialize_tx(prevout_hash: str, prevout_n: int, value: int, script: bytes) -> bytes:
+    return b''.join([
+        (2).to_bytes(4, 'little'),                  # version
+        _var_int(1),                                # one input
+        hash_decode(prevout_hash), prevout_n.to_bytes(4, 'little'),
+        _var_int(0),                                # empty scriptSig
+        b'\xfd\xff\xff\xff',                        # nSequence
+        _var_int(1),                                # one output
+        value.to_bytes(8, 'little'),
+        _var_int(len(script)), script,
+        (0).to_bytes(4, 'little'),                  # nLocktime
+    ])
+
+
+def _merkle_levels(tx_hashes: Sequence[str]) -> List[List[bytes]]:
+    level = [hash_decode(tx_hash) for tx_hash in tx_hashes]
+    levels = [level]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        level = [sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+class MockChain:
+    """A synthetic regtest chain, with num_txs wallet transactions.
+
+    Transaction i pays to address i % num_addresses, and spends the output
+    of the previous transaction of that address. Blocks contain
+    txs_per_block transactions each. The chain is fully determined by seed.
+    """
+
+    def __init__(self, *, num_txs: int = 0, num_addresses: int = 1, txs_per_block: int = 100,
+                 num_blocks: Optional[int] = None, seed: int = 0):
+        assert hash_header(REGTEST_GENESIS_HEADER) == constants.BitcoinRegtest.GENESIS
+        rnd = random.Random(seed)
+        scripts = []
+        self.addresses = []  # type: List[str]
+        for i in range(num_addresses):
+            h = rnd.randbytes(20)
+            self.addresses.append(hash_to_segwit_addr(h, witver=0, net=constants.BitcoinRegtest))
+            scripts.append(bytes([0, 20]) + h)
+        scripthashes = [script_to_scripthash(script) for script in scripts]
+        if num_blocks is None:
+            num_blocks = (num_txs + txs_per_block - 1) // txs_per_block + 10
+        assert num_txs <= num_blocks * txs_per_block
+        # transactions
+        self.txs = {}  # type: Dict[str, bytes]  # txid -> raw tx
+        self.block_txs = [[] for _ in range(num_blocks + 1)]  # type: List[List[str]]
+        self.tx_positions = {}  # type: Dict[str, Tuple[int, int]]  # txid -> (height, pos)
+        histories = defaultdict(list)  # type: Dict[str, List[Tuple[str, int]]]
+        txids = []
+        for i in range(num_txs):
+            height = 1 + i // txs_per_block
+            a = i % num_addresses
+            prevout_hash = txids[i - num_addresses] if i >= num_addresses else rnd.randbytes(32).hex()
+            raw_tx = _serialize_tx(prevout_hash, 0, 100_000 + i, scripts[a])
+            txid = hash_encode(sha256d(raw_tx))
+            txids.append(txid)
+            self.txs[txid] = raw_tx
+            self.tx_positions[txid] = (height, len(self.block_txs[height]))
+            self.block_txs[height].append(txid)
+            histories[scripthashes[a]].append((txid, height))
+        self.histories = dict(histories)
+        self.statuses = {sh: history_status(h) for sh, h in self.histories.items()}
+        # headers
+        self._merkle_cache = {}  # type: Dict[int, List[List[bytes]]]
+        headers = [serialize_header(REGTEST_GENESIS_HEADER)]
+        prev_hash = constants.BitcoinRegtest.GENESIS
+        for height in range(1, num_blocks + 1):
+            if self.block_txs[height]:
+                merkle_root = hash_encode(self._get_merkle_levels(height)[-1][0])
+            else:
+                merkle_root = rnd.randbytes(32).hex()
+            header = {
+                'version': 0x20000000,
+                'prev_block_hash': prev_hash,
+                'merkle_root': merkle_root,
+                'timestamp': REGTEST_GENESIS_HEADER['timestamp'] + 600 * height,
+                'bits': 0x207fffff,
+                'nonce': height,
+            }
+            headers.append(serialize_header(header))
+            prev_hash = hash_header(header)
+        self.headers = b''.join(headers)
+        self.height = num_blocks
+
+    def _get_merkle_levels(self, height: int) -> List[List[bytes]]:
+        levels = self._merkle_cache.get(height)
+        if levels is None:
+            levels = self._merkle_cache[height] = _merkle_levels(self.block_txs[height])
+        return levels
+
+    def get_header(self, height: int) -> bytes:
+        return self.headers[height * HEADER_SIZE:(height + 1) * HEADER_SIZE]
+
+    def get_merkle(self, txid: str) -> dict:
+        height, pos = self.tx_positions[txid]
+        branch = []
+        index = pos
+        for level in self._get_merkle_levels(height)[:-1]:
+            sibling = index ^ 1
+            branch.append(hash_encode(level[sibling] if sibling < len(level) else level[index]))
+            index >>= 1
+        return {'block_height': height, 'merkle': branch, 'pos': pos}
+
+
+class MockServerSession(RPCSession):
+
+    initial_concurrent = 1000  # requests handled at once
+
+    def __init__(self, *args, server: 'MockElectrumServer', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server
+        self.cost_hard_limit = 0  # disable aiorpcx resource limits
+
+    async def handle_request(self, request):
+        self.server.request_counts[request.method] += 1
+        handler = self.server.handlers.get(request.method)
+        if handler is None:
+            raise RPCError(JSONRPC.METHOD_NOT_FOUND, f'unknown method {request.method!r}')
+        if self.server.latency:
+            await asyncio.sleep(self.server.latency)
+        return handler(*request.args)
+
+
+class MockElectrumServer:
+    """Serves a MockChain on localhost, from its own thread and event loop."""
+
+    def __init__(self, chain: MockChain, *, latency: float = 0.0):
+        self.chain = chain
+        self.latency = latency
+        self.port = None  # type: Optional[int]
+        self.request_counts = defaultdict(int)  # type: Dict[str, int]
+        self.cpu_time = 0.0  # of the server thread, once stopped
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._thread = None  # type: Optional[threading.Thread]
+        self.handlers = {
+            'server.version': lambda client_name=None, protocol_version=None: ['MockElectrumServer', version.PROTOCOL_VERSION],
+            'server.ping': lambda: None,
+            'server.banner': lambda: '',
+            'server.donation_address': lambda: '',
+            'server.peers.subscribe': lambda: [],
+            'server.features': lambda: {},
+            'blockchain.relayfee': lambda: 0.00001,
+            'blockchain.estimatefee': lambda number: -1,
+            'mempool.get_fee_histogram': lambda: [],
+            'blockchain.headers.subscribe': self._headers_subscribe,
+            'blockchain.block.header': self._block_header,
+            'blockchain.block.headers': self._block_headers,
+            'blockchain.scripthash.subscribe': lambda sh: chain.statuses.get(sh),
+            'blockchain.scripthash.get_history': self._get_history,
+            'blockchain.transaction.get': self._transaction_get,
+            'blockchain.transaction.get_merkle': self._get_merkle,
+        }
+
+    def _headers_subscribe(self):
+        return {'hex': self.chain.get_header(self.chain.height).hex(), 'height': self.chain.height}
+
+    def _block_header(self, height, cp_height=0):
+        if not 0 <= height <= self.chain.height:
+            raise RPCError(1, f'height {height} out of range')
+        return self.chain.get_header(height).hex()
+
+    def _block_headers(self, start_height, count, cp_height=0):
+        count = max(0, min(count, 2016, self.chain.height + 1 - start_height))
+        hexdata = self.chain.headers[start_height * HEADER_SIZE:(start_height + count) * HEADER_SIZE].hex()
+        return {'hex': hexdata, 'count': count, 'max': 2016}
+
+    def _get_history(self, sh):
+        return [{'tx_hash': txid, 'height': height} for txid, height in self.chain.histories.get(sh, [])]
+
+    def _transaction_get(self, txid, verbose=False):
+        raw_tx = self.chain.txs.get(txid)
+        if raw_tx is None:
+            raise RPCError(2, f'unknown transaction {txid}')
+        return raw_tx.hex()
+
+    def _get_merkle(self, txid, height):
+        if txid not in self.chain.tx_positions:
+            raise RPCError(2, f'unknown transaction {txid}')
+        return self.chain.get_merkle(txid)
+
+    def start(self) -> int:
+        """Starts serving, and returns the port."""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name='MockElectrumServer', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def _run(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        session_factory = lambda *args, **kwargs: MockServerSession(*args, server=self, **kwargs)
+        server = self._loop.run_until_complete(aiorpcx.serve_rs(session_factory, 'localhost', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            self._loop.run_until_complete(server.wait_closed())
+            self.cpu_time = time.thread_time()
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_addresses = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, num_txs // 10)
+    latency = int(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0
+    constants.BitcoinRegtest.set_as_network()
+    chain = MockChain(num_txs=num_txs, num_addresses=num_addresses)
+    server = MockElectrumServer(chain, latency=latency)
+    port = server.start()
+    print(f"serving {num_txs} txs, {chain.height} blocks on localhost:{port}:t (regtest)")
+    print(f"wallet addresses: {' '.join(chain.addresses[:5])} ...")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
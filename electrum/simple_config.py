@@ -944,6 +944,12 @@ class SimpleConfig(Logger):
     NETWORK_SERVERFINGERPRINT = ConfigVar('serverfingerprint', default=None, type_=str)
     NETWORK_MAX_INCOMING_MSG_SIZE = ConfigVar('network_max_incoming_msg_size', default=1_000_000, type_=int)  # in bytes
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    NETWORK_REQUEST_BATCH_SIZE = ConfigVar('network_request_batch_size', default=50, type_=int)
+    NETWORK_PARALLEL_FETCH = ConfigVar('network_parallel_fetch', default=False, type_=bool)
+    NETWORK_MAX_OUTSTANDING_CHUNKS = ConfigVar('network_max_outstanding_chunks', default=4, type_=int)
+    NETWORK_TX_CACHE_SIZE = ConfigVar('network_tx_cache_size', default=20_000_000, type_=int)  # in bytes
+    NETWORK_TX_CACHE_PERSIST = ConfigVar('network_tx_cache_persist', default=False, type_=bool)
+    NETWORK_TX_CACHE_DISK_SIZE = ConfigVar('network_tx_cache_disk_size', default=200_000_000, type_=int)  # in bytes
     NETWORK_BOOKMARKED_SERVERS = ConfigVar('network_bookmarked_servers', default=None)
 
     WALLET_BATCH_RBF = ConfigVar(
@@ -985,6 +991,15 @@ class SimpleConfig(Logger):
     )
     WALLET_PAYREQ_EXPIRY_SECONDS = ConfigVar('request_expiry', default=invoices.PR_DEFAULT_EXPIRATION_WHEN_CREATING, type_=int)
     WALLET_USE_SINGLE_PASSWORD = ConfigVar('single_password', default=False, type_=bool)
+    # if > 0, wallet saves are written to disk in the background, at most once per this many seconds
+    WALLET_DB_WRITE_BEHIND_DELAY = ConfigVar('wallet_db_write_behind_delay', default=0, type_=float)
+    # keep raw transactions in a binary file next to the wallet file (not for wallets with storage encryption)
+    WALLET_USE_RAW_TX_STORE = ConfigVar('wallet_use_raw_tx_store', default=False, type_=bool)
+    # while a restored wallet does its first sync, addresses are derived this many
+    # gap limits ahead of the last one with history (0 to only roll forward the gap limit)
+    WALLET_RESTORE_LOOKAHEAD = ConfigVar('wallet_restore_lookahead', default=2, type_=int)
+    # check the UTXO index against the wallet history on every query (slow)
+    WALLET_DEBUG_UTXO_INDEX = ConfigVar('wallet_debug_utxo_index', default=False, type_=bool)
     # note: 'use_change' and 'multiple_change' are per-wallet settings
     WALLET_SEND_CHANGE_TO_LIGHTNING = ConfigVar(
         'send_change_to_lightning', default=False, type_=bool,
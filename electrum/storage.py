@@ -71,6 +71,10 @@ class WalletStorage(Logger):
         self.logger.info(f"wallet path {self.path}")
         self.pubkey = None
         self.decrypted = ''
+        # pubkey the file on disk is encrypted with. Journal records can only
+        # be appended if it matches self.pubkey
+        self._pubkey_on_disk = None
+        self._needs_rewrite = False
         try:
             test_read_write_permissions(self.path)
         except IOError as e:
@@ -108,11 +112,18 @@ class WalletStorage(Logger):
             assert not os.path.exists(self.path)
         os.replace(temp_path, self.path)
         self._file_exists = True
+        self._pubkey_on_disk = self.pubkey
+        self._needs_rewrite = False
         self.logger.info(f"saved {self.path}")
 
     def append(self, data: str) -> None:
-        """ append data to file. for the moment, only non-encrypted file"""
-        assert not self.is_encrypted()
+        """ append data to file.
+        If the storage is encrypted, data is encrypted as a separate journal
+        record, and written on a new line after the base snapshot.
+        """
+        if self.is_encrypted():
+            assert self.pubkey and self.pubkey == self._pubkey_on_disk
+            data = '\n' + self._encrypt(data)
         with open(self.path, "rb+") as f:
             pos = f.seek(0, os.SEEK_END)
             if pos != self.pos:
@@ -123,6 +134,14 @@ class WalletStorage(Logger):
             os.fsync(f.fileno())
 
     def needs_consolidation(self):
+        if self._needs_rewrite:
+            return True
+        if self.is_encrypted() and self.pubkey != self._pubkey_on_disk:
+            # password changed, or storage encryption was just enabled
+            return True
+        if not self.is_encrypted() and self._pubkey_on_disk is not None:
+            # storage encryption was just disabled
+            return True
         return self.pos > 2 * self.init_pos
 
     def file_exists(self) -> bool:
@@ -160,7 +179,8 @@ class WalletStorage(Logger):
 
     def _init_encryption_version(self):
         try:
-            magic = base64.b64decode(self.raw)[0:4]
+            # only look at the base snapshot, journal records follow on separate lines
+            magic = base64.b64decode(self.raw.split('\n', 1)[0])[0:4]
             if magic == b'BIE1':
                 return StorageEncryptionVersion.USER_PASSWORD
             elif magic == b'BIE2':
@@ -193,24 +213,41 @@ class WalletStorage(Logger):
             return
         ec_key = self.get_eckey_from_password(password)
         if self.raw:
-            enc_magic = self._get_encryption_magic()
-            s = zlib.decompress(crypto.ecies_decrypt_message(ec_key, self.raw, magic=enc_magic))
-            s = s.decode('utf8')
+            base, *records = self.raw.split('\n')
+            # raises InvalidPassword
+            s = self._decrypt(ec_key, base)
+            for i, record in enumerate(records):
+                try:
+                    s += self._decrypt(ec_key, record)
+                except Exception as e:
+                    if i != len(records) - 1:
+                        raise WalletFileException(f"Cannot decrypt journal record {i}: {e!r}") from e
+                    # the last append was interrupted. drop it, and rewrite the file on next save
+                    self.logger.info(f"ignoring incomplete journal record: {e!r}")
+                    self._needs_rewrite = True
         else:
             s = ''
         self.pubkey = ec_key.get_public_key_hex()
+        self._pubkey_on_disk = self.pubkey if self.raw else None
         self.decrypted = s
 
+    def _decrypt(self, ec_key: 'ecc.ECPrivkey', ciphertext: str) -> str:
+        enc_magic = self._get_encryption_magic()
+        s = zlib.decompress(crypto.ecies_decrypt_message(ec_key, ciphertext, magic=enc_magic))
+        return s.decode('utf8')
+
+    def _encrypt(self, plaintext: str) -> str:
+        c = zlib.compress(bytes(plaintext, 'utf8'), level=zlib.Z_BEST_SPEED)
+        enc_magic = self._get_encryption_magic()
+        public_key = ecc.ECPubkey(bfh(self.pubkey))
+        s = crypto.ecies_encrypt_message(public_key, c, magic=enc_magic)
+        return s.decode('utf8')
+
     def encrypt_before_writing(self, plaintext: str) -> str:
         s = plaintext
         if self.pubkey:
             self.decrypted = plaintext
-            s = bytes(s, 'utf8')
-            c = zlib.compress(s, level=zlib.Z_BEST_SPEED)
-            enc_magic = self._get_encryption_magic()
-            public_key = ecc.ECPubkey(bfh(self.pubkey))
-            s = crypto.ecies_encrypt_message(public_key, c, magic=enc_magic)
-            s = s.decode('utf8')
+            s = self._encrypt(plaintext)
         return s
 
     def check_password(self, password: Optional[str]) -> None:
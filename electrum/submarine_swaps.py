@@ -386,6 +386,7 @@ class SwapManager(Logger):
             self.logger.info(f'adding claim tx {tx.txid()}')
             self.wallet.adb.add_transaction(tx)
             swap.spending_txid = tx.txid()
+            self.wallet.flush_db()
             if funding_height.conf > 0 or (swap.is_reverse and self.wallet.config.LIGHTNING_ALLOW_INSTANT_SWAPS):
                 try:
                     await self.network.broadcast_transaction(tx)
@@ -24,7 +24,7 @@
 # SOFTWARE.
 import asyncio
 import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Sequence
 from collections import defaultdict
 import logging
 
@@ -32,7 +32,7 @@ from aiorpcx import run_in_thread, RPCError
 
 from . import util
 from .transaction import Transaction, PartialTransaction
-from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup
+from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup, chunks
 from .bitcoin import address_to_scripthash, is_address
 from .logging import Logger
 from .interface import GracefulDisconnect, NetworkTimeout
@@ -72,12 +72,14 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         self._processed_some_notifications = False  # so that we don't miss them
         # Queues
         self.status_queue = asyncio.Queue()
+        self._addrs_to_subscribe = asyncio.Queue()  # type: asyncio.Queue[str]
 
     async def _run_tasks(self, *, taskgroup):
         await super()._run_tasks(taskgroup=taskgroup)
         try:
             async with taskgroup as group:
                 await group.spawn(self.handle_status())
+                await group.spawn(self.subscribe_to_addresses())
                 await group.spawn(self.main())
         finally:
             # we are being cancelled now
@@ -86,13 +88,21 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     def add(self, addr):
         if not is_address(addr): raise ValueError(f"invalid bitcoin address {addr}")
         self._adding_addrs.add(addr)  # this lets is_up_to_date already know about addr
+        self.wakeup()
+
+    def remove(self, addr):
+        # note: the server subscription stays, until we reconnect.
+        #       Status notifications for addr are ignored (see _on_address_status).
+        self._adding_addrs.discard(addr)
+        self.requested_addrs.discard(addr)
+        self.wakeup()
 
     async def _add_address(self, addr: str):
         try:
             if not is_address(addr): raise ValueError(f"invalid bitcoin address {addr}")
             if addr in self.requested_addrs: return
             self.requested_addrs.add(addr)
-            await self.taskgroup.spawn(self._subscribe_to_address, addr)
+            self._addrs_to_subscribe.put_nowait(addr)
         finally:
             self._adding_addrs.discard(addr)  # ok for addr not to be present
 
@@ -102,18 +112,30 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         """
         raise NotImplementedError()  # implemented by subclasses
 
-    async def _subscribe_to_address(self, addr):
-        h = address_to_scripthash(addr)
-        self.scripthash_to_address[h] = addr
-        self._requests_sent += 1
-        try:
-            async with self._network_request_semaphore:
-                await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
-        except RPCError as e:
-            if e.message == 'history too large':  # no unique error code
+    async def subscribe_to_addresses(self):
+        """Subscribes to the queued addresses, coalescing them into batches."""
+        batch_size = self.network.config.NETWORK_REQUEST_BATCH_SIZE
+        while True:
+            addrs = [await self._addrs_to_subscribe.get()]
+            while len(addrs) < batch_size and not self._addrs_to_subscribe.empty():
+                addrs.append(self._addrs_to_subscribe.get_nowait())
+            await self.taskgroup.spawn(self._subscribe_to_addresses, addrs)
+
+    async def _subscribe_to_addresses(self, addrs: Sequence[str]):
+        hashes = [address_to_scripthash(addr) for addr in addrs]
+        for h, addr in zip(hashes, addrs):
+            self.scripthash_to_address[h] = addr
+        self._requests_sent += len(addrs)
+        async with self._network_request_semaphore:
+            errors = await self.session.subscribe_batch(
+                'blockchain.scripthash.subscribe', [[h] for h in hashes], self.status_queue)
+        for e in errors:
+            if e is None:
+                self._requests_answered += 1
+                continue
+            if isinstance(e, RPCError) and e.message == 'history too large':  # no unique error code
                 raise GracefulDisconnect(e, log_level=logging.ERROR) from e
-            raise
-        self._requests_answered += 1
+            raise e
 
     async def handle_status(self):
         while True:
@@ -162,6 +184,8 @@ class Synchronizer(SynchronizerBase):
 
     async def _on_address_status(self, addr, status):
         try:
+            if not self.adb.is_mine(addr):
+                return  # removed while we were subscribed
             history = self.adb.db.get_addr_history(addr)
             if history_status(history) == status:
                 return
@@ -174,6 +198,7 @@ class Synchronizer(SynchronizerBase):
             self._stale_histories.pop(addr, asyncio.Future()).cancel()
         finally:
             self._handling_addr_statuses.discard(addr)
+            self.wakeup()
         h = address_to_scripthash(addr)
         self._requests_sent += 1
         async with self._network_request_semaphore:
@@ -204,6 +229,7 @@ class Synchronizer(SynchronizerBase):
 
         # Remove request; this allows up_to_date to be True
         self.requested_histories.discard((addr, status))
+        self.wakeup()
 
     async def _request_missing_txs(self, hist, *, allow_server_not_finding_tx=False):
         # "hist" is a list of [tx_hash, tx_height] lists
@@ -217,31 +243,59 @@ class Synchronizer(SynchronizerBase):
             transaction_hashes.append(tx_hash)
             self.requested_tx[tx_hash] = tx_height
 
+        # txs might have been downloaded already, e.g. by another wallet
+        tx_cache = self.network.tx_cache
+        not_cached = []
+        for tx_hash in transaction_hashes:
+            raw_tx = tx_cache.get_raw_tx(tx_hash, require_confirmed=self.requested_tx[tx_hash] > 0)
+            if raw_tx is None:
+                not_cached.append(tx_hash)
+            else:
+                self._receive_tx(tx_hash, raw_tx, from_cache=True)
+        if len(not_cached) < len(transaction_hashes):
+            self.wakeup()
+        transaction_hashes = not_cached
+
         if not transaction_hashes: return
+        # responses must fit in NETWORK_MAX_INCOMING_MSG_SIZE; assume up to 100 kB per tx
+        batch_size = min(self.network.config.NETWORK_REQUEST_BATCH_SIZE,
+                         self.network.config.NETWORK_MAX_INCOMING_MSG_SIZE // 100_000)
         async with OldTaskGroup() as group:
-            for tx_hash in transaction_hashes:
-                await group.spawn(self._get_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx))
+            for tx_hashes in chunks(transaction_hashes, max(1, batch_size)):
+                await group.spawn(self._get_transactions(tx_hashes, allow_server_not_finding_tx=allow_server_not_finding_tx))
 
-    async def _get_transaction(self, tx_hash, *, allow_server_not_finding_tx=False):
-        self._requests_sent += 1
+    async def _get_transactions(self, tx_hashes: Sequence[str], *, allow_server_not_finding_tx=False):
+        self._requests_sent += len(tx_hashes)
         try:
             async with self._network_request_semaphore:
-                raw_tx = await self.interface.get_transaction(tx_hash)
-        except RPCError as e:
-            # most likely, "No such mempool or blockchain transaction"
-            if allow_server_not_finding_tx:
-                self.requested_tx.pop(tx_hash)
-                return
-            else:
-                raise
+                raw_txs = await self._fetch_items(
+                    tx_hashes, lambda interface, items: interface.get_transactions(items))
         finally:
-            self._requests_answered += 1
+            self._requests_answered += len(tx_hashes)
+        error = None
+        for tx_hash, raw_tx in zip(tx_hashes, raw_txs):
+            if isinstance(raw_tx, RPCError) and allow_server_not_finding_tx:
+                # most likely, "No such mempool or blockchain transaction"
+                self.requested_tx.pop(tx_hash)
+                continue
+            if isinstance(raw_tx, Exception):
+                error = error or raw_tx
+                continue
+            self._receive_tx(tx_hash, raw_tx)
+        self.wakeup()
+        if error is not None:
+            raise error
+
+    def _receive_tx(self, tx_hash: str, raw_tx: str, *, from_cache: bool = False):
         tx = Transaction(raw_tx)
         if tx_hash != tx.txid():
             raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
         tx_height = self.requested_tx.pop(tx_hash)
+        if not from_cache:
+            self.network.tx_cache.add(tx, confirmed=tx_height > 0)
         self.adb.receive_tx_callback(tx, tx_height)
-        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
+        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}"
+                         + (" (cached)" if from_cache else ""))
 
     async def main(self):
         self.adb.up_to_date_changed()
@@ -259,7 +313,6 @@ class Synchronizer(SynchronizerBase):
         self._init_done = True
         prev_uptodate = False
         while True:
-            await asyncio.sleep(0.1)
             for addr in self._adding_addrs.copy(): # copy set to ensure iterator stability
                 await self._add_address(addr)
             up_to_date = self.adb.is_up_to_date()
@@ -269,6 +322,9 @@ class Synchronizer(SynchronizerBase):
                 self._processed_some_notifications = False
                 self.adb.up_to_date_changed()
             prev_uptodate = up_to_date
+            # woken up by add(), and when requests complete or
+            # the SPV state of the wallet changes (see adb)
+            await self.wait_for_wakeup()
 
 
 class Notifier(SynchronizerBase):
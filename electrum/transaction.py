@@ -819,7 +819,7 @@ class Transaction:
         elif isinstance(raw, str):
             self._cached_network_ser = raw.strip() if raw else None
             assert is_hex_str(self._cached_network_ser)
-        elif isinstance(raw, (bytes, bytearray)):
+        elif isinstance(raw, (bytes, bytearray, memoryview)):
             self._cached_network_ser = raw.hex()
         else:
             raise Exception(f"cannot initialize transaction from {raw}")
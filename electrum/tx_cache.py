@@ -0,0 +1,119 @@
+# Copyright (C) 2024 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+# Daemon-wide cache of raw transactions, keyed by txid, shared by all
+# wallets (and commands) through the Network.
+#
+# Entries are kept in memory, in an LRU bounded by the total size of the
+# raw txs. Each entry records whether the tx was seen confirmed: the
+# witness of an unconfirmed tx might still differ from the one that gets
+# mined, so callers that need the mined tx can ask for confirmed entries
+# only. Optionally, confirmed txs are also written to a RawTxStore in the
+# electrum dir, so that they survive restarts.
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from .logging import Logger
+from .raw_tx_store import RawTxStore, RECORD_HEADER_LEN
+from .transaction import Transaction, PartialTransaction
+
+
+class TxCache(Logger):
+
+    def __init__(self, *, max_size: int, path: Optional[str] = None, max_disk_size: int = 0):
+        Logger.__init__(self)
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()  # type: OrderedDict[str, Tuple[bytes, bool]]  # txid -> (raw_tx, confirmed)
+        self._size = 0
+        self._store = None  # type: Optional[RawTxStore]
+        self._disk_size = 0
+        if path is not None:
+            try:
+                self._store = RawTxStore(path, cache_size=1)
+            except Exception as e:
+                self.logger.info(f"cannot open tx cache file. discarding it: {e!r}")
+                os.unlink(path)
+                self._store = RawTxStore(path, cache_size=1)
+            self._disk_size = os.path.getsize(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_raw_tx(self, txid: str, *, require_confirmed: bool = False) -> Optional[str]:
+        """Returns the raw tx as hex, or None if not cached.
+        If require_confirmed, txs that were only seen unconfirmed are ignored.
+        """
+        with self.lock:
+            item = self._entries.get(txid)
+            if item is not None:
+                self._entries.move_to_end(txid)
+                raw_tx, confirmed = item
+                if require_confirmed and not confirmed:
+                    return None
+                return raw_tx.hex()
+            if self._store is None or txid not in self._store:
+                return None
+            tx = self._store.get_transaction(txid)
+            try:
+                is_valid = tx.txid() == txid
+            except Exception:
+                is_valid = False
+            if not is_valid:
+                self.logger.info(f"ignoring corrupt tx in tx cache file: {txid}")
+                return None
+            raw_tx = tx.serialize()
+            self._add_to_memory(txid, bytes.fromhex(raw_tx), True)
+            return raw_tx
+
+    def add(self, tx: Transaction, *, confirmed: bool) -> None:
+        """Adds a complete tx, keyed by the txid computed from its data."""
+        if self.max_size <= 0 or isinstance(tx, PartialTransaction):
+            return
+        txid = tx.txid()
+        if txid is None:
+            return
+        raw_tx = tx.serialize()
+        raw_tx_bytes = bytes.fromhex(raw_tx)
+        with self.lock:
+            item = self._entries.get(txid)
+            if item is not None and item[1]:
+                confirmed = True  # keep the tx that was seen mined
+                raw_tx_bytes = item[0]
+            self._add_to_memory(txid, raw_tx_bytes, confirmed)
+            if confirmed and self._store is not None and txid not in self._store:
+                self._store.add(txid, raw_tx_bytes)
+                self._disk_size += RECORD_HEADER_LEN + len(raw_tx_bytes)
+                self._maybe_trim_store()
+
+    def _add_to_memory(self, txid: str, raw_tx: bytes, confirmed: bool) -> None:
+        old_item = self._entries.pop(txid, None)
+        if old_item is not None:
+            self._size -= len(old_item[0])
+        if len(raw_tx) > self.max_size:
+            return
+        self._entries[txid] = (raw_tx, confirmed)
+        self._size += len(raw_tx)
+        while self._size > self.max_size:
+            _, (evicted_tx, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted_tx)
+
+    def _maybe_trim_store(self) -> None:
+        if self._disk_size <= self.max_disk_size:
+            return
+        # keep the newer half
+        txids = self._store.txids()
+        self._store.compact(txids[len(txids) // 2:])
+        self._disk_size = os.path.getsize(self._store.path)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._store is not None:
+                self._store.flush()
+                self._store.close()
+                self._store = None
@@ -24,9 +24,9 @@ import binascii
 import concurrent.futures
 import logging
 import os, sys, re, json
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, OrderedDict, deque
 from typing import (NamedTuple, Union, TYPE_CHECKING, Tuple, Optional, Callable, Any,
-                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set, Awaitable)
+                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set, Awaitable, Deque)
 from datetime import datetime, timezone
 import decimal
 from decimal import Decimal
@@ -48,6 +48,7 @@ from ipaddress import IPv4Address, IPv6Address
 import random
 import secrets
 import functools
+import contextlib
 from functools import partial
 from abc import abstractmethod, ABC
 import socket
@@ -1453,6 +1454,101 @@ else:
         return TimeoutAfterAsynciolike(delay)
 
 
+class AdaptiveConcurrencyLimiter:
+    """Limits the number of concurrent requests to a server.
+
+    The limit (window) is adapted in the AIMD way of TCP congestion control:
+    after a slow start, it grows by one for each window's worth of timely
+    responses, and it is halved on a timeout, or when the latency gets much
+    higher than the lowest recent latency (i.e. requests are getting queued
+    somewhere).
+    """
+
+    NUM_LATENCY_SAMPLES = 200
+    LATENCY_FACTOR = 4        # latency above LATENCY_FACTOR * min recent latency is congestion...
+    LATENCY_THRESHOLD = 0.5   # ...if also above this many seconds
+
+    def __init__(self, *, initial: int = 10, minimum: int = 1, maximum: int = 100):
+        assert 1 <= minimum <= initial <= maximum
+        self.minimum = minimum
+        self.maximum = maximum
+        self._window = float(initial)
+        self._in_flight = 0
+        self._waiters = []  # type: List[asyncio.Future]
+        self._latencies = deque(maxlen=self.NUM_LATENCY_SAMPLES)  # type: Deque[float]
+        self._last_decrease = 0.0  # time.monotonic()
+        self._slow_start = True  # double the window every round trip, until the first decrease
+        self.num_timeouts = 0
+
+    def window(self) -> int:
+        return int(self._window)
+
+    def num_in_flight(self) -> int:
+        return self._in_flight
+
+    @contextlib.asynccontextmanager
+    async def request(self, *, num_items: int = 1):
+        """Waits for a free slot, and records the outcome of the request
+        made in the context. A batch takes a single slot, and its latency
+        is averaged over its num_items requests.
+        """
+        while self._in_flight >= self.window():
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            finally:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+        self._in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        except (asyncio.TimeoutError, aiorpcx.TaskTimeout):
+            self._on_timeout(start)
+            raise
+        else:
+            self._on_response(start, (time.monotonic() - start) / max(1, num_items))
+        finally:
+            self._in_flight -= 1
+            self._wake_up_waiters()
+
+    def _on_response(self, start: float, latency: float) -> None:
+        self._latencies.append(latency)
+        if latency > max(self.LATENCY_THRESHOLD, self.LATENCY_FACTOR * min(self._latencies)):
+            self._decrease(start)
+        else:
+            increment = 1 if self._slow_start else 1 / self._window
+            self._window = min(self.maximum, self._window + increment)
+
+    def _on_timeout(self, start: float) -> None:
+        self.num_timeouts += 1
+        self._decrease(start)
+
+    def _decrease(self, start: float) -> None:
+        # Requests that were already in flight at the last decrease saw the
+        # congestion too. Do not shrink the window again because of them.
+        if start < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self._slow_start = False
+        self._window = max(self.minimum, self._window / 2)
+
+    def _wake_up_waiters(self) -> None:
+        # woken up waiters check again for a free slot
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    def get_latency_percentiles(self, percentiles: Sequence[int] = (50, 90, 99)) -> Dict[int, Optional[float]]:
+        """Returns the recent request latencies (in seconds) at the given percentiles."""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {p: None for p in percentiles}
+        return {p: latencies[min(len(latencies) - 1, len(latencies) * p // 100)] for p in percentiles}
+
+
 class NetworkJobOnDefaultServer(Logger, ABC):
     """An abstract base class for a job that runs on the main network
     interface. Every time the main interface changes, the job is
@@ -1464,8 +1560,12 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         self.interface = None  # type: Interface
         self._restart_lock = asyncio.Lock()
         # Ensure fairness between NetworkJobs. e.g. if multiple wallets
-        # are open, a large wallet's Synchronizer should not starve the small wallets:
+        # are open, a large wallet's Synchronizer should not starve the small wallets.
+        # (the number of requests actually sent to the server is limited by the
+        # adaptive window of the session, see AdaptiveConcurrencyLimiter)
         self._network_request_semaphore = asyncio.Semaphore(100)
+        self._num_wakeups = 0
+        self._num_fetches = 0
 
         self._reset()
         # every time the main interface changes, restart:
@@ -1478,6 +1578,7 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         server connection changes.
         """
         self.taskgroup = OldTaskGroup()
+        self._wakeup_event = asyncio.Event()
         self.reset_request_counters()
 
     async def _start(self, interface: 'Interface'):
@@ -1530,6 +1631,79 @@ class NetworkJobOnDefaultServer(Logger, ABC):
     def num_requests_sent_and_answered(self) -> Tuple[int, int]:
         return self._requests_sent, self._requests_answered
 
+    def _get_fetch_interface(self) -> 'Interface':
+        """Returns the interface to fetch verifiable data from.
+        This is the main interface, unless NETWORK_PARALLEL_FETCH is set,
+        in which case requests are spread over the connected interfaces
+        that follow the same chain.
+        """
+        if not self.network.config.NETWORK_PARALLEL_FETCH:
+            return self.interface
+        interfaces = [self.interface] + [
+            iface for iface in self.network.interfaces.values()
+            if iface is not self.interface
+            and iface.is_connected_and_ready()
+            and iface.session is not None
+            and iface.blockchain == self.interface.blockchain]
+        self._num_fetches += 1
+        return interfaces[self._num_fetches % len(interfaces)]
+
+    async def _fetch_items(
+            self,
+            items: Sequence[Any],
+            fetch: Callable[['Interface', Sequence[Any]], Awaitable[List[Any]]],
+    ) -> List[Any]:
+        """Calls fetch(interface, items) to get a result for each item,
+        where failed items have an exception in place of their result.
+        The data must be verifiable locally: items that fail on an interface
+        other than the main one are retried on the main interface.
+        """
+        interface = self._get_fetch_interface()
+        if interface is self.interface:
+            return await self._fetch_items_from_interface(interface, items, fetch)
+        # run in a separate task: if the other interface gets disconnected, its pending
+        # requests get cancelled, and that must not look like we are being cancelled
+        task = asyncio.ensure_future(self._fetch_items_from_interface(interface, items, fetch))
+        try:
+            results = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                task.cancel()
+                raise
+            results = [Exception(f"request to {interface.server} cancelled")] * len(items)
+        except Exception as e:
+            self.logger.info(f"fetching {len(items)} items from {interface.server} failed: {e!r}")
+            results = [e] * len(items)
+        failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+        if failed:
+            retried = await self._fetch_items_from_interface(self.interface, [items[i] for i in failed], fetch)
+            for i, result in zip(failed, retried):
+                results[i] = result
+        return results
+
+    @staticmethod
+    async def _fetch_items_from_interface(interface: 'Interface', items, fetch) -> List[Any]:
+        start = time.monotonic()
+        try:
+            return await fetch(interface, items)
+        finally:
+            interface.record_fetch(len(items), time.monotonic() - start)
+
+    def wakeup(self) -> None:
+        """Wakes up the main loop of the job, if it is waiting in
+        wait_for_wakeup(). Can be called from any thread.
+        """
+        self.network.asyncio_loop.call_soon_threadsafe(self._wakeup_event.set)
+
+    async def wait_for_wakeup(self) -> None:
+        await self._wakeup_event.wait()
+        self._wakeup_event.clear()
+        self._num_wakeups += 1
+
+    def num_wakeups(self) -> int:
+        """Number of times the main loop was woken up. For diagnostics."""
+        return self._num_wakeups
+
     @property
     def session(self):
         s = self.interface.session
@@ -1703,6 +1877,34 @@ class OrderedDictWithIndex(OrderedDict):
         return ret
 
 
+class LRUCache(OrderedDict):
+    """An OrderedDict with bounded size that evicts the least recently used items.
+
+    Note: not thread-safe. Callers must hold their own lock.
+    """
+
+    def __init__(self, *, maxsize: int):
+        assert maxsize > 0, maxsize
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 def multisig_type(wallet_type):
     '''If wallet_type is mofn multi-sig, return [m, n],
     otherwise return None.'''
@@ -2001,17 +2203,40 @@ class JsonRPCClient:
                 % (self._id, endpoint, json.dumps(args)))
         async with self.session.post(self.url, data=data) as resp:
             if resp.status == 200:
-                r = await resp.json()
-                result = r.get('result')
-                error = r.get('error')
-                if error:
-                    raise JsonRPCError(code=error["code"], message=error["message"], data=error.get("data"))
-                else:
-                    return result
+                return self._get_result(await resp.json())
             else:
                 text = await resp.text()
                 return 'Error: ' + str(text)
 
+    async def request_stream(self, endpoint, *args):
+        """Like request, for methods that stream their result as newline-delimited
+        JSON. Yields the items of the result as they arrive.
+        If the server sends a plain response instead, its result is yielded.
+        """
+        self._id += 1
+        data = ('{"jsonrpc": "2.0", "id":"%d", "method": "%s", "params": %s }'
+                % (self._id, endpoint, json.dumps(args)))
+        async with self.session.post(self.url, data=data) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                yield 'Error: ' + str(text)
+                return
+            if resp.content_type != 'application/x-ndjson':
+                yield self._get_result(await resp.json())
+                return
+            buf = b''
+            async for chunk in resp.content.iter_any():
+                *lines, buf = (buf + chunk).split(b'\n')
+                for line in lines:
+                    yield self._get_result(json.loads(line))
+
+    @classmethod
+    def _get_result(cls, r: dict):
+        error = r.get('error')
+        if error:
+            raise JsonRPCError(code=error["code"], message=error["message"], data=error.get("data"))
+        return r.get('result')
+
     def add_method(self, endpoint):
         async def coro(*args):
             return await self.request(endpoint, *args)
@@ -21,12 +21,11 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+from typing import Sequence, Optional, TYPE_CHECKING, Tuple, List
 
 import aiorpcx
 
-from .util import TxMinedInfo, NetworkJobOnDefaultServer
+from .util import TxMinedInfo, NetworkJobOnDefaultServer, chunks
 from .crypto import sha256d
 from .bitcoin import hash_decode, hash_encode
 from .transaction import Transaction
@@ -36,6 +35,7 @@ from . import constants
 
 if TYPE_CHECKING:
     from .network import Network
+    from .interface import Interface
     from .address_synchronizer import AddressSynchronizer
 
 
@@ -70,11 +70,13 @@ class SPV(NetworkJobOnDefaultServer):
         while True:
             await self._maybe_undo_verifications()
             await self._request_proofs()
-            await asyncio.sleep(0.1)
+            # woken up by new unverified txs, and by new headers (see adb)
+            await self.wait_for_wakeup()
 
     async def _request_proofs(self):
         local_height = self.blockchain.height()
         unverified = self.wallet.get_unverified_txs()
+        to_request = []
 
         for tx_hash, tx_height in unverified.items():
             # do not request merkle branch if we already requested it
@@ -87,26 +89,61 @@ class SPV(NetworkJobOnDefaultServer):
             header = self.blockchain.read_header(tx_height)
             if header is None:
                 if tx_height < constants.net.max_checkpoint():
-                    # FIXME these requests are not counted (self._requests_sent += 1)
-                    await self.taskgroup.spawn(self.interface.request_chunk(tx_height, None, can_return_early=True))
+                    await self.taskgroup.spawn(self._request_chunk(tx_height))
                 continue
             # request now
             self.logger.info(f'requested merkle {tx_hash}')
             self.requested_merkle.add(tx_hash)
-            await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
-
-    async def _request_and_verify_single_proof(self, tx_hash, tx_height):
+            to_request.append((tx_hash, tx_height))
+        batch_size = max(1, self.network.config.NETWORK_REQUEST_BATCH_SIZE)
+        for txs in chunks(to_request, batch_size):
+            await self.taskgroup.spawn(self._request_and_verify_proofs, txs)
+
+    async def _request_chunk(self, tx_height: int):
+        # FIXME these requests are not counted (self._requests_sent += 1)
+        await self.interface.request_chunk(tx_height, None, can_return_early=True)
+        self.wakeup()
+
+    async def _request_and_verify_proofs(self, txs: Sequence[Tuple[str, int]]):
+        self._requests_sent += len(txs)
         try:
-            self._requests_sent += 1
             async with self._network_request_semaphore:
-                merkle = await self.interface.get_merkle_for_transaction(tx_hash, tx_height)
-        except aiorpcx.jsonrpc.RPCError:
-            self.logger.info(f'tx {tx_hash} not at height {tx_height}')
-            self.wallet.remove_unverified_tx(tx_hash, tx_height)
-            self.requested_merkle.discard(tx_hash)
-            return
+                merkles = await self._fetch_items(txs, self._fetch_merkles)
         finally:
-            self._requests_answered += 1
+            self._requests_answered += len(txs)
+        error = None
+        for (tx_hash, tx_height), merkle in zip(txs, merkles):
+            if isinstance(merkle, aiorpcx.jsonrpc.RPCError):
+                self.logger.info(f'tx {tx_hash} not at height {tx_height}')
+                self.wallet.remove_unverified_tx(tx_hash, tx_height)
+                self.requested_merkle.discard(tx_hash)
+            elif isinstance(merkle, Exception):
+                error = error or merkle
+            else:
+                await self._verify_proof(tx_hash, tx_height, merkle)
+        if error is not None:
+            raise error
+
+    async def _fetch_merkles(self, interface: 'Interface', txs: Sequence[Tuple[str, int]]) -> List:
+        merkles = await interface.get_merkles_for_transactions(txs)
+        if interface is self.interface:
+            return merkles
+        # other servers are not trusted: check their proofs now, so that
+        # invalid ones get requested from the main server instead
+        for i, ((tx_hash, tx_height), merkle) in enumerate(zip(txs, merkles)):
+            if isinstance(merkle, Exception):
+                continue
+            block_height = merkle.get('block_height')
+            async with self.network.bhi_lock:
+                header = self.network.blockchain().read_header(block_height)
+            try:
+                verify_tx_is_in_block(tx_hash, merkle.get('merkle'), merkle.get('pos'), header, block_height)
+            except MerkleVerificationFailure as e:
+                interface.logger.info(f"invalid merkle proof: {e!r}")
+                merkles[i] = e
+        return merkles
+
+    async def _verify_proof(self, tx_hash: str, tx_height: int, merkle: dict):
         # Verify the hash of the server-provided merkle branch to a
         # transaction matches the merkle root of its block
         if tx_height != merkle.get('block_height'):
@@ -189,6 +226,7 @@ class SPV(NetworkJobOnDefaultServer):
     def remove_spv_proof_for_tx(self, tx_hash):
         self.merkle_roots.pop(tx_hash, None)
         self.requested_merkle.discard(tx_hash)
+        self.wakeup()
 
     def is_up_to_date(self):
         return (not self.requested_merkle
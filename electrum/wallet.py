@@ -40,7 +40,7 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Mapping
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Mapping, Callable
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -396,6 +396,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         assert self.config is not None, "config must not be None"
         self.db = db
         self.storage = db.storage  # type: Optional[WalletStorage]
+        if self.config.WALLET_USE_RAW_TX_STORE:
+            db.enable_raw_tx_store()
         # load addresses needs to be called before constructor for sanity checks
         db.load_addresses(self.wallet_type)
         self.keystore = None  # type: Optional[KeyStore]  # will be set by load_keystore
@@ -478,8 +480,21 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             await run_in_thread(self.synchronize)
 
     def save_db(self):
+        """Saves the wallet file. If write-behind is enabled in the config,
+        this only schedules the write (and raises if the previous scheduled
+        write failed); see flush_db.
+        """
+        if self.db.storage:
+            delay = self.config.WALLET_DB_WRITE_BEHIND_DELAY
+            if delay > 0:
+                self.db.write_later(delay)
+            else:
+                self.db.write()
+
+    def flush_db(self):
+        """Saves the wallet file now. Use this where durability matters."""
         if self.db.storage:
-            self.db.write()
+            self.db.flush()
 
     def save_backup(self, backup_dir):
         new_path = os.path.join(backup_dir, self.basename() + '.backup')
@@ -487,7 +502,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         new_storage._encryption_version = self.storage._encryption_version
         new_storage.pubkey = self.storage.pubkey
 
-        new_db = WalletDB(self.db.dump(), storage=new_storage, upgrade=True)
+        # txs from the raw tx store are saved in the backup file
+        new_db = WalletDB(self.db.dump_without_raw_tx_store(), storage=new_storage, upgrade=True)
         if self.lnworker:
             channel_backups = new_db.get_dict('imported_channel_backups')
             for chan_id, chan in self.lnworker.channels.items():
@@ -544,7 +560,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         finally:  # even if we get cancelled
             if any([ks.is_requesting_to_be_rewritten_to_wallet_file for ks in self.get_keystores()]):
                 self.save_keystore()
-            self.save_db()
+            self.flush_db()
 
     def is_up_to_date(self) -> bool:
         if self.taskgroup.joined:  # either stop() was called, or the taskgroup died
@@ -572,6 +588,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             status_changed = self._up_to_date != up_to_date
             self._up_to_date = up_to_date
         if up_to_date:
+            if self.is_restoring():
+                await run_in_thread(self.finish_restore)
             self.adb.reset_netrequest_counters()  # sync progress indicator
             self.save_db()
         # fire triggers
@@ -1128,11 +1146,26 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # return last balance
         return balance
 
-    def get_onchain_history(self, *, domain=None):
+    def get_onchain_history(
+            self, *, domain=None, after: str = None, limit: int = None,
+            from_height: int = None, to_height: int = None):
+        """Yields the on-chain history items. Without a domain, the history of
+        the whole wallet is read one page at a time: it starts after the
+        transaction with txid 'after', is restricted to the txs mined in
+        [from_height, to_height) (unmined ones only if to_height is None),
+        and has at most limit items.
+        """
         if domain is None:
-            domain = self.get_addresses()
-        monotonic_timestamp = 0
-        for hist_item in self.adb.get_history(domain=domain):
+            pages = self.adb.iter_history_pages(
+                after=after, limit=limit, from_height=from_height, to_height=to_height)
+        else:
+            assert after is None and limit is None and from_height is None and to_height is None
+            pages = [(self.adb.get_history(domain=domain), 0)]
+        for history, monotonic_timestamp in pages:
+            yield from self._get_onchain_history_items(history, monotonic_timestamp)
+
+    def _get_onchain_history_items(self, history, monotonic_timestamp: int):
+        for hist_item in history:
             monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
             d = {
                 'txid': hist_item.txid,
@@ -1433,65 +1466,115 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     item['fiat_default'] = True
         return transactions
 
-    @profiler
-    def get_detailed_history(
+    def iter_detailed_history(
             self,
             from_timestamp=None,
             to_timestamp=None,
             fx=None,
             show_addresses=False,
             from_height=None,
-            to_height=None):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+            to_height=None,
+            after=None,
+            limit=None):
+        """Yields the items of get_detailed_history, one at a time.
+        Height filters and limit are applied while reading the history,
+        timestamp filters are applied to each item."""
         if (from_timestamp is not None or to_timestamp is not None) \
                 and (from_height is not None or to_height is not None):
             raise UserFacingException('timestamp and block height based filtering cannot be used together')
+        show_fiat = fx and fx.is_enabled() and fx.has_history()
+        now = time.time()
+        history = self.get_onchain_history(
+            after=after, limit=limit if from_timestamp is None and to_timestamp is None else None,
+            from_height=from_height, to_height=to_height)
+
+        def filter_history():
+            n = 0
+            for item in history:
+                if limit is not None and n >= limit:
+                    break
+                timestamp = item['timestamp']
+                if from_timestamp and (timestamp or now) < from_timestamp:
+                    continue
+                if to_timestamp and (timestamp or now) >= to_timestamp:
+                    continue
+                n += 1
+                yield item
+
+        items = filter_history()
+        # fiat rates are looked up in batches of items
+        while chunk := list(itertools.islice(items, 1000)):
+            price_func = self.get_price_func(fx, [item['txid'] for item in chunk]) if show_fiat else None
+            for item in chunk:
+                tx_hash = item['txid']
+                tx = self.db.get_transaction(tx_hash)
+                tx_fee = item['fee_sat']
+                item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
+                if show_addresses:
+                    item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
+                    item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
+                                               tx.outputs()))
+                # fiat computations
+                if show_fiat:
+                    item.update(self.get_tx_item_fiat(
+                        tx_hash=tx_hash, amount_sat=item['bc_value'].value, fx=fx, tx_fee=tx_fee, price_func=price_func))
+                yield item
+
+    def get_price_func(self, fx: 'FxThread', txids: Iterable[str]) -> Callable[[Optional[int]], Decimal]:
+        """Returns a replacement for fx.timestamp_rate, with the rates at the
+        time txids and the txs they spend from got confirmed looked up at once.
+        """
+        timestamps = set()
+        for txid in txids:
+            timestamps.add(self.adb.get_tx_height(txid).timestamp)
+            for addr in self.db.get_txi_addresses(txid):
+                for ser, v in self.db.get_txi_addr(txid, addr):
+                    timestamps.add(self.adb.get_tx_height(ser.split(':')[0]).timestamp)
+        timestamps.discard(None)
+        timestamps = list(timestamps)
+        rates = dict(zip(timestamps, fx.rates_for_timestamps(timestamps)))
+
+        def price_func(timestamp: Optional[int]) -> Decimal:
+            rate = rates.get(timestamp)
+            return rate if rate is not None else fx.timestamp_rate(timestamp)
+        return price_func
 
+    @profiler
+    def get_detailed_history(
+            self,
+            from_timestamp=None,
+            to_timestamp=None,
+            fx=None,
+            show_addresses=False,
+            from_height=None,
+            to_height=None,
+            after=None,
+            limit=None):
+        # History with capital gains, using utxo pricing
+        # FIXME: Lightning capital gains would requires FIFO
         show_fiat = fx and fx.is_enabled() and fx.has_history()
-        out = []
+        out = list(self.iter_detailed_history(
+            from_timestamp=from_timestamp, to_timestamp=to_timestamp, fx=fx, show_addresses=show_addresses,
+            from_height=from_height, to_height=to_height, after=after, limit=limit))
         income = 0
         expenditures = 0
         capital_gains = Decimal(0)
         fiat_income = Decimal(0)
         fiat_expenditures = Decimal(0)
-        now = time.time()
-        for item in self.get_onchain_history():
-            timestamp = item['timestamp']
-            if from_timestamp and (timestamp or now) < from_timestamp:
-                continue
-            if to_timestamp and (timestamp or now) >= to_timestamp:
-                continue
-            height = item['height']
-            if from_height is not None and from_height > height > 0:
-                continue
-            if to_height is not None and (height >= to_height or height <= 0):
-                continue
-            tx_hash = item['txid']
-            tx = self.db.get_transaction(tx_hash)
-            tx_fee = item['fee_sat']
-            item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
-            if show_addresses:
-                item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
-                item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
-                                           tx.outputs()))
+        for item in out:
             # fixme: use in and out values
             value = item['bc_value'].value
             if value < 0:
                 expenditures += -value
             else:
                 income += value
-            # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
+                fiat_value = item['fiat_value'].value
                 if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
+                    capital_gains += item['capital_gain'].value
                     fiat_expenditures += -fiat_value
                 else:
                     fiat_income += fiat_value
-            out.append(item)
         # add summary
         if out:
             first_item = out[0]
@@ -1584,12 +1667,14 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             amount_sat: int,
             fx: 'FxThread',
             tx_fee: Optional[int],
+            price_func: Callable[[Optional[int]], Decimal] = None,
     ) -> Dict[str, Any]:
+        price_func = price_func or fx.timestamp_rate
         item = {}
         fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
         fiat_default = fiat_value is None
-        fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
-        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, amount_sat)
+        fiat_rate = self.price_at_timestamp(tx_hash, price_func)
+        fiat_value = fiat_value if fiat_value is not None else amount_sat / Decimal(COIN) * fiat_rate
         fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
         item['fiat_currency'] = fx.ccy
         item['fiat_rate'] = Fiat(fiat_rate, fx.ccy)
@@ -1597,7 +1682,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee is not None else None
         item['fiat_default'] = fiat_default
         if amount_sat < 0:
-            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
+            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, price_func, fx.ccy)
             liquidation_price = - fiat_value
             item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
             cg = liquidation_price - acquisition_price
@@ -2932,6 +3017,11 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 enc_version = self.get_available_storage_encryption_version()
             else:
                 enc_version = StorageEncryptionVersion.PLAINTEXT
+            if new_pw and enc_version != StorageEncryptionVersion.PLAINTEXT:
+                if not self.db.can_encrypt_storage():
+                    raise UserFacingException(_("Storage encryption is not available for wallets with their history in sqlite."))
+                # the raw tx store is not encrypted
+                self.db.disable_raw_tx_store()
             self.storage.set_password(new_pw, enc_version)
         # make sure next storage.write() saves changes
         self.db.set_modified(True)
@@ -3277,6 +3367,13 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         """Returns the number of new addresses we generated."""
         return 0
 
+    def is_restoring(self) -> bool:
+        """Whether the wallet is in its first sync after having been restored."""
+        return False
+
+    def finish_restore(self) -> None:
+        pass
+
     def unlock(self, password):
         self.logger.info(f'unlocking wallet')
         self.check_password(password)
@@ -3403,10 +3500,13 @@ class Imported_Wallet(Simple_Wallet):
                 else:
                     for tx_hash, height in details:
                         transactions_new.add(tx_hash)
+            # the shared txs stay, with a different delta
+            transactions_shared = transactions_to_remove & transactions_new
             transactions_to_remove -= transactions_new
             self.db.remove_addr_history(address)
             for tx_hash in transactions_to_remove:
                 self.adb._remove_transaction(tx_hash)
+            self.adb.invalidate_history_entries(transactions_shared)
         self.set_label(address, None)
         if req:= self.get_request_by_addr(address):
             self.delete_request(req.get_id())
@@ -3673,6 +3773,8 @@ class Deterministic_Wallet(Abstract_Wallet):
     def synchronize_sequence(self, for_change: bool) -> int:
         count = 0  # num new addresses we generated
         limit = self.gap_limit_for_change if for_change else self.gap_limit
+        if self.is_restoring():
+            return self._synchronize_sequence_lookahead(for_change, limit * self.config.WALLET_RESTORE_LOOKAHEAD)
         while True:
             num_addr = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
             if num_addr < limit:
@@ -3690,6 +3792,25 @@ class Deterministic_Wallet(Abstract_Wallet):
                 break
         return count
 
+    def _synchronize_sequence_lookahead(self, for_change: bool, window: int) -> int:
+        # When restoring, we do not wait for history to be deeply confirmed and
+        # SPV-verified: we derive addresses up to `window` past the last one with
+        # any history, so that the synchronizer subscribes to many of them at once.
+        # The surplus is trimmed in finish_restore.
+        if for_change:
+            last_few_addresses = self.get_change_addresses(slice_start=-window)
+        else:
+            last_few_addresses = self.get_receiving_addresses(slice_start=-window)
+        num_unused = 0
+        for address in reversed(last_few_addresses):
+            if self.db.get_addr_history(address):
+                break
+            num_unused += 1
+        count = window - num_unused
+        for i in range(count):
+            self.create_new_address(for_change)
+        return count
+
     def synchronize(self):
         count = 0
         with self.lock:
@@ -3697,6 +3818,37 @@ class Deterministic_Wallet(Abstract_Wallet):
             count += self.synchronize_sequence(True)
         return count
 
+    def is_restoring(self) -> bool:
+        return bool(self.db.get('restoring', False)) and self.config.WALLET_RESTORE_LOOKAHEAD > 0
+
+    def _trim_sequence(self, for_change: bool) -> int:
+        """Removes the unused addresses beyond the gap limit at the end of
+        the sequence. Returns the number of removed addresses."""
+        limit = self.gap_limit_for_change if for_change else self.gap_limit
+        addresses = self.get_change_addresses() if for_change else self.get_receiving_addresses()
+        num_unused = 0
+        for address in reversed(addresses):
+            if self.db.get_addr_history(address) or self.is_address_reserved(address):
+                break
+            num_unused += 1
+        count = max(0, num_unused - limit)
+        for i in range(count):
+            if for_change:
+                address = self.db.remove_last_change_address()
+                if address in self._not_old_change_addresses:
+                    self._not_old_change_addresses.remove(address)
+            else:
+                address = self.db.remove_last_receiving_address()
+            self.adb.remove_address(address)
+        return count
+
+    def finish_restore(self):
+        """Leaves restore mode, once the wallet is synchronized."""
+        with self.lock:
+            count = self._trim_sequence(False) + self._trim_sequence(True)
+            self.db.put('restoring', False)
+        self.logger.info(f'restore finished. trimmed {count} addresses')
+
     def get_all_known_addresses_beyond_gap_limit(self):
         # note that we don't stop at first large gap
         found = set()
@@ -3983,6 +4135,7 @@ def restore_wallet_from_text(
             raise UserFacingException("Seed or key not recognized")
         db.put('keystore', k.dump())
         db.put('wallet_type', 'standard')
+        db.put('restoring', True)
         if gap_limit is not None:
             db.put('gap_limit', gap_limit)
         wallet = Wallet(db, config=config)
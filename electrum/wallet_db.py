@@ -42,6 +42,7 @@ from .invoices import Invoice, Request
 from .keystore import bip44_derivation
 from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction, PartialTxOutput, BadHeaderMagic
 from .logging import Logger
+from .raw_tx_store import RawTxStore, get_raw_tx_store_path
 
 from .lnutil import LOCAL, REMOTE, HTLCOwner, ChannelType
 from . import json_db
@@ -105,7 +106,8 @@ class WalletFileExceptionVersion51(WalletFileException): pass
 
 
 # register dicts that require value conversions not handled by constructor
-json_db.register_dict('transactions', lambda x: tx_from_any(x, deserialize=False), None)
+# note: None means that the tx is in the raw tx store
+json_db.register_dict('transactions', lambda x: tx_from_any(x, deserialize=False) if x is not None else None, None)
 json_db.register_dict('data_loss_protect_remote_pcp', lambda x: bytes.fromhex(x), None)
 json_db.register_dict('contacts', tuple, None)
 # register dicts that require key conversion
@@ -1278,6 +1280,7 @@ class WalletDB(JsonDB):
         storage: Optional['WalletStorage'] = None,
         upgrade: bool = False,
     ):
+        self._raw_tx_store = None  # type: Optional[RawTxStore]
         JsonDB.__init__(self, s, storage=storage, encoder=MyEncoder, upgrader=partial(upgrade_wallet_db, do_upgrade=upgrade))
         # create pointers
         self.load_transactions()
@@ -1437,21 +1440,88 @@ class WalletDB(JsonDB):
         if tx_hash != tx.txid():
             raise Exception(f"trying to add tx to db with inconsistent txid: {tx_hash} != {tx.txid()}")
         # don't allow overwriting complete tx with partial tx
-        tx_we_already_have = self.transactions.get(tx_hash, None)
+        tx_we_already_have = self.get_transaction(tx_hash)
         if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
-            self.transactions[tx_hash] = tx
+            if self._raw_tx_store is not None and not isinstance(tx, PartialTransaction):
+                self._raw_tx_store.add(tx_hash, tx.serialize_as_bytes())
+                self.transactions[tx_hash] = None
+            else:
+                self.transactions[tx_hash] = tx
 
     @modifier
     def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
         assert isinstance(tx_hash, str)
-        return self.transactions.pop(tx_hash, None)
+        tx = self.get_transaction(tx_hash)
+        self.transactions.pop(tx_hash, None)
+        return tx
 
     @locked
     def get_transaction(self, tx_hash: Optional[str]) -> Optional[Transaction]:
         if tx_hash is None:
             return None
         assert isinstance(tx_hash, str)
-        return self.transactions.get(tx_hash)
+        tx = self.transactions.get(tx_hash)
+        if tx is None and self._raw_tx_store is not None and tx_hash in self.transactions:
+            tx = self._raw_tx_store.get_transaction(tx_hash)
+        return tx
+
+    @locked
+    def enable_raw_tx_store(self) -> None:
+        """Moves complete transactions out of the json wallet file,
+        into a RawTxStore next to it.
+        """
+        if not self.storage or self.storage.is_encrypted() or self._raw_tx_store is not None:
+            return
+        self._raw_tx_store = RawTxStore(get_raw_tx_store_path(self.storage.path))
+        self.put('use_raw_tx_store', True)
+        for tx_hash, tx in list(self.transactions.items()):
+            if tx is not None and not isinstance(tx, PartialTransaction):
+                self._raw_tx_store.add(tx_hash, tx.serialize_as_bytes())
+                self.transactions[tx_hash] = None
+
+    @locked
+    def disable_raw_tx_store(self) -> None:
+        """Moves transactions back into the json wallet file,
+        and deletes the RawTxStore.
+        """
+        if self._raw_tx_store is None:
+            return
+        for tx_hash, tx in list(self.transactions.items()):
+            if tx is None:
+                self.transactions[tx_hash] = self._raw_tx_store.get_transaction(tx_hash)
+        self.put('use_raw_tx_store', None)
+        if self.storage.file_exists():
+            self.write_and_force_consolidation()
+        self._raw_tx_store.close()
+        os.unlink(self._raw_tx_store.path)
+        self._raw_tx_store = None
+
+    def can_encrypt_storage(self) -> bool:
+        return True
+
+    @locked
+    def dump_without_raw_tx_store(self, *, human_readable: bool = True) -> str:
+        """Serializes the DB with the transactions of the raw tx store in it."""
+        data = json.loads(self.dump(human_readable=False))
+        if data.pop('use_raw_tx_store', None):
+            transactions = data.get('transactions', {})
+            for tx_hash, tx in transactions.items():
+                if tx is None:
+                    transactions[tx_hash] = self.get_transaction(tx_hash).serialize()
+        return json.dumps(data, indent=4 if human_readable else None, sort_keys=bool(human_readable))
+
+    @locked
+    def write(self):
+        # txs referenced by the wallet file must be on disk first
+        if self._raw_tx_store is not None:
+            self._raw_tx_store.flush()
+        JsonDB.write(self)
+
+    @locked
+    def write_and_force_consolidation(self):
+        if self._raw_tx_store is not None:
+            self._raw_tx_store.flush()
+        JsonDB.write_and_force_consolidation(self)
 
     @locked
     def list_transactions(self) -> Sequence[str]:
@@ -1512,6 +1582,20 @@ class WalletDB(JsonDB):
         assert isinstance(txid, str)
         return txid in self.verified_tx
 
+    @locked
+    def get_history_deltas(self) -> Dict[str, int]:
+        return dict(self.history_deltas)
+
+    @modifier
+    def set_history_delta(self, txid: str, delta: int) -> None:
+        assert isinstance(txid, str)
+        self.history_deltas[txid] = delta
+
+    @modifier
+    def remove_history_delta(self, txid: str) -> None:
+        assert isinstance(txid, str)
+        self.history_deltas.pop(txid, None)
+
     @modifier
     def add_tx_fee_from_server(self, txid: str, fee_sat: Optional[int]) -> None:
         assert isinstance(txid, str)
@@ -1601,6 +1685,18 @@ class WalletDB(JsonDB):
         self._addr_to_addr_index[addr] = (0, len(self.receiving_addresses))
         self.receiving_addresses.append(addr)
 
+    @modifier
+    def remove_last_change_address(self) -> str:
+        addr = self.change_addresses.pop()
+        self._addr_to_addr_index.pop(addr, None)
+        return addr
+
+    @modifier
+    def remove_last_receiving_address(self) -> str:
+        addr = self.receiving_addresses.pop()
+        self._addr_to_addr_index.pop(addr, None)
+        return addr
+
     @locked
     def get_address_index(self, address: str) -> Optional[Sequence[int]]:
         assert isinstance(address, str)
@@ -1660,8 +1756,22 @@ class WalletDB(JsonDB):
         self.history = self.get_dict('addr_history')             # address -> list of (txid, height)
         self.verified_tx = self.get_dict('verified_tx3')         # txid -> (height, timestamp, txpos, header_hash)
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
+        self.history_deltas = self.get_dict('history_deltas')    # txid -> delta on all our addresses
         # scripthash -> outpoint -> value
         self._prevouts_by_scripthash = self.get_dict('prevouts_by_scripthash')  # type: Dict[str, Dict[str, int]]
+        if self.storage and RawTxStore.exists_for(self.storage.path):
+            self._raw_tx_store = RawTxStore(get_raw_tx_store_path(self.storage.path))
+        # txs are written to the raw tx store before the wallet file references them,
+        # so missing txs mean that the store was lost. Do not touch the wallet file.
+        if self.get('use_raw_tx_store'):
+            missing = [tx_hash for tx_hash, tx in self.transactions.items()
+                       if tx is None and (self._raw_tx_store is None or tx_hash not in self._raw_tx_store)]
+            if missing:
+                store_path = get_raw_tx_store_path(self.storage.path) if self.storage else None
+                raise WalletFileException(
+                    f"{len(missing)} transactions are missing from the raw transaction store "
+                    f"of this wallet ({store_path}). Restore that file next to the wallet file, "
+                    f"from the same copy of the wallet.")
         # remove unreferenced tx
         for tx_hash in list(self.transactions.keys()):
             if not self.get_txi_addresses(tx_hash) and not self.get_txo_addresses(tx_hash):
@@ -1674,6 +1784,8 @@ class WalletDB(JsonDB):
                 if spending_txid not in self.transactions:
                     self.logger.info("removing unreferenced spent outpoint")
                     d.pop(prevout_n)
+        if self._raw_tx_store is not None:
+            self._raw_tx_store.compact_if_needed(self.list_transactions())
 
     @modifier
     def clear_history(self):
@@ -1684,6 +1796,7 @@ class WalletDB(JsonDB):
         self.history.clear()
         self.verified_tx.clear()
         self.tx_fees.clear()
+        self.history_deltas.clear()
         self._prevouts_by_scripthash.clear()
 
     def _should_convert_to_stored_dict(self, key) -> bool:
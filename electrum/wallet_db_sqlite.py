@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2024 The Electrum Developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A WalletDB that keeps the transaction history of the wallet in an
+# sqlite database next to the wallet file (wallet_path + '.sqlite').
+# The rest of the wallet (keystore, labels, invoices, channels, ...)
+# stays in the json wallet file.
+#
+# History sections are read on demand from indexed tables, instead of
+# being loaded in memory when the wallet is opened. Changes are
+# committed when the wallet is saved.
+#
+# Note: the sqlite file is not encrypted. Wallets with storage
+# encryption cannot be converted, and storage encryption cannot be
+# enabled on converted wallets.
+
+import os
+import json
+import threading
+import sqlite3
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Sequence, TYPE_CHECKING, Union
+
+from .util import profiler, WalletFileException, TxMinedInfo
+from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction
+from .json_db import locked, modifier
+from .wallet_db import WalletDB, TxFeesValue
+
+if TYPE_CHECKING:
+    from .storage import WalletStorage
+
+
+# key of the json wallet file that indicates that history is in sqlite
+SQLITE_HISTORY_KEY = 'sqlite_history'
+
+# json sections that are moved to sqlite
+HISTORY_SECTIONS = [
+    'txi', 'txo', 'transactions', 'spent_outpoints', 'addr_history',
+    'verified_tx3', 'tx_fees', 'prevouts_by_scripthash', 'history_deltas',
+]
+
+
+def get_sqlite_path(wallet_path: str) -> str:
+    return wallet_path + '.sqlite'
+
+
+class SqliteWalletDB(WalletDB):
+
+    def __init__(
+        self,
+        s: str,
+        *,
+        storage: 'WalletStorage',
+        upgrade: bool = False,
+    ):
+        assert storage is not None
+        self.sql_path = get_sqlite_path(storage.path)
+        # the connection is shared between threads, and protected by self.lock
+        self.conn = sqlite3.connect(self.sql_path, check_same_thread=False)
+        self.create_database()
+        WalletDB.__init__(self, s, storage=storage, upgrade=upgrade)
+        if not self.get(SQLITE_HISTORY_KEY):
+            raise WalletFileException("wallet history is not in sqlite")
+
+    @classmethod
+    def exists_for(cls, wallet_path: str) -> bool:
+        return os.path.exists(get_sqlite_path(wallet_path))
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute("""CREATE TABLE IF NOT EXISTS transactions (txid TEXT PRIMARY KEY, raw TEXT NOT NULL)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS txi (
+            txid TEXT NOT NULL, address TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL,
+            PRIMARY KEY(txid, address, prevout))""")
+        c.execute("""CREATE TABLE IF NOT EXISTS txo (
+            txid TEXT NOT NULL, address TEXT NOT NULL, n INTEGER NOT NULL,
+            value INTEGER NOT NULL, is_coinbase INTEGER NOT NULL,
+            PRIMARY KEY(txid, address, n))""")
+        c.execute("""CREATE INDEX IF NOT EXISTS txi_address ON txi (address)""")
+        c.execute("""CREATE INDEX IF NOT EXISTS txo_address ON txo (address)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS spent_outpoints (
+            prevout_hash TEXT NOT NULL, prevout_n TEXT NOT NULL, spending_txid TEXT NOT NULL,
+            PRIMARY KEY(prevout_hash, prevout_n))""")
+        c.execute("""CREATE INDEX IF NOT EXISTS spent_outpoints_spender ON spent_outpoints (spending_txid)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS addr_history (address TEXT PRIMARY KEY, history TEXT NOT NULL)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS verified_tx (
+            txid TEXT PRIMARY KEY, height INTEGER NOT NULL, timestamp INTEGER,
+            txpos INTEGER, header_hash TEXT)""")
+        c.execute("""CREATE INDEX IF NOT EXISTS verified_tx_height ON verified_tx (height)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS tx_fees (
+            txid TEXT PRIMARY KEY, fee INTEGER, is_calculated_by_us INTEGER NOT NULL, num_inputs INTEGER)""")
+        c.execute("""CREATE TABLE IF NOT EXISTS prevouts_by_scripthash (
+            scripthash TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL,
+            PRIMARY KEY(scripthash, prevout))""")
+        c.execute("""CREATE TABLE IF NOT EXISTS history_deltas (txid TEXT PRIMARY KEY, delta INTEGER NOT NULL)""")
+        self.conn.commit()
+
+    def _query(self, sql: str, args=()) -> list:
+        return self.conn.execute(sql, args).fetchall()
+
+    def _execute(self, sql: str, args=()) -> None:
+        self.conn.execute(sql, args)
+        self.set_modified(True)
+
+    @locked
+    def write(self):
+        self.conn.commit()
+        WalletDB.write(self)
+
+    @locked
+    @profiler
+    def write_and_force_consolidation(self):
+        # same as JsonDB, but only writes the json part
+        if threading.current_thread().daemon:
+            raise Exception('daemon thread cannot write db')
+        self.conn.commit()
+        if not self.modified():
+            return
+        json_str = WalletDB.dump(self, human_readable=not self.storage.is_encrypted())
+        self.storage.write(json_str)
+        self._clear_pending_changes()
+        self.set_modified(False)
+
+    @locked
+    def dump(self, *, human_readable: bool = True) -> str:
+        """Serializes the DB as a json wallet file, including history."""
+        data = json.loads(WalletDB.dump(self, human_readable=False))
+        data.pop(SQLITE_HISTORY_KEY, None)
+        data.update(self._history_as_json())
+        return json.dumps(data, indent=4 if human_readable else None, sort_keys=bool(human_readable))
+
+    def _history_as_json(self) -> dict:
+        txi, txo, spent_outpoints, prevouts = {}, {}, {}, {}
+        for txid, addr, prevout, value in self._query("SELECT txid, address, prevout, value FROM txi"):
+            txi.setdefault(txid, {}).setdefault(addr, {})[prevout] = value
+        for txid, addr, n, value, is_cb in self._query("SELECT txid, address, n, value, is_coinbase FROM txo"):
+            txo.setdefault(txid, {}).setdefault(addr, {})[str(n)] = (value, bool(is_cb))
+        for h, n, txid in self._query("SELECT prevout_hash, prevout_n, spending_txid FROM spent_outpoints"):
+            spent_outpoints.setdefault(h, {})[n] = txid
+        for sh, prevout, value in self._query("SELECT scripthash, prevout, value FROM prevouts_by_scripthash"):
+            prevouts.setdefault(sh, {})[prevout] = value
+        return {
+            'txi': txi,
+            'txo': txo,
+            'spent_outpoints': spent_outpoints,
+            'prevouts_by_scripthash': prevouts,
+            'transactions': dict(self._query("SELECT txid, raw FROM transactions")),
+            'addr_history': {
+                addr: json.loads(hist)
+                for addr, hist in self._query("SELECT address, history FROM addr_history")},
+            'verified_tx3': {
+                row[0]: list(row[1:])
+                for row in self._query("SELECT txid, height, timestamp, txpos, header_hash FROM verified_tx")},
+            'tx_fees': {
+                txid: (fee, bool(by_us), num_inputs)
+                for txid, fee, by_us, num_inputs in self._query(
+                    "SELECT txid, fee, is_calculated_by_us, num_inputs FROM tx_fees")},
+            'history_deltas': dict(self._query("SELECT txid, delta FROM history_deltas")),
+        }
+
+    def _import_history_from_json(self, data: dict) -> None:
+        c = self.conn.cursor()
+        for txid, d in data.get('txi', {}).items():
+            for addr, dd in d.items():
+                c.executemany("INSERT INTO txi VALUES (?,?,?,?)", [(txid, addr, ser, v) for ser, v in dd.items()])
+        for txid, d in data.get('txo', {}).items():
+            for addr, dd in d.items():
+                c.executemany("INSERT INTO txo VALUES (?,?,?,?,?)", [
+                    (txid, addr, int(n), v, bool(cb)) for n, (v, cb) in dd.items()])
+        for h, d in data.get('spent_outpoints', {}).items():
+            c.executemany("INSERT INTO spent_outpoints VALUES (?,?,?)", [(h, n, txid) for n, txid in d.items()])
+        for sh, d in data.get('prevouts_by_scripthash', {}).items():
+            c.executemany("INSERT INTO prevouts_by_scripthash VALUES (?,?,?)", [(sh, p, v) for p, v in d.items()])
+        c.executemany("INSERT INTO transactions VALUES (?,?)", data.get('transactions', {}).items())
+        c.executemany("INSERT INTO addr_history VALUES (?,?)", [
+            (addr, json.dumps(hist)) for addr, hist in data.get('addr_history', {}).items()])
+        c.executemany("INSERT INTO verified_tx VALUES (?,?,?,?,?)", [
+            (txid, *v) for txid, v in data.get('verified_tx3', {}).items()])
+        c.executemany("INSERT INTO tx_fees VALUES (?,?,?,?)", [
+            (txid, *TxFeesValue(*v)) for txid, v in data.get('tx_fees', {}).items()])
+        c.executemany("INSERT INTO history_deltas VALUES (?,?)", data.get('history_deltas', {}).items())
+        self.conn.commit()
+
+    def can_encrypt_storage(self) -> bool:
+        # the sqlite file is not encrypted
+        return False
+
+    def enable_raw_tx_store(self) -> None:
+        # raw txs are already in sqlite
+        pass
+
+    @profiler
+    def load_transactions(self):
+        # remove unreferenced tx
+        for (tx_hash,) in self._query(
+                "SELECT txid FROM transactions WHERE txid NOT IN (SELECT txid FROM txi UNION SELECT txid FROM txo)"):
+            self.logger.info(f"removing unreferenced tx: {tx_hash}")
+            self._execute("DELETE FROM transactions WHERE txid=?", (tx_hash,))
+        # remove unreferenced outpoints
+        self._execute("DELETE FROM spent_outpoints WHERE spending_txid NOT IN (SELECT txid FROM transactions)")
+        self.conn.commit()
+
+    @modifier
+    def clear_history(self):
+        for table in ['txi', 'txo', 'spent_outpoints', 'transactions', 'addr_history',
+                      'verified_tx', 'tx_fees', 'prevouts_by_scripthash', 'history_deltas']:
+            self._execute(f"DELETE FROM {table}")
+
+    @locked
+    def get_txi_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        return [x[0] for x in self._query("SELECT DISTINCT address FROM txi WHERE txid=?", (tx_hash,))]
+
+    @locked
+    def get_txo_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        return [x[0] for x in self._query("SELECT DISTINCT address FROM txo WHERE txid=?", (tx_hash,))]
+
+    @locked
+    def get_txi_addr(self, tx_hash: str, address: str) -> Iterable[Tuple[str, int]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        return self._query("SELECT prevout, value FROM txi WHERE txid=? AND address=?", (tx_hash, address))
+
+    @locked
+    def get_txo_addr(self, tx_hash: str, address: str) -> Dict[int, Tuple[int, bool]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        rows = self._query("SELECT n, value, is_coinbase FROM txo WHERE txid=? AND address=?", (tx_hash, address))
+        return {n: (v, bool(cb)) for (n, v, cb) in rows}
+
+    @modifier
+    def add_txi_addr(self, tx_hash: str, addr: str, ser: str, v: int) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(ser, str)
+        assert isinstance(v, int)
+        self._execute("REPLACE INTO txi VALUES (?,?,?,?)", (tx_hash, addr, ser, v))
+
+    @modifier
+    def add_txo_addr(self, tx_hash: str, addr: str, n: Union[int, str], v: int, is_coinbase: bool) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(v, int)
+        assert isinstance(is_coinbase, bool)
+        self._execute("REPLACE INTO txo VALUES (?,?,?,?,?)", (tx_hash, addr, int(n), v, is_coinbase))
+
+    @locked
+    def list_txi(self) -> Sequence[str]:
+        return [x[0] for x in self._query("SELECT DISTINCT txid FROM txi")]
+
+    @locked
+    def list_txo(self) -> Sequence[str]:
+        return [x[0] for x in self._query("SELECT DISTINCT txid FROM txo")]
+
+    @modifier
+    def remove_txi(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self._execute("DELETE FROM txi WHERE txid=?", (tx_hash,))
+
+    @modifier
+    def remove_txo(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self._execute("DELETE FROM txo WHERE txid=?", (tx_hash,))
+
+    @locked
+    def list_spent_outpoints(self) -> Sequence[Tuple[str, str]]:
+        return self._query("SELECT prevout_hash, prevout_n FROM spent_outpoints")
+
+    @locked
+    def get_spent_outpoints(self, prevout_hash: str) -> Sequence[str]:
+        assert isinstance(prevout_hash, str)
+        return [x[0] for x in self._query(
+            "SELECT prevout_n FROM spent_outpoints WHERE prevout_hash=?", (prevout_hash,))]
+
+    @locked
+    def get_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> Optional[str]:
+        assert isinstance(prevout_hash, str)
+        rows = self._query(
+            "SELECT spending_txid FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?",
+            (prevout_hash, str(prevout_n)))
+        return rows[0][0] if rows else None
+
+    @modifier
+    def remove_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> None:
+        assert isinstance(prevout_hash, str)
+        self._execute(
+            "DELETE FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?",
+            (prevout_hash, str(prevout_n)))
+
+    @modifier
+    def set_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str], tx_hash: str) -> None:
+        assert isinstance(prevout_hash, str)
+        assert isinstance(tx_hash, str)
+        self._execute("REPLACE INTO spent_outpoints VALUES (?,?,?)", (prevout_hash, str(prevout_n), tx_hash))
+
+    @modifier
+    def add_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self._execute("REPLACE INTO prevouts_by_scripthash VALUES (?,?,?)", (scripthash, prevout.to_str(), value))
+
+    @modifier
+    def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self._execute(
+            "DELETE FROM prevouts_by_scripthash WHERE scripthash=? AND prevout=?",
+            (scripthash, prevout.to_str()))
+
+    @locked
+    def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[TxOutpoint, int]]:
+        assert isinstance(scripthash, str)
+        rows = self._query("SELECT prevout, value FROM prevouts_by_scripthash WHERE scripthash=?", (scripthash,))
+        return {(TxOutpoint.from_str(prevout), value) for prevout, value in rows}
+
+    @modifier
+    def add_transaction(self, tx_hash: str, tx: Transaction) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(tx, Transaction), tx
+        tx = tx_from_any(str(tx))
+        if not tx_hash:
+            raise Exception("trying to add tx to db without txid")
+        if tx_hash != tx.txid():
+            raise Exception(f"trying to add tx to db with inconsistent txid: {tx_hash} != {tx.txid()}")
+        # don't allow overwriting complete tx with partial tx
+        tx_we_already_have = self.get_transaction(tx_hash)
+        if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
+            self._execute("REPLACE INTO transactions VALUES (?,?)", (tx_hash, tx.serialize()))
+
+    @modifier
+    def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
+        assert isinstance(tx_hash, str)
+        tx = self.get_transaction(tx_hash)
+        self._execute("DELETE FROM transactions WHERE txid=?", (tx_hash,))
+        return tx
+
+    @locked
+    def get_transaction(self, tx_hash: Optional[str]) -> Optional[Transaction]:
+        if tx_hash is None:
+            return None
+        assert isinstance(tx_hash, str)
+        rows = self._query("SELECT raw FROM transactions WHERE txid=?", (tx_hash,))
+        return tx_from_any(rows[0][0], deserialize=False) if rows else None
+
+    @locked
+    def list_transactions(self) -> Sequence[str]:
+        return [x[0] for x in self._query("SELECT txid FROM transactions")]
+
+    @locked
+    def get_history(self) -> Sequence[str]:
+        return [x[0] for x in self._query("SELECT address FROM addr_history")]
+
+    @locked
+    def is_addr_in_history(self, addr: str) -> bool:
+        assert isinstance(addr, str)
+        return bool(self._query("SELECT 1 FROM addr_history WHERE address=?", (addr,)))
+
+    @locked
+    def get_addr_history(self, addr: str) -> Sequence[Tuple[str, int]]:
+        assert isinstance(addr, str)
+        rows = self._query("SELECT history FROM addr_history WHERE address=?", (addr,))
+        return json.loads(rows[0][0]) if rows else []
+
+    @modifier
+    def set_addr_history(self, addr: str, hist) -> None:
+        assert isinstance(addr, str)
+        self._execute("REPLACE INTO addr_history VALUES (?,?)", (addr, json.dumps(hist)))
+
+    @modifier
+    def remove_addr_history(self, addr: str) -> None:
+        assert isinstance(addr, str)
+        self._execute("DELETE FROM addr_history WHERE address=?", (addr,))
+
+    @locked
+    def list_verified_tx(self) -> Sequence[str]:
+        return [x[0] for x in self._query("SELECT txid FROM verified_tx")]
+
+    @locked
+    def get_verified_tx(self, txid: str) -> Optional[TxMinedInfo]:
+        assert isinstance(txid, str)
+        rows = self._query("SELECT height, timestamp, txpos, header_hash FROM verified_tx WHERE txid=?", (txid,))
+        if not rows:
+            return None
+        height, timestamp, txpos, header_hash = rows[0]
+        return TxMinedInfo(height=height,
+                           conf=None,
+                           timestamp=timestamp,
+                           txpos=txpos,
+                           header_hash=header_hash)
+
+    @modifier
+    def add_verified_tx(self, txid: str, info: TxMinedInfo):
+        assert isinstance(txid, str)
+        assert isinstance(info, TxMinedInfo)
+        self._execute(
+            "REPLACE INTO verified_tx VALUES (?,?,?,?,?)",
+            (txid, info.height, info.timestamp, info.txpos, info.header_hash))
+
+    @modifier
+    def remove_verified_tx(self, txid: str):
+        assert isinstance(txid, str)
+        self._execute("DELETE FROM verified_tx WHERE txid=?", (txid,))
+
+    @locked
+    def is_in_verified_tx(self, txid: str) -> bool:
+        assert isinstance(txid, str)
+        return bool(self._query("SELECT 1 FROM verified_tx WHERE txid=?", (txid,)))
+
+    @locked
+    def get_history_deltas(self) -> Dict[str, int]:
+        return dict(self._query("SELECT txid, delta FROM history_deltas"))
+
+    @modifier
+    def set_history_delta(self, txid: str, delta: int) -> None:
+        assert isinstance(txid, str)
+        self._execute("REPLACE INTO history_deltas VALUES (?,?)", (txid, delta))
+
+    @modifier
+    def remove_history_delta(self, txid: str) -> None:
+        assert isinstance(txid, str)
+        self._execute("DELETE FROM history_deltas WHERE txid=?", (txid,))
+
+    def _get_tx_fees_value(self, txid: str) -> Optional[TxFeesValue]:
+        rows = self._query("SELECT fee, is_calculated_by_us, num_inputs FROM tx_fees WHERE txid=?", (txid,))
+        if not rows:
+            return None
+        fee, by_us, num_inputs = rows[0]
+        return TxFeesValue(fee=fee, is_calculated_by_us=bool(by_us), num_inputs=num_inputs)
+
+    def _set_tx_fees_value(self, txid: str, value: TxFeesValue) -> None:
+        self._execute("REPLACE INTO tx_fees VALUES (?,?,?,?)", (txid, *value))
+
+    @modifier
+    def add_tx_fee_from_server(self, txid: str, fee_sat: Optional[int]) -> None:
+        assert isinstance(txid, str)
+        # note: when called with (fee_sat is None), rm currently saved value
+        tx_fees_value = self._get_tx_fees_value(txid) or TxFeesValue()
+        if tx_fees_value.is_calculated_by_us:
+            return
+        self._set_tx_fees_value(txid, tx_fees_value._replace(fee=fee_sat, is_calculated_by_us=False))
+
+    @modifier
+    def add_tx_fee_we_calculated(self, txid: str, fee_sat: Optional[int]) -> None:
+        assert isinstance(txid, str)
+        if fee_sat is None:
+            return
+        assert isinstance(fee_sat, int)
+        tx_fees_value = self._get_tx_fees_value(txid) or TxFeesValue()
+        self._set_tx_fees_value(txid, tx_fees_value._replace(fee=fee_sat, is_calculated_by_us=True))
+
+    @locked
+    def get_tx_fee(self, txid: str, *, trust_server: bool = False) -> Optional[int]:
+        assert isinstance(txid, str)
+        tx_fees_value = self._get_tx_fees_value(txid)
+        if tx_fees_value is None:
+            return None
+        if not trust_server and not tx_fees_value.is_calculated_by_us:
+            return None
+        return tx_fees_value.fee
+
+    @modifier
+    def add_num_inputs_to_tx(self, txid: str, num_inputs: int) -> None:
+        assert isinstance(txid, str)
+        assert isinstance(num_inputs, int)
+        tx_fees_value = self._get_tx_fees_value(txid) or TxFeesValue()
+        self._set_tx_fees_value(txid, tx_fees_value._replace(num_inputs=num_inputs))
+
+    @locked
+    def get_num_all_inputs_of_tx(self, txid: str) -> Optional[int]:
+        assert isinstance(txid, str)
+        tx_fees_value = self._get_tx_fees_value(txid)
+        if tx_fees_value is None:
+            return None
+        return tx_fees_value.num_inputs
+
+    @locked
+    def get_num_ismine_inputs_of_tx(self, txid: str) -> int:
+        assert isinstance(txid, str)
+        return self._query("SELECT COUNT(*) FROM txi WHERE txid=?", (txid,))[0][0]
+
+    @modifier
+    def remove_tx_fee(self, txid: str) -> None:
+        assert isinstance(txid, str)
+        self._execute("DELETE FROM tx_fees WHERE txid=?", (txid,))
+
+
+def open_wallet_db(storage: 'WalletStorage', *, upgrade: bool = False) -> WalletDB:
+    """Returns the db of a wallet file: a SqliteWalletDB if its history is
+    in sqlite, else a WalletDB. Encrypted storage must be decrypted first.
+    """
+    if SqliteWalletDB.exists_for(storage.path):
+        return SqliteWalletDB(storage.read(), storage=storage, upgrade=upgrade)
+    db = WalletDB(storage.read(), storage=storage, upgrade=upgrade)
+    if db.get(SQLITE_HISTORY_KEY):
+        raise WalletFileException(f"the history of this wallet is in a missing file: {get_sqlite_path(storage.path)}")
+    return db
+
+
+def convert_wallet_to_sqlite(storage: 'WalletStorage') -> None:
+    """Moves the history of a json wallet file to sqlite. One-shot, the
+    wallet must not be open.
+    """
+    if storage.is_encrypted():
+        raise WalletFileException("cannot convert a wallet with storage encryption")
+    if SqliteWalletDB.exists_for(storage.path):
+        raise WalletFileException(f"file already exists: {get_sqlite_path(storage.path)}")
+    # this raises if the wallet file needs an upgrade
+    json_db = WalletDB(storage.read(), storage=storage)
+    # txs of the raw tx store are moved to sqlite too
+    data = json.loads(json_db.dump_without_raw_tx_store(human_readable=False))
+    raw_tx_store = json_db._raw_tx_store
+    history = {k: data.pop(k, {}) for k in HISTORY_SECTIONS}
+    data[SQLITE_HISTORY_KEY] = True
+    db = SqliteWalletDB(json.dumps(data), storage=storage)
+    try:
+        db._import_history_from_json(history)
+        db.set_modified(True)
+        db.write_and_force_consolidation()
+    except BaseException:
+        db.conn.close()
+        os.unlink(db.sql_path)
+        raise
+    finally:
+        if raw_tx_store is not None:
+            raw_tx_store.close()
+    db.conn.close()
+    if raw_tx_store is not None:
+        os.unlink(raw_tx_store.path)
+
+
+def convert_wallet_to_json(storage: 'WalletStorage') -> None:
+    """Writes the history back into the json wallet file,
+    and deletes the sqlite file. The wallet must not be open.
+    """
+    db = SqliteWalletDB(storage.read(), storage=storage)
+    json_str = db.dump()
+    db.conn.close()
+    storage.write(json_str)
+    os.unlink(db.sql_path)
@@ -646,6 +646,9 @@ class NewWalletWizard(AbstractWizard):
                 db.put('keystore', k.dump())
             db.put('addresses', addresses)
 
+        if data['wallet_type'] != 'imported' and data.get('keystore_type') != 'createseed':
+            db.put('restoring', True)  # see Deterministic_Wallet.is_restoring
+
         if k and k.can_have_deterministic_lightning_xprv():
             db.put('lightning_xprv', k.get_lightning_xprv(data['password']))
 
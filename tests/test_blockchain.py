@@ -4,7 +4,8 @@ import os
 
 from electrum import constants, blockchain
 from electrum.simple_config import SimpleConfig
-from electrum.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader
+from electrum.blockchain import (Blockchain, deserialize_header, serialize_header, hash_header, InvalidHeader,
+                                 MissingHeader, HEADER_SIZE)
 from electrum.util import bfh, make_dir
 
 from . import ElectrumTestCase
@@ -384,6 +385,78 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual([chain_u], self.get_chains_that_contain_header_helper(self.HEADERS['O']))
         self.assertEqual([chain_z, chain_l], self.get_chains_that_contain_header_helper(self.HEADERS['I']))
 
+    def test_header_cache_follows_headers_file(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEF':
+            self._append_header(chain_u, self.HEADERS[name])
+        self.assertEqual(self.HEADERS['F'], chain_u.read_header(5))
+        self.assertEqual(hash_header(self.HEADERS['E']), chain_u.get_hash(4))
+        # the returned dict is a copy
+        chain_u.read_header(5)['nonce'] = 0
+        self.assertEqual(self.HEADERS['F'], chain_u.read_header(5))
+        # truncate the file
+        chain_u.write(b'', 4 * HEADER_SIZE)
+        self.assertEqual(3, chain_u.height())
+        self.assertIsNone(chain_u.read_header(5))
+        with self.assertRaises(MissingHeader):
+            chain_u.get_hash(4)
+        self._append_header(chain_u, self.HEADERS['E'])
+        self.assertEqual(hash_header(self.HEADERS['E']), chain_u.get_hash(4))
+        # reads work without the memory map too
+        chain_u.close_headers_file()
+        self.assertEqual(self.HEADERS['D'], chain_u.read_header(3))
+
+    def test_connect_headers(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        self._append_header(chain_u, self.HEADERS['A'])
+        # the verified prefix is saved, up to the first header that does not connect
+        headers = [self.HEADERS[name] for name in 'BCDEFHI']
+        self.assertEqual(5, chain_u.connect_headers(headers))
+        self.assertEqual(5, chain_u.height())
+        self.assertEqual(6 * HEADER_SIZE, os.path.getsize(chain_u.path()))
+        self.assertEqual(self.HEADERS['F'], chain_u.read_header(5))
+        self.assertEqual(0, chain_u.connect_headers([self.HEADERS['P']]))
+        self.assertEqual(5, chain_u.height())
+
+        chain_l = chain_u.fork(self.HEADERS['G'])
+        self.assertEqual(2, chain_l.connect_headers([self.HEADERS[name] for name in 'HI']))
+        self.assertEqual(3, chain_u.connect_headers([self.HEADERS[name] for name in 'OPQ']))
+        # the fork becomes the best chain after a batch
+        self.assertEqual(3, chain_l.connect_headers([self.HEADERS[name] for name in 'JKL']))
+        self.assertEqual(11, chain_l.height())
+        self.assertEqual(constants.net.GENESIS, chain_l.get_id())
+        self.assertEqual(chain_l, blockchain.get_best_chain())
+        self.assertEqual(chain_l, chain_u.parent)
+
+    def test_verify_chunk(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        data = b''.join(serialize_header(self.HEADERS[name]) for name in 'ABCDEF')
+        chain_u.verify_chunk(0, data)
+        bad_data = b''.join(serialize_header(self.HEADERS[name]) for name in 'ABDCEF')
+        with self.assertRaisesRegex(InvalidHeader, "prev hash mismatch"):
+            chain_u.verify_chunk(0, bad_data)
+        # the difficulty rules are not checked on regtest, but the proof of work of the bits is
+        header = dict(self.HEADERS['F'])
+        while int(hash_header(header), 16) <= Blockchain.bits_to_target(header['bits']):
+            header['nonce'] += 1
+        with self.assertRaisesRegex(InvalidHeader, "insufficient proof of work"):
+            chain_u.verify_chunk(0, data[:-HEADER_SIZE] + serialize_header(header))
+        # headers we already have must match
+        for name in 'ABCDEFO':
+            self._append_header(chain_u, self.HEADERS[name])
+        chain_u.verify_chunk(0, data + serialize_header(self.HEADERS['O']))
+        with self.assertRaisesRegex(InvalidHeader, "hash mismatches with expected"):
+            chain_u.verify_chunk(0, data + serialize_header(self.HEADERS['G']))
+
     def test_target_to_bits(self):
         # https://github.com/bitcoin/bitcoin/blob/7fcf53f7b4524572d1d0c9a5fdc388e87eb02416/src/arith_uint256.h#L269
         self.assertEqual(0x05123456, Blockchain.target_to_bits(0x1234560000))
@@ -426,6 +499,50 @@ class TestBlockchain(ElectrumTestCase):
             Blockchain.bits_to_target(0xff123456)
 
 
+class TestChainworkCache(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.path = os.path.join(self.config.path, 'chainwork_cache')
+
+    def tearDown(self):
+        if blockchain._chainwork_cache_file is not None:
+            blockchain._chainwork_cache_file.close()
+            blockchain._chainwork_cache_file = None
+        super().tearDown()
+
+    def test_checkpoints(self):
+        blockchain.load_chainwork_cache(self.config)
+        (h0, t0), (h1, t1) = constants.net.CHECKPOINTS[:2]
+        work0 = 2016 * (2**256 // (blockchain.MAX_TARGET + 1))
+        self.assertEqual(work0, blockchain._CHAINWORK_CACHE[h0])
+        self.assertEqual(work0 + 2016 * (2**256 // (t0 + 1)), blockchain._CHAINWORK_CACHE[h1])
+
+    def test_entries_are_persisted(self):
+        blockchain.load_chainwork_cache(self.config)
+        blockchain._add_to_chainwork_cache('11' * 32, 1234)
+        blockchain._add_to_chainwork_cache('22' * 32, 5678)
+        # simulate a torn write
+        with open(self.path, 'ab') as f:
+            f.write(bytes(10))
+        blockchain.load_chainwork_cache(self.config)
+        self.assertEqual(1234, blockchain._CHAINWORK_CACHE['11' * 32])
+        self.assertEqual(5678, blockchain._CHAINWORK_CACHE['22' * 32])
+        self.assertEqual(len(blockchain.CHAINWORK_CACHE_MAGIC) + 2 * 68, os.path.getsize(self.path))
+
+    def test_inconsistent_with_checkpoints(self):
+        blockchain.load_chainwork_cache(self.config)
+        blockchain._add_to_chainwork_cache('11' * 32, 1234)
+        cp_hash = constants.net.CHECKPOINTS[0][0]
+        blockchain._chainwork_cache_file.write(blockchain._serialize_chainwork_record(cp_hash, 1))
+        blockchain._chainwork_cache_file.flush()
+        blockchain.load_chainwork_cache(self.config)
+        self.assertNotIn('11' * 32, blockchain._CHAINWORK_CACHE)
+        self.assertNotEqual(1, blockchain._CHAINWORK_CACHE[cp_hash])
+        self.assertEqual(len(blockchain.CHAINWORK_CACHE_MAGIC), os.path.getsize(self.path))
+
+
 class TestVerifyHeader(ElectrumTestCase):
 
     # Data for Bitcoin block header #100.
@@ -454,6 +571,20 @@ class TestVerifyHeader(ElectrumTestCase):
             other_target = Blockchain.bits_to_target(0x1d00eeee)
             Blockchain.verify_header(self.header, self.prev_hash, other_target)
 
+    def test_verify_chunk(self):
+        # mainnet blocks 0, 1 and 2
+        data = bfh(
+            "0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c"
+            "010000006fe28c0ab6f1b372c1a6a246ae63f74f931e8365e15a089c68d6190000000000982051fd1e4ba744bbbe680e1fee14677ba1a3c3540bf7b1cdb606e857233e0e61bc6649ffff001d01e36299"
+            "010000004860eb18bf1b1620e37e9490fc8a427514416fd75159ab86688e9a8300000000d5fdcc541e25de1c7a5addedf24858b8bb665c9f36ef744ee42c316022c90f9bb0bc6649ffff001d08d2bd61")
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        chain = Blockchain(config=config, forkpoint=0, parent=None,
+                           forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        chain.verify_chunk(0, data)
+        bad_data = data[:-4] + bytes(4)  # nonce of the last header
+        with self.assertRaisesRegex(InvalidHeader, "insufficient proof of work"):
+            chain.verify_chunk(0, bad_data)
+
     def test_insufficient_pow(self):
         with self.assertRaises(InvalidHeader):
             self.header["nonce"] = 42
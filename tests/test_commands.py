@@ -85,6 +85,15 @@ class TestCommands(ElectrumTestCase):
         ciphertext = await cmds.encrypt(pubkey, cleartext)
         self.assertEqual(cleartext, await cmds.decrypt(pubkey, ciphertext, wallet=wallet))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_onchain_history_unknown_after(self, mock_save_db):
+        wallet = restore_wallet_from_text('p2wpkh:L4rYY5QpfN6wJEF4SEKDpcGhTPnCe9zcGs6hiSnhpprZqVywFifN',
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        cmds = Commands(config=self.config)
+        with self.assertRaisesRegex(UserFacingException, "unknown txid"):
+            await cmds.onchain_history(after="00" * 32, limit=10, wallet=wallet)
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     async def test_export_private_key_imported(self, mock_save_db):
         wallet = restore_wallet_from_text('p2wpkh:L4rYY5QpfN6wJEF4SEKDpcGhTPnCe9zcGs6hiSnhpprZqVywFifN p2wpkh:L4jkdiXszG26SUYvwwJhzGwg37H2nLhrbip7u6crmgNeJysv5FHL',
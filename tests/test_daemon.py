@@ -1,8 +1,11 @@
 import os
 from typing import Optional, Iterable
 
+import aiohttp
+from aiohttp import web
+
 from electrum.commands import Commands
-from electrum.daemon import Daemon
+from electrum.daemon import Daemon, AuthenticatedServer
 from electrum.simple_config import SimpleConfig
 from electrum.wallet import restore_wallet_from_text, Abstract_Wallet
 from electrum import util
@@ -236,3 +239,46 @@ class TestCommandsWithDaemon(DaemonTestCase):
         # in unit tests or custom code, the "wallet" param is often an Abstract_Wallet:
         self.assertEqual("bitter grass shiver impose acquire brush forget axis eager alone wine silver",
                          await cmds.getseed(wallet=wallet))
+
+
+class TestAuthenticatedServer(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server = AuthenticatedServer('user', 'secret')
+        app = web.Application()
+        app.router.add_post("/", self.server.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host='localhost', port=0)
+        await site.start()
+        self.url = 'http://localhost:%d' % site._server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        await super().asyncTearDown()
+
+    async def test_stream_result(self):
+        async def count(n, error=None):
+            def items():
+                for i in range(n):
+                    yield {'i': i}
+                if error:
+                    raise util.UserFacingException(error)
+            return items()
+        async def ping():
+            return True
+        self.server.register_method(count)
+        self.server.register_method(ping)
+        async with aiohttp.ClientSession(auth=aiohttp.BasicAuth('user', 'secret')) as session:
+            client = util.JsonRPCClient(session, self.url)
+            self.assertEqual([{'i': i} for i in range(3)], [item async for item in client.request_stream('count', 3)])
+            items = []
+            with self.assertRaises(util.JsonRPCError) as ctx:
+                async for item in client.request_stream('count', 2, 'oops'):
+                    items.append(item)
+            self.assertEqual([{'i': 0}, {'i': 1}], items)
+            self.assertEqual('oops', ctx.exception.message)
+            # methods that do not stream
+            self.assertEqual([True], [item async for item in client.request_stream('ping')])
+            self.assertEqual(True, await client.request('ping'))
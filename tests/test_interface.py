@@ -1,4 +1,10 @@
-from electrum.interface import ServerAddr
+import asyncio
+import json
+from unittest import mock
+
+from aiorpcx import Notification, RPCError
+
+from electrum.interface import ServerAddr, RequestStats, NotificationSession
 
 from . import ElectrumTestCase
 
@@ -46,3 +52,115 @@ class TestServerAddr(ElectrumTestCase):
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50002, protocol="s").to_friendly_name())
         self.assertEqual("[2400:6180:0:d1::86b:e001]:50001:t",
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50001, protocol="t").to_friendly_name())
+
+
+class TestRequestStats(ElectrumTestCase):
+
+    def test_record(self):
+        stats = RequestStats()
+        self.assertEqual({}, stats.to_dict())
+        for latency in (0.02, 0.03, 0.2, 3.0):
+            stats.record('blockchain.transaction.get', latency=latency, response_size=100)
+        stats.record('blockchain.transaction.get', latency=0.04, error=True)
+        stats.record('blockchain.scripthash.get_history', latency=40, timeout=True)
+        d = stats.to_dict()
+        self.assertEqual(['blockchain.scripthash.get_history', 'blockchain.transaction.get'], list(d))
+        tx_stats = d['blockchain.transaction.get']
+        self.assertEqual(5, tx_stats['count'])
+        self.assertEqual(1, tx_stats['errors'])
+        self.assertEqual(0, tx_stats['timeouts'])
+        self.assertEqual(400, tx_stats['response_bytes'])
+        self.assertAlmostEqual(3.29 / 5, tx_stats['avg_latency'])
+        self.assertEqual(3.0, tx_stats['max_latency'])
+        self.assertEqual(3.0, tx_stats['latency_p90'])
+        self.assertEqual(3, tx_stats['latency_histogram']['<=0.05'])
+        history_stats = d['blockchain.scripthash.get_history']
+        self.assertEqual(1, history_stats['timeouts'])
+        # the last bucket is unbounded
+        self.assertEqual(40, history_stats['latency_p90'])
+        self.assertEqual(1, history_stats['latency_histogram']['<=inf'])
+
+    def test_estimate_response_size(self):
+        self.assertEqual(6, RequestStats.estimate_response_size("abcd"))
+        history = [{'tx_hash': '00' * 32, 'height': 800_000 + i} for i in range(100)]
+        size = len(json.dumps(history))
+        self.assertTrue(0.8 * size < RequestStats.estimate_response_size(history) < 1.2 * size)
+        self.assertEqual(2, RequestStats.estimate_response_size([]))
+
+
+class TestNotificationSession(ElectrumTestCase):
+
+    def _make_session(self) -> NotificationSession:
+        session = NotificationSession(mock.MagicMock(), interface=None)
+        session.num_sent = 0
+        async def _send_request(method, params):
+            session.num_sent += 1
+            await asyncio.sleep(0.01)
+            return f'{method} {params} {session.num_sent}'
+        session._send_request = _send_request
+        return session
+
+    async def test_coalesce_read_methods(self):
+        session = self._make_session()
+        r = await asyncio.gather(*[session.send_request('blockchain.block.header', [1]) for i in range(3)])
+        self.assertEqual(3 * ['blockchain.block.header [1] 1'], r)
+        self.assertEqual(1, session.num_sent)
+        # the header is not cached
+        await session.send_request('blockchain.block.header', [1])
+        self.assertEqual(2, session.num_sent)
+
+    async def test_do_not_coalesce_other_methods(self):
+        session = self._make_session()
+        for method in ('blockchain.transaction.broadcast', 'server.ping'):
+            await asyncio.gather(*[session.send_request(method, ['00']) for i in range(2)])
+        self.assertEqual(4, session.num_sent)
+        self.assertEqual(0, session.num_requests_reused)
+
+    async def test_cache_cleared_on_new_block(self):
+        session = self._make_session()
+        session.subscriptions[session.get_hashable_key_for_rpc_call('blockchain.headers.subscribe', [])].append(asyncio.Queue())
+        await session.send_request('blockchain.transaction.get_merkle', ['aa', 1])
+        await session.send_request('blockchain.transaction.get_merkle', ['aa', 1])
+        self.assertEqual(1, session.num_sent)
+        await session.handle_request(Notification('blockchain.headers.subscribe', [{'height': 2, 'hex': ''}]))
+        await session.send_request('blockchain.transaction.get_merkle', ['aa', 1])
+        self.assertEqual(2, session.num_sent)
+
+    async def test_batches_share_requests(self):
+        session = self._make_session()
+        batches = []
+        async def _send_request_batch(requests, *, timeout=None):
+            batches.append(requests)
+            await asyncio.sleep(0.01)
+            return [RPCError(1, 'not found') if params == ['bad'] else f'{method} {params}'
+                    for method, params in requests]
+        session._send_request_batch = _send_request_batch
+        merkle = ('blockchain.transaction.get_merkle', ['aa', 1])
+        tx = ('blockchain.transaction.get', ['bb'])
+        bad_tx = ('blockchain.transaction.get', ['bad'])
+        # a batch joins a request in flight, and another batch joins the batch
+        r1, r2, r3 = await asyncio.gather(
+            session.send_request(*merkle),
+            session.send_request_batch([merkle, tx, bad_tx]),
+            session.send_request_batch([tx, bad_tx]))
+        self.assertEqual([[tx, bad_tx]], batches)
+        self.assertEqual(1, session.num_sent)
+        self.assertEqual("blockchain.transaction.get_merkle ['aa', 1] 1", r1)
+        self.assertEqual([r1, "blockchain.transaction.get ['bb']"], r2[:2])
+        self.assertEqual(r2[1:], r3)
+        self.assertIsInstance(r2[2], RPCError)
+        # single requests join a batch too, and get its errors
+        task = asyncio.create_task(session.send_request_batch([('blockchain.transaction.get', ['cc']), bad_tx]))
+        await asyncio.sleep(0)
+        r4, r5 = await asyncio.gather(
+            session.send_request('blockchain.transaction.get', ['cc']),
+            session.send_request(*bad_tx),
+            return_exceptions=True)
+        self.assertEqual("blockchain.transaction.get ['cc']", r4)
+        self.assertIsInstance(r5, RPCError)
+        await task
+        self.assertEqual(2, len(batches))
+        # responses of batches are cached
+        self.assertEqual([r1, r2[1]], await session.send_request_batch([merkle, tx]))
+        self.assertEqual(2, len(batches))
+        self.assertEqual(1, session.num_sent)
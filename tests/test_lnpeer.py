@@ -122,6 +122,9 @@ class MockWallet:
     def save_db(self):
         pass
 
+    def flush_db(self):
+        pass
+
     def is_lightning_backup(self):
         return False
 
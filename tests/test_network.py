@@ -1,11 +1,15 @@
 import asyncio
 import tempfile
+import threading
 import unittest
+from unittest import mock
 
 from electrum import constants
 from electrum.simple_config import SimpleConfig
 from electrum import blockchain
-from electrum.interface import Interface, ServerAddr
+from electrum.interface import Interface, ServerAddr, RequestStats
+from electrum.network import Network
+from electrum.blockchain import HEADER_SIZE
 from electrum.crypto import sha256
 from electrum.util import OldTaskGroup
 from electrum import util
@@ -44,6 +48,43 @@ class MockInterface(Interface):
         return
 
 
+class MockChunkSession:
+    """Serves blockchain.block.headers from raw headers, with some latency."""
+
+    def __init__(self, data: bytes, *, latency: float = 0.01):
+        self.data = data
+        self.latency = latency
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_request(self, method, params):
+        assert method == 'blockchain.block.headers', method
+        start_height, count = params
+        self.num_in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.num_in_flight -= 1
+        hexdata = self.data[start_height * HEADER_SIZE:(start_height + count) * HEADER_SIZE].hex()
+        return {'hex': hexdata, 'count': len(hexdata) // (2 * HEADER_SIZE), 'max': 2016}
+
+
+def make_headers(num_headers: int) -> bytes:
+    # regtest headers, with the (low) proof of work of their bits
+    target = blockchain.Blockchain.bits_to_target(0x207fffff)
+    headers = []
+    prev_hash = '00' * 32
+    for height in range(num_headers):
+        header = {'version': 0x20000000, 'prev_block_hash': prev_hash, 'merkle_root': sha256(str(height)).hex(),
+                  'timestamp': 1_700_000_000 + 600 * height, 'bits': 0x207fffff, 'nonce': 0}
+        while int(blockchain.hash_header(header), 16) > target:
+            header['nonce'] += 1
+        headers.append(blockchain.serialize_header(header))
+        prev_hash = blockchain.hash_header(header)
+    return b''.join(headers)
+
+
 class TestNetwork(ElectrumTestCase):
 
     @classmethod
@@ -126,6 +167,51 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(('catchup', 7), res)
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    def _setup_headers_sync(self, data: bytes) -> MockChunkSession:
+        blockchain.blockchains = {}
+        blockchain.read_blockchains(self.config)
+        blockchain.init_headers_file_for_best_chain()
+        self.interface.blockchain = blockchain.get_best_chain()
+        self.interface.session = session = MockChunkSession(data)
+        return session
+
+    async def test_sync_until_pipelines_chunk_requests(self):
+        tip = 5 * 2016 + 100
+        session = self._setup_headers_sync(make_headers(tip + 1))
+        self.config.NETWORK_MAX_OUTSTANDING_CHUNKS = 3
+        res = await self.interface.sync_until(0, next_height=tip)
+        self.assertEqual(('catchup', tip + 1), res)
+        self.assertEqual(tip, self.interface.blockchain.height())
+        self.assertEqual(3, session.max_in_flight)
+        self.assertEqual(0, session.num_in_flight)
+
+    async def test_request_chunks_connects_in_order(self):
+        tip = 5 * 2016 + 100
+        data = bytearray(make_headers(tip + 1))
+        data[3 * 2016 * HEADER_SIZE + 4] ^= 1  # break prev_block_hash of the first header of chunk 3
+        self._setup_headers_sync(bytes(data))
+        # a chunk that does not connect stops the catch-up there
+        res = await self.interface._request_chunks(0, tip)
+        self.assertEqual((True, 3 * 2016), res)
+        self.assertEqual(3 * 2016 - 1, self.interface.blockchain.height())
+        # if it is the first chunk, it could not connect
+        res = await self.interface._request_chunks(3 * 2016, tip)
+        self.assertEqual((False, 3 * 2016), res)
+
+    async def test_get_network_stats(self):
+        network = Network.__new__(Network)  # not started
+        network.interfaces_lock = threading.RLock()
+        network.interfaces = {self.interface.server: self.interface}
+        network.request_stats = RequestStats()
+        self.interface.record_fetch(10, 2.0)
+        self.interface.record_fetch(30, 2.0)
+        stats = network.get_network_stats()
+        self.assertEqual({'mock-server:50000:t': {'items': 40, 'items_per_second': 10.0}}, stats['fetches'])
+        self.assertEqual({}, stats['total'])
+        self.assertEqual({'hits': 0, 'misses': 0}, stats['request_reuse'])
+        self.interface.session = mock.Mock(num_requests_reused=3, num_requests_sent=5)
+        self.assertEqual({'hits': 3, 'misses': 5}, network.get_network_stats()['request_reuse'])
+
 
 if __name__ == "__main__":
     constants.BitcoinRegtest.set_as_network()
@@ -0,0 +1,117 @@
+import os
+
+from electrum.raw_tx_store import RawTxStore, get_raw_tx_store_path
+from electrum.storage import WalletStorage
+from electrum.wallet import restore_wallet_from_text
+from electrum.wallet_db import WalletDB
+from electrum.simple_config import SimpleConfig
+from electrum.daemon import Daemon
+from electrum.transaction import tx_from_any
+from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED
+from electrum.util import WalletFileException
+
+from . import ElectrumTestCase
+
+
+SEED = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+# pays 10000 sat to 1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf
+TX = "02000000000101a97a9ae7fb1a9220fdd170a974987ac24631dcff89b60fa4907c78c3639994db0000000000fdffffff0210270000000000001976a914ea7804a2c266063572cc009a63dc25dcc0e9d9b588ac20491e0000000000160014b8e4fdc91593b67de2bf214694ef47e38dc2ee8e02473044022005326882904906cfa9c1de75333ace1019596f2ab25d21118220d037dfc0e48b02207d0b3f075cfe5e1e0247ff3cdd7155dc05e7459daf1bfa0ea02e9112b9151ec90121026cc6a74c2b0e38661d341ffae48fe7dde5196ca4afe95d28b496673fa4cf646700000000"
+TXID = "f99ca3aafcdfb506f9e0c16c9d8f8df1eb891d40e2120390ff351637ed31d3f8"
+
+
+class TestRawTxStore(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.electrum_path, "somewallet.txs")
+
+    def test_add_and_get(self):
+        store = RawTxStore(self.path)
+        store.add(TXID, bytes.fromhex(TX))
+        self.assertIn(TXID, store)
+        self.assertEqual(TX, store.get_transaction(TXID).serialize())
+        store.flush()
+        store.close()
+        store = RawTxStore(self.path)
+        self.assertEqual(1, len(store))
+        tx = store.get_transaction(TXID)
+        self.assertEqual(TXID, tx.txid())
+        self.assertEqual(2, len(tx.outputs()))
+        self.assertIsNone(store.get_transaction('00' * 32))
+
+    def test_incomplete_record_is_truncated(self):
+        store = RawTxStore(self.path)
+        store.add(TXID, bytes.fromhex(TX))
+        store.flush()
+        store.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(bytes(32) + b'\xff\x00\x00\x00' + b'\x01\x02')
+        store = RawTxStore(self.path)
+        self.assertEqual(1, len(store))
+        self.assertEqual(size, os.path.getsize(self.path))
+
+    def test_compact(self):
+        store = RawTxStore(self.path)
+        store.add(TXID, bytes.fromhex(TX))
+        store.add('00' * 32, bytes(1000))
+        store.compact_if_needed([TXID])
+        self.assertEqual(1, len(store))
+        self.assertEqual(TXID, store.get_transaction(TXID).txid())
+
+
+class TestWalletWithRawTxStore(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.config.WALLET_USE_RAW_TX_STORE = True
+        self.wallet_path = os.path.join(self.electrum_path, "somewallet")
+
+    async def test_txs_are_kept_out_of_wallet_file(self):
+        d = restore_wallet_from_text(SEED, path=self.wallet_path, gap_limit=2, config=self.config)
+        wallet = d['wallet']
+        wallet.adb.receive_tx_callback(tx_from_any(TX), TX_HEIGHT_UNCONFIRMED)
+        await wallet.stop()
+        self.assertTrue(os.path.exists(get_raw_tx_store_path(self.wallet_path)))
+        with open(self.wallet_path, 'r') as f:
+            self.assertNotIn(TX, f.read())
+
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertEqual(TX, wallet.db.get_transaction(TXID).serialize())
+        self.assertEqual((0, 10000, 0), wallet.get_balance())
+
+        # backups contain the txs
+        backup_path = wallet.save_backup(self.electrum_path)
+        self.assertFalse(os.path.exists(get_raw_tx_store_path(backup_path)))
+        with open(backup_path, 'r') as f:
+            self.assertIn(TX, f.read())
+
+        # enabling storage encryption moves txs back into the wallet file
+        wallet.update_password(None, "1234", encrypt_storage=True)
+        self.assertFalse(os.path.exists(get_raw_tx_store_path(self.wallet_path)))
+        self.assertEqual(TX, wallet.db.get_transaction(TXID).serialize())
+        await wallet.stop()
+        wallet = Daemon._load_wallet(self.wallet_path, password="1234", config=self.config)
+        self.assertEqual(TX, wallet.db.get_transaction(TXID).serialize())
+        await wallet.stop()
+
+    def test_missing_store_raises(self):
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB('', storage=storage, upgrade=True)
+        db.enable_raw_tx_store()
+        db.add_transaction(TXID, tx_from_any(TX))
+        db.add_txo_addr(TXID, '1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf', 0, 10000, False)
+        db.write()
+        self.assertIsNone(db.transactions[TXID])
+        store_path = get_raw_tx_store_path(self.wallet_path)
+        os.rename(store_path, store_path + '.bak')
+        storage = WalletStorage(self.wallet_path)
+        with self.assertRaises(WalletFileException) as ctx:
+            WalletDB(storage.read(), storage=storage)
+        self.assertIn(store_path, str(ctx.exception))
+        # the wallet file is untouched: the txs are back with the store
+        os.rename(store_path + '.bak', store_path)
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB(storage.read(), storage=storage)
+        self.assertEqual(TX, db.get_transaction(TXID).serialize())
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from unittest import mock
+
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import Synchronizer
+from electrum.verifier import SPV
+from electrum.wallet import restore_wallet_from_text
+from electrum import util
+
+from . import ElectrumTestCase
+
+
+SEED = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+TXID = "f99ca3aafcdfb506f9e0c16c9d8f8df1eb891d40e2120390ff351637ed31d3f8"
+
+
+class MockNetwork:
+
+    def __init__(self, config):
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.config = config
+        self.interface = None
+        self.tx_cache = mock.Mock()
+
+    def get_local_height(self):
+        return 1000
+
+    def blockchain(self):
+        return mock.Mock(height=self.get_local_height)
+
+
+class TestWakeups(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        path = os.path.join(self.electrum_path, "somewallet")
+        pending_cbs = set(util.callback_mgr._running_cb_futs)
+        self.wallet = restore_wallet_from_text(SEED, path=path, gap_limit=2, config=self.config)['wallet']
+        # the wallet reacts to the events of its adb too; only the jobs are tested here.
+        # the events of the restore must be handled before the jobs start, else they wake them up
+        self.wallet.unregister_callbacks()
+        if restore_cbs := util.callback_mgr._running_cb_futs - pending_cbs:
+            await asyncio.wait([asyncio.wrap_future(fut) for fut in restore_cbs])
+        self.network = MockNetwork(self.config)
+        adb = self.wallet.adb
+        adb.network = self.network
+        adb.synchronizer = self.synchronizer = Synchronizer(adb)
+        adb.verifier = self.verifier = SPV(self.network, adb)
+        # no server
+        self.synchronizer._add_address = mock.AsyncMock()
+        self.verifier._maybe_undo_verifications = mock.AsyncMock()
+        self.verifier._request_proofs = mock.AsyncMock()
+        self.tasks = [asyncio.create_task(self.synchronizer.main()), asyncio.create_task(self.verifier.main())]
+        # let the jobs settle
+        await asyncio.sleep(0.1)
+        self.synchronizer._num_wakeups = self.verifier._num_wakeups = 0
+        self.verifier._request_proofs.reset_mock()
+
+    async def asyncTearDown(self):
+        for task in self.tasks:
+            self.assertFalse(task.done())  # the main loops are still running
+            task.cancel()
+        await self.synchronizer.stop()
+        await self.verifier.stop()
+        await super().asyncTearDown()
+
+    async def test_idle_wallet_does_not_wake_up(self):
+        # the main loop of the synchronizer checks is_up_to_date on each iteration
+        with mock.patch.object(self.wallet.adb, 'is_up_to_date', wraps=self.wallet.adb.is_up_to_date) as is_up_to_date:
+            await asyncio.sleep(0.5)
+        self.assertEqual(0, is_up_to_date.call_count)
+        self.assertEqual(0, self.synchronizer.num_wakeups())
+        self.assertEqual(0, self.verifier.num_wakeups())
+        self.assertEqual(0, self.verifier._request_proofs.call_count)
+
+    async def test_add_address_wakes_up_synchronizer(self):
+        self.synchronizer._add_address.reset_mock()
+        addr = self.wallet.create_new_address(False)
+        await asyncio.sleep(0.05)
+        self.assertEqual(1, self.synchronizer.num_wakeups())
+        self.synchronizer._add_address.assert_called_once_with(addr)
+
+    async def test_unverified_tx_wakes_up_verifier(self):
+        self.wallet.adb.add_unverified_or_unconfirmed_tx(TXID, 900)
+        await asyncio.sleep(0.05)
+        self.assertEqual(1, self.verifier.num_wakeups())
+        self.assertEqual(1, self.verifier._request_proofs.call_count)
+
+    async def test_new_header_wakes_up_verifier(self):
+        self.wallet.adb.on_event_blockchain_updated()
+        await asyncio.sleep(0.05)
+        self.assertEqual(1, self.verifier.num_wakeups())
+        self.assertEqual(1, self.verifier._request_proofs.call_count)
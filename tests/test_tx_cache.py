@@ -0,0 +1,63 @@
+import os
+
+from electrum.tx_cache import TxCache
+from electrum.transaction import Transaction, PartialTransaction
+
+from . import ElectrumTestCase
+
+
+TX1 = "02000000000101a97a9ae7fb1a9220fdd170a974987ac24631dcff89b60fa4907c78c3639994db0000000000fdffffff0210270000000000001976a914ea7804a2c266063572cc009a63dc25dcc0e9d9b588ac20491e0000000000160014b8e4fdc91593b67de2bf214694ef47e38dc2ee8e02473044022005326882904906cfa9c1de75333ace1019596f2ab25d21118220d037dfc0e48b02207d0b3f075cfe5e1e0247ff3cdd7155dc05e7459daf1bfa0ea02e9112b9151ec90121026cc6a74c2b0e38661d341ffae48fe7dde5196ca4afe95d28b496673fa4cf646700000000"
+TXID1 = "f99ca3aafcdfb506f9e0c16c9d8f8df1eb891d40e2120390ff351637ed31d3f8"
+TX2 = "01000000012a5c9a94fcde98f5581cd00162c60a13936ceb75389ea65bf38633b424eb4031000000006c493046022100a82bbc57a0136751e5433f41cf000b3f1a99c6744775e76ec764fb78c54ee100022100f9e80b7de89de861dc6fb0c1429d5da72c2b6b2ee2406bc9bfb1beedd729d985012102e61d176da16edd1d258a200ad9759ef63adf8e14cd97f53227bae35cdb84d2f6ffffffff0140420f00000000001976a914230ac37834073a42146f11ef8414ae929feaafc388ac00000000"
+TXID2 = "8334c637900f1d2cd1d8abbd94a676e0ac92c2a20d19b3ca210a0f538ab157c8"
+
+
+class TestTxCache(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.electrum_path, "tx_cache")
+
+    def test_add_and_get(self):
+        cache = TxCache(max_size=10_000)
+        cache.add(Transaction(TX1), confirmed=False)
+        self.assertEqual(TX1, cache.get_raw_tx(TXID1))
+        self.assertIsNone(cache.get_raw_tx(TXID1, require_confirmed=True))
+        self.assertIsNone(cache.get_raw_tx(TXID2))
+        cache.add(Transaction(TX1), confirmed=True)
+        self.assertEqual(TX1, cache.get_raw_tx(TXID1, require_confirmed=True))
+        # a confirmed entry stays confirmed
+        cache.add(Transaction(TX1), confirmed=False)
+        self.assertEqual(TX1, cache.get_raw_tx(TXID1, require_confirmed=True))
+        # partial txs are not cached
+        cache.add(PartialTransaction.from_tx(Transaction(TX2)), confirmed=False)
+        self.assertIsNone(cache.get_raw_tx(TXID2))
+
+    def test_size_bound(self):
+        cache = TxCache(max_size=len(TX1) // 2 + len(TX2) // 2 - 1)
+        cache.add(Transaction(TX1), confirmed=True)
+        cache.add(Transaction(TX2), confirmed=True)
+        self.assertEqual(1, len(cache))
+        self.assertIsNone(cache.get_raw_tx(TXID1))
+        self.assertEqual(TX2, cache.get_raw_tx(TXID2))
+
+    def test_confirmed_txs_are_persisted(self):
+        cache = TxCache(max_size=10_000, path=self.path, max_disk_size=10_000)
+        cache.add(Transaction(TX1), confirmed=True)
+        cache.add(Transaction(TX2), confirmed=False)
+        cache.close()
+        cache = TxCache(max_size=10_000, path=self.path, max_disk_size=10_000)
+        self.assertEqual(0, len(cache))
+        self.assertEqual(TX1, cache.get_raw_tx(TXID1, require_confirmed=True))
+        self.assertIsNone(cache.get_raw_tx(TXID2))
+        self.assertEqual(1, len(cache))
+
+    def test_disk_size_bound(self):
+        cache = TxCache(max_size=10_000, path=self.path, max_disk_size=300)
+        cache.add(Transaction(TX1), confirmed=True)
+        cache.add(Transaction(TX2), confirmed=True)
+        cache.close()
+        self.assertLess(os.path.getsize(self.path), 300)
+        cache = TxCache(max_size=10_000, path=self.path, max_disk_size=300)
+        self.assertIsNone(cache.get_raw_tx(TXID1))
+        self.assertEqual(TX2, cache.get_raw_tx(TXID2))
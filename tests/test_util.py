@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from decimal import Decimal
 
@@ -449,4 +450,35 @@ class TestUtil(ElectrumTestCase):
         self.assertEqual("in over 3 years",
                          util.age(from_date=now.timestamp()+103012200, since_date=now))
 
-
+    async def test_adaptive_concurrency_limiter(self):
+        limiter = util.AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=8)
+        self.assertEqual(2, limiter.window())
+        # fast responses: slow start grows the window up to the maximum
+        for _ in range(10):
+            async with limiter.request():
+                pass
+        self.assertEqual(8, limiter.window())
+        # a timeout halves the window
+        with self.assertRaises(asyncio.TimeoutError):
+            async with limiter.request():
+                raise asyncio.TimeoutError()
+        self.assertEqual(4, limiter.window())
+        self.assertEqual(1, limiter.num_timeouts)
+        # then the window grows by one per window's worth of responses
+        for _ in range(5):
+            async with limiter.request():
+                pass
+        self.assertEqual(5, limiter.window())
+        # no more than window() requests are in flight at once
+        max_in_flight = 0
+        async def request():
+            nonlocal max_in_flight
+            async with limiter.request():
+                self.assertLessEqual(limiter.num_in_flight(), limiter.window())
+                max_in_flight = max(max_in_flight, limiter.num_in_flight())
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*[request() for _ in range(20)])
+        self.assertGreaterEqual(max_in_flight, 5)
+        self.assertEqual(0, limiter.num_in_flight())
+        p = limiter.get_latency_percentiles((50, 99))
+        self.assertLessEqual(p[50], p[99])
@@ -7,21 +7,24 @@ from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+import datetime
+from unittest import mock
 
-from electrum.storage import WalletStorage
+from electrum.storage import WalletStorage, StorageEncryptionVersion
 from electrum.wallet_db import FINAL_SEED_VERSION
 from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
                              restore_wallet_from_text, Imported_Wallet, Wallet)
-from electrum.exchange_rate import ExchangeBase, FxThread
+from electrum.exchange_rate import ExchangeBase, FxThread, HistoricalRates
 from electrum.util import TxMinedInfo, InvalidPassword
 from electrum.bitcoin import COIN
 from electrum.wallet_db import WalletDB, JsonDB
+from electrum.json_db import StoredDict
 from electrum.simple_config import SimpleConfig
 from electrum import util
 from electrum.daemon import Daemon
 from electrum.invoices import PR_UNPAID, PR_PAID, PR_UNCONFIRMED
 from electrum.transaction import tx_from_any
-from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED
+from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED, HistoryIndex
 
 from . import ElectrumTestCase
 
@@ -88,6 +91,250 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+    def test_encrypted_storage_appends_journal_records(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password("secret", StorageEncryptionVersion.USER_PASSWORD)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.put("x", os.urandom(1000).hex())  # so that appends do not trigger consolidation
+        db.write()
+        size_after_base = os.path.getsize(self.wallet_path)
+
+        storage = WalletStorage(self.wallet_path)
+        storage.decrypt("secret")
+        db = JsonDB(storage.read(), storage=storage)
+        # updates are appended as encrypted journal records
+        db.put("c", "d")
+        db.write()
+        db.put("a", "e")
+        db.write()
+        with open(self.wallet_path, "r") as f:
+            lines = f.read().split('\n')
+        self.assertEqual(3, len(lines))
+        self.assertNotIn('"c"', ''.join(lines))
+        self.assertGreater(os.path.getsize(self.wallet_path), size_after_base)
+
+        storage = WalletStorage(self.wallet_path)
+        self.assertTrue(storage.is_encrypted_with_user_pw())
+        with self.assertRaises(InvalidPassword):
+            storage.decrypt("wrong")
+        storage.decrypt("secret")
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("e", db.get("a"))
+        self.assertEqual("d", db.get("c"))
+
+    def test_encrypted_storage_ignores_torn_journal_record(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password("secret", StorageEncryptionVersion.USER_PASSWORD)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        storage.decrypt("secret")
+        db = JsonDB(storage.read(), storage=storage)
+        db.put("c", "d")
+        db.write()
+        # simulate a crash in the middle of appending a record
+        with open(self.wallet_path, "a") as f:
+            f.write('\nQklFMQ')
+
+        storage = WalletStorage(self.wallet_path)
+        storage.decrypt("secret")
+        self.assertTrue(storage.needs_consolidation())
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("b", db.get("a"))
+        self.assertEqual("d", db.get("c"))
+
+    def test_encrypted_storage_password_change_forces_consolidation(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password("secret", StorageEncryptionVersion.USER_PASSWORD)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        storage.decrypt("secret")
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertFalse(storage.needs_consolidation())
+        storage.set_password("other", StorageEncryptionVersion.USER_PASSWORD)
+        self.assertTrue(storage.needs_consolidation())
+        db.put("c", "d")
+        db.write()
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(1, len(f.read().split('\n')))
+
+        storage = WalletStorage(self.wallet_path)
+        storage.decrypt("other")
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("d", db.get("c"))
+
+    def test_patches_are_coalesced_by_path(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("a", {"x": 1})
+        db.put("l", [1])
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        d = db.get_dict("a")
+        for i in range(2, 6):
+            d["x"] = i  # replace, last one wins
+        d["y"] = 1  # add followed by remove cancels out
+        d.pop("y")
+        d["z"] = {"u": 1}  # add, then patch below it
+        d["z"]["u"] = 2
+        d["z"]["v"] = 3
+        db.get("l").append(2)  # list patches are kept as they are
+        db.get("l").append(3)
+        db.get("l").remove(2)
+        self.assertEqual(7, len([x for x in db.pending_changes if x is not None]))
+        self.assertEqual(5, db.num_patches_dropped)
+        db.write()
+        self.assertEqual(7, db.num_patches_written)
+
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual({"x": 5, "z": {"u": 2, "v": 3}}, db.get("a"))
+        self.assertEqual([1, 3], db.get("l"))
+
+    def test_coalesced_patches_replace_removed_key(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("a", {"x": {"y": 1}, "w": 0})
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        d = db.get_dict("a")
+        d["x"]["y"] = 2
+        d.pop("x")
+        d["x"] = {"z": 1}
+        del d["w"]
+        d["w"] = 5
+        self.assertEqual(2, len([x for x in db.pending_changes if x is not None]))
+        db.write()
+
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual({"x": {"z": 1}, "w": 5}, db.get("a"))
+
+    def test_write_later_coalesces_writes(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        size_before = os.path.getsize(self.wallet_path)
+        for i in range(10):
+            db.put("a", str(i))
+            db.write_later(60)
+        self.assertEqual(size_before, os.path.getsize(self.wallet_path))
+        self.assertEqual(1, len([x for x in db.pending_changes if x is not None]))
+        timer = db._write_timer
+        db.flush()
+        self.assertFalse(timer.is_alive())
+        self.assertIsNone(db._write_timer)
+        self.assertEqual([], db.pending_changes)
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("9", db.get("a"))
+
+    def test_write_later_writes_after_delay(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.write_later(0.01)
+        db._write_timer.join()
+        self.assertFalse(db.modified())
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("b", db.get("a"))
+
+    def test_write_later_error_is_raised(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("a", "b")
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        db.put("a", "c")
+        with mock.patch.object(storage, 'append', side_effect=OSError("disk full")):
+            db.write_later(0.01)
+            db._write_timer.join()
+        # the next save reports it, the changes are still pending
+        with self.assertRaises(OSError):
+            db.write_later(0.01)
+        self.assertIsNone(db._write_timer)
+        self.assertTrue(db.modified())
+        # a failing flush raises
+        with mock.patch.object(storage, 'append', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                db.flush()
+        db.flush()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual("c", db.get("a"))
+
+    def test_items_are_converted_on_first_access(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("contacts", {"alice": ["address", "Alice"]})
+        db.put("channels", {"c1": {"x": {"y": [1, 2]}, "z": 3}})
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        channels = db.get("channels")
+        self.assertEqual({"c1"}, channels._raw_keys)
+        self.assertIsInstance(dict.__getitem__(channels, "c1"), dict)
+        self.assertNotIsInstance(dict.__getitem__(channels, "c1"), StoredDict)
+        # dumping does not convert items
+        self.assertEqual({"c1": {"x": {"y": [1, 2]}, "z": 3}}, json.loads(db.dump())["channels"])
+        self.assertEqual({"c1"}, channels._raw_keys)
+        # registered constructors are applied on access
+        self.assertEqual(("address", "Alice"), db.get("contacts")["alice"])
+        self.assertEqual([("c1", StoredDict)], [(k, type(v)) for k, v in channels.items()])
+        self.assertEqual(set(), channels._raw_keys)
+        # converted items are patched as usual
+        channels["c1"]["x"]["y"].append(3)
+        channels["c1"]["z"] = 4
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual({"x": {"y": [1, 2, 3]}, "z": 4}, dict(db.get("channels")["c1"]))
+
+    def test_raw_items_in_dict_methods(self):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put("contacts", {"alice": ["address", "Alice"], "bob": ["address", "Bob"]})
+        db.put("channels", {"c1": {"z": 3}, "c2": {"z": 4}})
+        db.write()
+
+        def load():
+            storage = WalletStorage(self.wallet_path)
+            return JsonDB(storage.read(), storage=storage)
+        # equality compares converted items
+        db, db2 = load(), load()
+        self.assertEqual({"alice": ("address", "Alice"), "bob": ("address", "Bob")}, db.get("contacts"))
+        self.assertEqual(db2.get("contacts"), db.get("contacts"))
+        self.assertFalse(db.get("channels") != {"c1": {"z": 3}, "c2": {"z": 4}})
+        # popitem converts the item, and is patched
+        db = load()
+        self.assertEqual(("bob", ("address", "Bob")), db.get("contacts").popitem())
+        # update converts the items, and is patched
+        channels = db.get("channels")
+        channels.update({"c1": {"z": 5}}, c3={"z": 6})
+        self.assertEqual({"c2"}, channels._raw_keys)
+        self.assertIsInstance(channels["c3"], StoredDict)
+        channels |= {"c2": {"z": 7}}
+        db.write()
+        db = load()
+        self.assertEqual({"alice": ("address", "Alice")}, db.get("contacts"))
+        self.assertEqual({"c1": {"z": 5}, "c2": {"z": 7}, "c3": {"z": 6}}, db.get("channels"))
+        # cleared items are not converted anymore
+        channels = db.get("channels")
+        channels.clear()
+        self.assertIsNone(channels.get("c1"))
+        self.assertEqual({}, channels)
+
     async def test_storage_imported_add_privkeys_persistence_test(self):
         text = ' '.join([
             'p2wpkh:L4jkdiXszG26SUYvwwJhzGwg37H2nLhrbip7u6crmgNeJysv5FHL',
@@ -156,6 +403,7 @@ class FakeFxThread:
 
     remove_thousands_separator = staticmethod(FxThread.remove_thousands_separator)
     timestamp_rate = FxThread.timestamp_rate
+    rates_for_timestamps = FxThread.rates_for_timestamps
     ccy_amount_str = FxThread.ccy_amount_str
     history_rate = FxThread.history_rate
 
@@ -213,6 +461,86 @@ class TestFiat(ElectrumTestCase):
         self.assertNotIn(ccy, self.fiat_value)
 
 
+class TestHistoricalRates(ElectrumTestCase):
+
+    def test_lookups(self):
+        h = HistoricalRates.from_dict({'2020-01-02': '7000.5', '2020-01-01': 6900, '2020-01-03': 'garbage', 'x': '1'})
+        self.assertEqual(3, len(h))
+        day = datetime.date(2020, 1, 1).toordinal()
+        self.assertEqual(Decimal('6900.0'), h.rate_for_day(day))
+        self.assertEqual(Decimal('7000.5'), h.rate_for_day(day + 1))
+        self.assertTrue(h.rate_for_day(day + 2).is_nan())
+        self.assertTrue(h.rate_for_day(day - 1).is_nan())
+        rates = h.rates_for_days([day + 1, day - 1, day + 1])
+        self.assertEqual([Decimal('7000.5'), Decimal('7000.5')], [rates[0], rates[2]])
+        self.assertTrue(rates[1].is_nan())
+        h = h.merge(HistoricalRates.from_dict({'2020-01-03': '7100', '2020-01-01': '6901'}))
+        self.assertEqual([Decimal('6901.0'), Decimal('7000.5'), Decimal('7100.0')], h.rates_for_days([day, day + 1, day + 2]))
+
+    def test_cache_file(self):
+        cache_dir = self.electrum_path
+        h = HistoricalRates.from_dict({'2020-01-02': '7000.5', '2020-01-01': '6900.25'})
+        ExchangeBase._write_historical_rates_to_file(exchange_name='Test', ccy='EUR', cache_dir=cache_dir, history=h)
+        h2 = ExchangeBase._read_historical_rates_from_file(exchange_name='Test', ccy='EUR', cache_dir=cache_dir)
+        self.assertEqual(list(h.days), list(h2.days))
+        self.assertEqual(list(h.rates), list(h2.rates))
+        # json cache of older versions
+        with open(os.path.join(cache_dir, 'Test_USD'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'2020-01-01': '7500.1'}))
+        h3 = ExchangeBase._read_historical_rates_from_file(exchange_name='Test', ccy='USD', cache_dir=cache_dir)
+        self.assertEqual(Decimal('7500.1'), h3.rate_for_day(datetime.date(2020, 1, 1).toordinal()))
+        self.assertIsNone(ExchangeBase._read_historical_rates_from_file(exchange_name='Test', ccy='JPY', cache_dir=cache_dir))
+
+    def test_rates_for_timestamps(self):
+        exchange = FakeExchange(Decimal('1000.001'))
+        exchange._history['TEST'] = HistoricalRates.from_dict({'2020-01-01': '6900.25'})
+        fx = FakeFxThread(exchange)
+        timestamps = [int(datetime.datetime(2020, 1, 1, 12).timestamp()), None, int(time.time()),
+                      int(datetime.datetime(2020, 1, 2, 12).timestamp())]
+        rates = fx.rates_for_timestamps(timestamps)
+        self.assertEqual([Decimal('6900.25'), Decimal('1000.001')], [rates[0], rates[2]])
+        self.assertTrue(rates[1].is_nan() and rates[3].is_nan())
+        self.assertEqual([rates[0], rates[2]], [fx.timestamp_rate(timestamps[0]), fx.timestamp_rate(timestamps[2])])
+
+
+class TestHistoryIndex(ElectrumTestCase):
+
+    def test_running_values(self):
+        history_index = HistoryIndex()
+        history_index.CHECKPOINT_INTERVAL = 2
+        for i in range(7):
+            history_index.add(f'tx{i}', (100 + i, 0), 10 ** i, 1000 + i)
+        self.assertEqual((1111, 1003), history_index.get_running_values(4))
+        self.assertEqual([('tx4', 10000), ('tx5', 100000)], history_index.get_entries(4, 6))
+        self.assertEqual(5, history_index.position_after('tx4'))
+        # tx2 is mined later: checkpoints after its old position are updated
+        history_index.add('tx2', (105, 1), 100, 1010)
+        self.assertEqual(['tx0', 'tx1', 'tx3', 'tx4', 'tx5', 'tx2', 'tx6'],
+                         [txid for txid, delta in history_index.get_entries(0, 7)])
+        self.assertEqual((11011, 1004), history_index.get_running_values(4))
+        self.assertEqual((111111, 1010), history_index.get_running_values(6))
+        history_index.remove('tx0')
+        self.assertEqual(6, len(history_index))
+        self.assertEqual((111110, 1010), history_index.get_running_values(5))
+        self.assertNotIn('tx0', history_index)
+
+    def test_from_entries(self):
+        HistoryIndex.CHECKPOINT_INTERVAL, old_interval = 2, HistoryIndex.CHECKPOINT_INTERVAL
+        try:
+            entries = [(f'tx{i}', (100 + i % 3, i), 10 ** i, 1000 + i) for i in reversed(range(7))]
+            history_index = HistoryIndex.from_entries(entries)
+            history_index2 = HistoryIndex()
+            for entry in entries:
+                history_index2.add(*entry)
+        finally:
+            HistoryIndex.CHECKPOINT_INTERVAL = old_interval
+        self.assertEqual(history_index2.get_entries(0, 7), history_index.get_entries(0, 7))
+        self.assertEqual(history_index2._key_of_txid, history_index._key_of_txid)
+        self.assertEqual([(0, 0), (1001, 1003), (1001011, 1006), (1011111, 1006)], history_index._checkpoints)
+        for pos in range(8):
+            self.assertEqual(history_index2.get_running_values(pos), history_index.get_running_values(pos))
+
+
 class TestCreateRestoreWallet(WalletTestCase):
 
     async def test_create_new_wallet(self):
@@ -287,6 +615,48 @@ class TestCreateRestoreWallet(WalletTestCase):
         self.assertEqual(text, wallet.keystore.get_master_private_key(password=None))
         self.assertEqual('bc1q2ccr34wzep58d4239tl3x3734ttle92a8srmuw', wallet.get_receiving_addresses()[0])
 
+    async def test_restore_wallet_from_text_lookahead(self):
+        text = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+        d = restore_wallet_from_text(text, path=None, gap_limit=2, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        self.assertTrue(wallet.is_restoring())
+        # addresses are derived two gap limits ahead
+        self.assertEqual(4, len(wallet.get_receiving_addresses()))
+        self.assertEqual(20, len(wallet.get_change_addresses()))
+        # unconfirmed history is enough to extend the window
+        addr = wallet.get_receiving_addresses()[2]
+        wallet.db.set_addr_history(addr, [('00' * 32, TX_HEIGHT_UNCONFIRMED)])
+        self.assertEqual(3, wallet.synchronize())
+        self.assertEqual(7, len(wallet.get_receiving_addresses()))
+        self.assertEqual(0, wallet.synchronize())
+        # surplus addresses are trimmed back to the gap limit
+        wallet.finish_restore()
+        self.assertFalse(wallet.is_restoring())
+        self.assertEqual(5, len(wallet.get_receiving_addresses()))
+        self.assertEqual(10, len(wallet.get_change_addresses()))
+        self.assertFalse(wallet.adb.is_mine(wallet.derive_address(0, 5)))
+        self.assertEqual(0, wallet.synchronize())
+
+    async def test_restore_wallet_from_text_lookahead_reload(self):
+        text = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+        d = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=2, config=self.config)
+        await d['wallet'].stop()
+        # reopen, so that changes are appended to the file as patches
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertTrue(wallet.is_restoring())
+        wallet.finish_restore()
+        self.assertEqual(2, len(wallet.get_receiving_addresses()))
+        # addresses derived after the trim take the place of the trimmed ones
+        wallet.create_new_address(False)
+        wallet.create_new_address(False)
+        receiving, change = wallet.get_receiving_addresses(), wallet.get_change_addresses()
+        self.assertEqual([wallet.derive_address(0, i) for i in range(4)], receiving)
+        self.assertFalse(wallet.storage.needs_consolidation())
+        await wallet.stop()
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertEqual(receiving, wallet.get_receiving_addresses())
+        self.assertEqual(change, wallet.get_change_addresses())
+
     async def test_restore_wallet_from_text_addresses(self):
         text = 'bc1q2ccr34wzep58d4239tl3x3734ttle92a8srmuw bc1qnp78h78vp92pwdwq5xvh8eprlga5q8gu66960c'
         d = restore_wallet_from_text(text, path=self.wallet_path, config=self.config)
@@ -0,0 +1,133 @@
+import os
+
+from electrum.storage import WalletStorage
+from electrum.wallet import restore_wallet_from_text, Standard_Wallet
+from electrum.wallet_db import WalletDB
+from electrum.wallet_db_sqlite import (SqliteWalletDB, convert_wallet_to_sqlite, convert_wallet_to_json,
+                                       get_sqlite_path, SQLITE_HISTORY_KEY, open_wallet_db)
+from electrum.commands import Commands
+from electrum.simple_config import SimpleConfig
+from electrum.daemon import Daemon
+from electrum.transaction import tx_from_any
+from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED
+from electrum.util import TxMinedInfo, UserFacingException, WalletFileException
+from electrum.raw_tx_store import RawTxStore
+
+from . import ElectrumTestCase
+
+
+SEED = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+# pays 10000 sat to 1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf
+TX = "02000000000101a97a9ae7fb1a9220fdd170a974987ac24631dcff89b60fa4907c78c3639994db0000000000fdffffff0210270000000000001976a914ea7804a2c266063572cc009a63dc25dcc0e9d9b588ac20491e0000000000160014b8e4fdc91593b67de2bf214694ef47e38dc2ee8e02473044022005326882904906cfa9c1de75333ace1019596f2ab25d21118220d037dfc0e48b02207d0b3f075cfe5e1e0247ff3cdd7155dc05e7459daf1bfa0ea02e9112b9151ec90121026cc6a74c2b0e38661d341ffae48fe7dde5196ca4afe95d28b496673fa4cf646700000000"
+
+
+class TestSqliteWalletDB(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.wallet_path = os.path.join(self.electrum_path, "somewallet")
+
+    async def _create_wallet_with_history(self):
+        d = restore_wallet_from_text(SEED, path=self.wallet_path, gap_limit=2, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        tx = tx_from_any(TX)
+        wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        wallet.adb.add_verified_tx(tx.txid(), TxMinedInfo(height=100, conf=1, timestamp=1000, txpos=1, header_hash='00'*32))
+        await wallet.stop()
+        return tx.txid()
+
+    async def test_convert_roundtrip(self):
+        txid = await self._create_wallet_with_history()
+        convert_wallet_to_sqlite(WalletStorage(self.wallet_path))
+        self.assertTrue(os.path.exists(get_sqlite_path(self.wallet_path)))
+        # history is no longer in the json file
+        json_db = WalletDB(WalletStorage(self.wallet_path).read())
+        self.assertTrue(json_db.get(SQLITE_HISTORY_KEY))
+        self.assertEqual({}, json_db.get('transactions', {}))
+
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertIsInstance(wallet.db, SqliteWalletDB)
+        self.assertEqual(txid, wallet.db.get_transaction(txid).txid())
+        self.assertEqual((10000, 0, 0), wallet.get_balance())
+        self.assertEqual(100, wallet.db.get_verified_tx(txid).height)
+        self.assertEqual(
+            {0: (10000, False)},
+            wallet.db.get_txo_addr(txid, '1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf'))
+        wallet.db.set_addr_history('1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf', [[txid, 100]])
+        self.assertEqual([[txid, 100]], wallet.db.get_addr_history('1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf'))
+        wallet.adb.remove_transaction(txid)
+        self.assertEqual((0, 0, 0), wallet.get_balance())
+        await wallet.stop()
+
+        # changes were committed
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertIsNone(wallet.db.get_transaction(txid))
+        wallet.adb.receive_tx_callback(tx_from_any(TX), TX_HEIGHT_UNCONFIRMED)
+        await wallet.stop()
+
+        convert_wallet_to_json(WalletStorage(self.wallet_path))
+        self.assertFalse(os.path.exists(get_sqlite_path(self.wallet_path)))
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertNotIsInstance(wallet.db, SqliteWalletDB)
+        self.assertIsNone(wallet.db.get(SQLITE_HISTORY_KEY))
+        self.assertEqual(txid, wallet.db.get_transaction(txid).txid())
+        self.assertEqual((10000, 0, 0), wallet.get_balance())
+        await wallet.stop()
+
+    async def test_dump_includes_history(self):
+        txid = await self._create_wallet_with_history()
+        convert_wallet_to_sqlite(WalletStorage(self.wallet_path))
+        storage = WalletStorage(self.wallet_path)
+        db = SqliteWalletDB(storage.read(), storage=storage)
+        json_db = WalletDB(db.dump())
+        json_db.load_addresses('standard')
+        self.assertEqual(txid, json_db.get_transaction(txid).txid())
+        self.assertEqual(db.get_history(), json_db.get_history())
+        self.assertEqual(db.get_verified_tx(txid), json_db.get_verified_tx(txid))
+        self.assertEqual(db.list_spent_outpoints(), json_db.list_spent_outpoints())
+
+    async def test_convert_wallet_with_raw_tx_store(self):
+        self.config.WALLET_USE_RAW_TX_STORE = True
+        txid = await self._create_wallet_with_history()
+        self.assertTrue(RawTxStore.exists_for(self.wallet_path))
+        convert_wallet_to_sqlite(WalletStorage(self.wallet_path))
+        self.assertFalse(RawTxStore.exists_for(self.wallet_path))
+        self.config.WALLET_USE_RAW_TX_STORE = False
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        self.assertEqual(txid, wallet.db.get_transaction(txid).txid())
+        self.assertEqual((10000, 0, 0), wallet.get_balance())
+        await wallet.stop()
+
+    async def test_convert_commands(self):
+        txid = await self._create_wallet_with_history()
+        cmds = Commands(config=self.config)
+        self.assertTrue(await cmds.convert_wallet_to_sqlite(wallet_path=self.wallet_path))
+        storage = WalletStorage(self.wallet_path)
+        self.assertIsInstance(open_wallet_db(storage), SqliteWalletDB)
+        with self.assertRaises(UserFacingException):
+            await cmds.convert_wallet_to_sqlite(wallet_path=self.wallet_path)
+        # the history is in the missing sqlite file
+        os.rename(get_sqlite_path(self.wallet_path), self.wallet_path + '.bak')
+        with self.assertRaises(WalletFileException):
+            open_wallet_db(storage)
+        os.rename(self.wallet_path + '.bak', get_sqlite_path(self.wallet_path))
+        self.assertTrue(await cmds.convert_wallet_to_json(wallet_path=self.wallet_path))
+        db = open_wallet_db(WalletStorage(self.wallet_path))
+        self.assertNotIsInstance(db, SqliteWalletDB)
+        self.assertEqual(txid, db.get_transaction(txid).txid())
+        with self.assertRaises(UserFacingException):
+            await cmds.convert_wallet_to_json(wallet_path=self.wallet_path)
+
+    async def test_storage_encryption_refused(self):
+        await self._create_wallet_with_history()
+        convert_wallet_to_sqlite(WalletStorage(self.wallet_path))
+        wallet = Daemon._load_wallet(self.wallet_path, password=None, config=self.config)
+        with self.assertRaises(UserFacingException):
+            wallet.update_password(None, "1234", encrypt_storage=True)
+        self.assertFalse(wallet.has_password())
+        # keystore encryption only is fine
+        wallet.update_password(None, "1234", encrypt_storage=False)
+        self.assertTrue(wallet.has_keystore_encryption())
+        self.assertFalse(wallet.storage.is_encrypted())
+        await wallet.stop()
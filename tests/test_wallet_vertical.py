@@ -4182,6 +4182,109 @@ class TestWalletHistory_DoubleSpend(ElectrumTestCase):
         w.adb.add_transaction(txC)
         self.assertEqual(999890, sum(w.get_balance()))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_utxo_index_follows_add_and_remove(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        txC = Transaction(self.transactions["2c9aa33d9c8ec649f9bfb84af027a5414b760be5231fe9eca4a95b9eb3f8a017"])
+        # add the spending tx first: its input is learned to be ours when txA is added
+        w.adb.add_transaction(txB)
+        w.adb.add_transaction(txA)
+        self.assertEqual({f"{txB.txid()}:1"}, {utxo.prevout.to_str() for utxo in w.get_utxos()})
+        w.adb._check_utxo_index(w.get_addresses())
+        # removing txB makes the coin it spent unspent again
+        w.adb.remove_transaction(txB.txid())
+        self.assertEqual({f"{txA.txid()}:1"}, {utxo.prevout.to_str() for utxo in w.get_utxos()})
+        w.adb.add_transaction(txC)
+        self.assertEqual({f"{txC.txid()}:0"}, {utxo.prevout.to_str() for utxo in w.get_utxos()})
+        w.adb._check_utxo_index(w.get_addresses())
+        # removing the parent also removes its children
+        w.adb.remove_transaction(txA.txid())
+        self.assertEqual([], w.get_utxos())
+        self.assertEqual({}, w.adb._utxos)
+        w.adb._check_utxo_index(w.get_addresses())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_balance_follows_tx_mined_status(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.receive_tx_callback(txA, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((0, 1000000, 0), w.get_balance())
+        # txA gets mined
+        w.adb.add_unverified_or_unconfirmed_tx(txA.txid(), 1325000)
+        self.assertEqual((1000000, 0, 0), w.get_balance())
+        w.adb.add_verified_tx(txA.txid(), TxMinedInfo(height=1325000, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        self.assertEqual((1000000, 0, 0), w.get_balance())
+        # the change of txB counts as confirmed, as it spends a confirmed coin
+        w.adb.receive_tx_callback(txB, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((899800, 0, 0), w.get_balance())
+        # reorg: txA is back in the mempool
+        w.adb.add_unverified_or_unconfirmed_tx(txA.txid(), TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((0, 899800, 0), w.get_balance())
+        self.assertEqual(w.adb._get_balance_from_coins(set(w.get_addresses()), set()), w.get_balance())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_history_pages(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.receive_tx_callback(txB, TX_HEIGHT_UNCONFIRMED)
+        w.adb.receive_tx_callback(txA, 1325000)
+        history = w.adb.get_history(w.get_addresses())
+        self.assertEqual([txA.txid(), txB.txid()], [item.txid for item in history])
+        self.assertEqual([1000000, 899800], [item.balance for item in history])
+        # the deltas are saved in the db: the index is built again without them
+        self.assertEqual({txA.txid(): 1000000, txB.txid(): -100200}, w.db.get_history_deltas())
+        w.adb._history_index = None
+        with mock.patch.object(w.adb, 'get_tx_delta', side_effect=Exception("delta recomputed")):
+            self.assertEqual(history, w.adb.get_history(w.get_addresses()))
+        # wrong saved deltas are recomputed
+        w.db.set_history_delta(txB.txid(), 0)
+        w.adb._history_index = None
+        self.assertEqual(history, w.adb.get_history(w.get_addresses()))
+        self.assertEqual(-100200, w.db.get_history_deltas()[txB.txid()])
+        page1, _ = w.adb.get_history_page(limit=1)
+        page2, max_timestamp = w.adb.get_history_page(after=page1[-1].txid, limit=1)
+        self.assertEqual(history, page1 + page2)
+        self.assertEqual([], w.adb.get_history_page(after=page2[-1].txid, limit=1)[0])
+        pages = list(w.adb.iter_history_pages(page_size=1))
+        self.assertEqual([(page1, 0), (page2, max_timestamp)], pages)
+        def txids(**kwargs):
+            return [item['txid'] for item in w.get_onchain_history(**kwargs)]
+        self.assertEqual([txA.txid()], txids(from_height=1325000, to_height=1325001))
+        self.assertEqual([txB.txid()], txids(from_height=1325001))
+        self.assertEqual([], txids(to_height=1325000))
+        self.assertEqual([txA.txid()], txids(limit=1))
+        self.assertEqual([txB.txid()], txids(after=txA.txid(), limit=5))
+        unknown_txid = "00" * 32
+        with self.assertRaisesRegex(UserFacingException, "unknown txid"):
+            txids(after=unknown_txid, limit=5)
+        with self.assertRaisesRegex(UserFacingException, "unknown txid"):
+            txids(after=unknown_txid)
+        with self.assertRaisesRegex(UserFacingException, "unknown txid"):
+            w.adb.get_history_page(after=unknown_txid, limit=1)
+        self.assertEqual(w.get_detailed_history(from_height=1325001)['transactions'],
+                         list(w.iter_detailed_history(from_height=1325001)))
+        # the index follows mined status changes
+        w.adb.add_unverified_or_unconfirmed_tx(txB.txid(), 1324000)
+        history = w.adb.get_history(w.get_addresses())
+        self.assertEqual([txB.txid(), txA.txid()], [item.txid for item in history])
+        self.assertEqual([-1000000 + 899800, 899800], [item.balance for item in history])
+        w.adb.remove_transaction(txA.txid())
+        self.assertEqual([], list(w.get_onchain_history(limit=10)))
+        self.assertEqual({}, w.db.get_history_deltas())
+
 
 class TestWalletHistory_HelperFns(ElectrumTestCase):
     TESTNET = True
@@ -4282,6 +4385,7 @@ class TestImportedWallet(ElectrumTestCase):
         w.adb.add_transaction(Transaction(self.transactions["314385a9f24457098de9fe5cb3893cc408b9f66085268457b82050c988c97908"]))
         self.assertEqual(3, len(w.db.transactions))
         self.assertEqual(0, sum(w.get_balance()))
+        self.assertEqual([843361, 999162, -1842523], [item.delta for item in w.adb.get_history(w.get_addresses())])
 
         w.delete_address("tb1q7648a2pm2se425lvun0g3vlf4ahmflcthegz63")
         self.assertEqual(2, len(w.db.transactions))
@@ -4289,6 +4393,13 @@ class TestImportedWallet(ElectrumTestCase):
             {"54de13f7ee4853dc1a281c0e7132efb95330f7ceebc1dbce76fdf34c28028f14", "314385a9f24457098de9fe5cb3893cc408b9f66085268457b82050c988c97908"},
             set(w.db.transactions))
         self.assertEqual(0, sum(w.get_balance()))
+        # the shared tx only counts the remaining address, in the index and in the saved deltas
+        history = [(item.txid, item.delta) for item in w.adb.get_history(w.get_addresses())]
+        self.assertEqual([("314385a9f24457098de9fe5cb3893cc408b9f66085268457b82050c988c97908", 999162),
+                          ("54de13f7ee4853dc1a281c0e7132efb95330f7ceebc1dbce76fdf34c28028f14", -999162)], history)
+        self.assertEqual(history, [(item['txid'], item['bc_value'].value) for item in w.get_onchain_history()])
+        w.adb._history_index = None
+        self.assertEqual(history, [(item.txid, item.delta) for item in w.adb.get_history(w.get_addresses())])
 
         with self.assertRaises(UserFacingException) as ctx:
             w.delete_address("tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy")